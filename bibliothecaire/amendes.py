@@ -0,0 +1,159 @@
+# Amendes de retard (« manage.py compute_fines », chaque nuit) : un emprunt rendu ou en
+# cours au-delà de sa date de retour prévue et du délai de grâce de son type de média reçoit
+# une Amende de tarif_jour centimes par jour de retard après la grâce, dans la limite du
+# plafond. Les montants se calculent en SQL (INSERT ... SELECT ... ON CONFLICT), par tranches
+# d’ids : sous SQLite et PostgreSQL, aucun emprunt ne passe par Python.
+#  - emprunts en cours en retard : amende provisoire, recalculée à chaque passage ;
+#  - emprunts rendus en retard : amende définitive, écrite une fois.
+# Relancer le calcul pour la même date ne change rien.
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import BooleanField, Case, DateField, F, Func, IntegerField, Max, Min, Q, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .chargement import inserer_lignes
+from .models import Amende, Emprunt, EmpruntHistorique, MODELES_MEDIA
+
+# Tarifs par défaut, par type de média (remplacés par settings.TARIFS_RETARD s’il existe) :
+# centimes par jour de retard, jours de retard sans amende, montant maximal en centimes
+# (None : sans plafond). Un type absent n’est pas soumis aux amendes.
+TARIFS_RETARD = {
+    'CD': {'tarif_jour': 20, 'grace': 2, 'plafond': 500},
+    'DVD': {'tarif_jour': 50, 'grace': 1, 'plafond': 1000},
+    'LIVRE': {'tarif_jour': 10, 'grace': 3, 'plafond': 500},
+}
+
+# Ids d’emprunts parcourus par transaction : chaque tranche ne bloque les écritures que brièvement
+TAILLE_TRANCHE = 50000
+
+CHAMPS = ('emprunt_id', 'membre', 'type_media', 'jours_de_retard', 'montant', 'definitive', 'calculee_le')
+
+
+# Nombre de jours de la seconde date à la première
+class JoursEntre(Func):
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'  # PostgreSQL : la différence de deux dates est un entier
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+                           arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ',
+                           **extra_context)
+
+
+def tarifs():
+    return getattr(settings, 'TARIFS_RETARD', TARIFS_RETARD)
+
+
+# Calcule les amendes au jour donné (aujourd’hui par défaut) : emprunts en cours en retard,
+# et emprunts rendus en retard depuis le jour « depuis » inclus (par défaut, le jour du
+# dernier calcul ; tout l’historique au premier). Les emprunts qui ont encore une amende
+# provisoire sont toujours recalculés : un retour enregistré avec une date antérieure au
+# dernier calcul rend l’amende définitive, ou la supprime s’il tombe dans la grâce.
+# Renvoie le nombre d’amendes écrites, provisoires et définitives ; apres_tranche(total)
+# est appelée après chaque tranche.
+def calculer(aujourd_hui=None, depuis=None, taille_tranche=TAILLE_TRANCHE, apres_tranche=None):
+    aujourd_hui = aujourd_hui or timezone.now().date()
+    if depuis is None:
+        depuis = Amende.objects.aggregate(dernier=Max('calculee_le'))['dernier']
+    provisoires = Amende.objects.filter(definitive=False).values('emprunt_id')
+
+    en_cours = Emprunt.objects.actifs().filter(Q(date_retour_prevue__lt=aujourd_hui) | Q(pk__in=provisoires))
+    rendus = EmpruntHistorique.objects.rendus().filter(date_retour__lte=aujourd_hui)
+    # Les emprunts rendus avec une amende provisoire sont lus à part, depuis les amendes :
+    # réunis par OR aux retours récents, ils feraient parcourir tout l’historique
+    rendus_depuis = rendus.filter(date_retour__gte=depuis) if depuis else rendus
+    passages = [(en_cours, False, _bornes(en_cours, 'pk')), (rendus_depuis, True, _bornes(rendus_depuis, 'pk')),
+                (rendus.filter(pk__in=provisoires), True, _bornes(provisoires, 'emprunt_id'))]
+
+    totaux = {False: 0, True: 0}
+    for emprunts, definitive, bornes in passages:
+        fin = F('date_retour') if definitive else Value(aujourd_hui, output_field=DateField())
+        amendes = _en_retard(emprunts, fin).annotate(
+            definitive=Value(definitive, output_field=BooleanField()),
+            calculee_le=Value(aujourd_hui, output_field=DateField()),
+        )
+        totaux[definitive] += _ecrire(emprunts, amendes, bornes, taille_tranche, apres_tranche,
+                                      sum(totaux.values()))
+    return totaux[False], totaux[True]
+
+
+# Plus petit et plus grand id d’emprunt d’un queryset, (None, None) s’il est vide. Les bornes
+# sont lues avant tout passage : les amendes provisoires ne sont pas encore réécrites.
+def _bornes(requete, champ):
+    bornes = requete.order_by().aggregate(premier=Min(champ), dernier=Max(champ))
+    return bornes['premier'], bornes['dernier']
+
+
+# Emprunts dont le retard au jour « fin » dépasse la grâce de leur type, annotés du type,
+# des jours de retard et du montant de l’amende. Sans filtre sur content_type : SQLite
+# parcourrait alors son index, et non la tranche d’ids ; la grâce d’un type sans tarif
+# est NULL, ce qui écarte ses emprunts.
+def _en_retard(emprunts, fin):
+    types, graces, montants = [], [], []
+    for type_media, tarif in tarifs().items():
+        content_type_id = ContentType.objects.get_for_model(MODELES_MEDIA[type_media]).id
+        montant = (F('jours_de_retard') - tarif['grace']) * tarif['tarif_jour']
+        if tarif['plafond'] is not None:
+            montant = Least(montant, Value(tarif['plafond']))
+        types.append(When(content_type=content_type_id, then=Value(type_media)))
+        graces.append(When(content_type=content_type_id, then=Value(tarif['grace'])))
+        montants.append(When(content_type=content_type_id, then=montant))
+    if not types:
+        return emprunts.none()
+    return (emprunts.annotate(jours_de_retard=JoursEntre(fin, 'date_retour_prevue'))
+            .filter(jours_de_retard__gt=Case(*graces, output_field=IntegerField()))
+            .annotate(type_media=Case(*types), montant=Case(*montants, output_field=IntegerField())))
+
+
+# Écrit les amendes par tranches d’ids d’emprunts, une transaction chacune : les amendes
+# provisoires des emprunts qui ne sont plus en retard sont supprimées, puis celles des
+# emprunts en retard écrites ou remplacées ; les définitives sont gardées. La suppression
+# épargne les emprunts encore en retard : retenus pour leur amende provisoire, ils le
+# restent jusqu’à l’écriture. Renvoie le nombre d’amendes écrites.
+def _ecrire(emprunts, amendes, bornes, taille_tranche, apres_tranche, deja_ecrites):
+    premier, dernier = bornes
+    if premier is None:
+        return 0
+    total = 0
+    for debut in range(premier, dernier + 1, taille_tranche):
+        tranche = {'pk__gte': debut, 'pk__lt': debut + taille_tranche}
+        en_retard = amendes.filter(**tranche).order_by()
+        with transaction.atomic():
+            Amende.objects.filter(definitive=False, emprunt_id__in=emprunts.filter(**tranche).order_by()
+                                  .exclude(pk__in=en_retard.values('pk')).values('pk')).delete()
+            total += _remplacer(en_retard.values_list('pk', 'membre', *CHAMPS[2:]))
+        if apres_tranche:
+            apres_tranche(deja_ecrites + total)
+    return total
+
+
+# Insère les amendes d’une sélection ; une amende provisoire existante est remplacée, une
+# définitive gardée. Une requête INSERT ... SELECT ... ON CONFLICT DO UPDATE (SQLite,
+# PostgreSQL) ; ailleurs, les lignes de la tranche sont lues avant d’être réécrites.
+def _remplacer(selection):
+    if not connection.features.supports_update_conflicts_with_target:
+        lignes = list(selection)
+        ids = [ligne[0] for ligne in lignes]
+        Amende.objects.filter(definitive=False, emprunt_id__in=ids).delete()
+        definitives = set(Amende.objects.filter(emprunt_id__in=ids).values_list('emprunt_id', flat=True))
+        return inserer_lignes(Amende, CHAMPS, [ligne for ligne in lignes if ligne[0] not in definitives])
+
+    table = connection.ops.quote_name(Amende._meta.db_table)
+    colonnes = [connection.ops.quote_name(Amende._meta.get_field(champ).column) for champ in CHAMPS]
+    # La sélection a toujours un WHERE (tranche d’ids) : SQLite lit alors sans ambiguïté ON CONFLICT
+    sql, params = selection.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(colonnes)}) {sql} '
+            f'ON CONFLICT ({colonnes[0]}) DO UPDATE SET '
+            + ', '.join(f'{colonne} = excluded.{colonne}' for colonne in colonnes[1:])
+            + f' WHERE NOT {table}.{connection.ops.quote_name("definitive")}',
+            params,
+        )
+        return cursor.rowcount
@@ -0,0 +1,45 @@
+# Recherche de membres par prénom, nom ou e-mail, pour les champs « membre » des
+# formulaires d’emprunt et de réservation (vue recherche_membres) : seuls les premiers
+# résultats sont renvoyés, la table des membres n’est jamais parcourue entièrement.
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Membre
+
+# Nombre de membres proposés par défaut
+LIMITE_RECHERCHE_MEMBRES = 20
+
+# Poids bm25 des colonnes de l’index plein texte : prenom, nom, email
+POIDS_RECHERCHE_MEMBRES = '5.0, 10.0, 2.0'
+
+
+# Membres dont chaque terme commence un mot du prénom, du nom ou de l’e-mail (« dup »
+# trouve « Dupont », « jean.d » trouve « jean.dupont@… »), classés par pertinence.
+# S’appuie sur l’index FTS5 sous SQLite (migration 0014).
+def rechercher_membres(texte, limite=LIMITE_RECHERCHE_MEMBRES):
+    termes = re.findall(r'\w+', texte or '')
+    if not termes:
+        return []
+    limite = max(limite, 1)  # LIMIT -1 : aucune limite sous SQLite
+
+    if connection.vendor != 'sqlite':
+        membres = Membre.objects.all()
+        for terme in termes:
+            membres = membres.filter(
+                Q(prenom__istartswith=terme) | Q(nom__istartswith=terme) | Q(email__istartswith=terme))
+        return list(membres.order_by('nom', 'prenom', 'id')[:limite])
+
+    # Chaque terme est cité (pas d’opérateur FTS injecté) et recherché comme préfixe
+    expression = ' '.join(f'"{terme}"*' for terme in termes)
+    return list(Membre.objects.raw(
+        f"""
+        SELECT m.* FROM bibliothecaire_membre_fts
+        JOIN bibliothecaire_membre m ON m.id = bibliothecaire_membre_fts.rowid
+        WHERE bibliothecaire_membre_fts MATCH %s
+        ORDER BY bm25(bibliothecaire_membre_fts, {POIDS_RECHERCHE_MEMBRES}), m.id
+        LIMIT %s
+        """,
+        [expression, limite],
+    ))
@@ -0,0 +1,47 @@
+# Archivage des emprunts rendus (« manage.py archive_loans ») : les emprunts rendus depuis
+# longtemps quittent la table Emprunt pour EmpruntArchive, avec leur id d’origine. Emprunt,
+# lue à chaque emprunt, retour et affichage de la liste, ne garde que les emprunts en cours
+# et les retours récents. Les lectures d’historique (liste des emprunts rendus, exports,
+# statistiques) passent par EmpruntHistorique, vue SQL sur les deux tables.
+from django.db import transaction
+from django.utils import timezone
+
+from .chargement import inserer_selection
+from .models import Emprunt, EmpruntArchive
+
+# Emprunts déplacés par transaction : chaque lot ne bloque les écritures que brièvement
+TAILLE_LOT_ARCHIVE = 5000
+
+# Colonnes copiées d’Emprunt vers EmpruntArchive, id compris
+CHAMPS_ARCHIVE = ('id', 'membre', 'media', 'content_type', 'date_emprunt', 'date_retour', 'date_retour_prevue')
+
+
+# Emprunts rendus avant la date limite, encore dans Emprunt
+def a_archiver(limite):
+    return Emprunt.objects.rendus().filter(date_retour__lt=limite)
+
+
+# Déplace vers l’archive les emprunts rendus il y a plus de « anciennete_jours » jours, par
+# lots de taille_lot, chacun dans sa propre transaction : un arrêt en cours de route laisse
+# chaque emprunt dans l’une ou l’autre table, jamais dans les deux. Les lots sont parcourus
+# dans l’ordre des ids. Renvoie le nombre d’emprunts archivés ; apres_lot(total) est
+# appelée après chaque lot.
+def archiver(anciennete_jours, taille_lot=TAILLE_LOT_ARCHIVE, aujourd_hui=None, apres_lot=None):
+    limite = (aujourd_hui or timezone.now().date()) - timezone.timedelta(days=anciennete_jours)
+    total, dernier_id = 0, 0
+    while True:
+        with transaction.atomic():
+            ids = list(a_archiver(limite).filter(pk__gt=dernier_id).order_by('pk')
+                       .values_list('pk', flat=True)[:taille_lot])
+            if not ids:
+                break
+            # Les emprunts rendus ne changent plus : ceux lus ici sont ceux copiés puis supprimés
+            inserer_selection(EmpruntArchive, CHAMPS_ARCHIVE,
+                              Emprunt.objects.filter(pk__in=ids).order_by().values_list(*CHAMPS_ARCHIVE))
+            Emprunt.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+        dernier_id = ids[-1]
+        if apres_lot:
+            apres_lot(total)
+    return total
+
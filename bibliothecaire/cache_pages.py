@@ -0,0 +1,83 @@
+# Mise en cache des pages du catalogue (liste des médias côté bibliothécaire et côté membre).
+# Les clés sont générationnelles : elles portent la version de disponibilité des types
+# affichés (voir disponibilite.py), incrémentée par les signaux post_save / post_delete
+# de CD, DVD, Livre, JeuDePlateau et Media. Une modification rend donc aussitôt obsolètes
+# les pages de son type (et les pages « tous types »), sans rien supprimer du cache.
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import disponibilite
+from .catalogue import _contexte_catalogue, _filtrer_catalogue, apage_catalogue
+from .models import MODELES_MEDIA
+
+# Durée de vie d’une page ou d’un fragment en cache (secondes). Les versions suffisent à
+# l’invalidation ; cette durée borne l’ancienneté d’une page lue sur une réplique en retard.
+DUREE_CACHE_CATALOGUE = 300
+
+
+# Version des types affichés : celle du type filtré, ou celles des quatre types
+def version_catalogue(type_media=''):
+    types_media = [type_media] if type_media in MODELES_MEDIA else sorted(MODELES_MEDIA)
+    return '-'.join(str(disponibilite.version(t)) for t in types_media)
+
+
+async def aversion_catalogue(type_media=''):
+    types_media = [type_media] if type_media in MODELES_MEDIA else sorted(MODELES_MEDIA)
+    return '-'.join([str(await disponibilite.aversion(t)) for t in types_media])
+
+
+def _empreinte(params):
+    return hashlib.md5(urlencode(sorted(params.lists()), doseq=True).encode()).hexdigest()
+
+
+# Clé de cache d’une page catalogue : nom, version des types affichés et paramètres GET
+def cle_cache_catalogue(nom, params):
+    return f"catalogue:{nom}:{version_catalogue(params.get('type', ''))}:{_empreinte(params)}"
+
+
+# Version de cle_cache_catalogue pour les vues asynchrones (cache lu hors de la boucle
+# d’événements, comme tous les accès au cache de ce module)
+async def acle_cache_catalogue(nom, params):
+    return f"catalogue:{nom}:{await aversion_catalogue(params.get('type', ''))}:{_empreinte(params)}"
+
+
+# Contexte d’une page catalogue dont la liste (médias et pagination) est un fragment
+# rendu une fois par version puis servi depuis le cache, sans requête SQL. Le fragment
+# est commun à tous les visiteurs : il ne doit contenir ni jeton CSRF ni donnée de session.
+async def acontexte_fragment_catalogue(nom, gabarit_fragment, params):
+    cle = await acle_cache_catalogue(nom, params)
+    fragment = await cache.aget(cle)
+    if fragment is None:
+        fragment = render_to_string(gabarit_fragment, await apage_catalogue(params))
+        await cache.aset(cle, fragment, DUREE_CACHE_CATALOGUE)
+
+    _, type_media, tri, q = _filtrer_catalogue(params)
+    contexte = _contexte_catalogue(None, None, type_media, tri, q)
+    contexte['fragment'] = mark_safe(fragment)  # Rendu par le moteur de gabarits, déjà échappé
+    return contexte
+
+
+# Met en cache la page entière d’une vue catalogue asynchrone (GET seulement). Réservé
+# aux pages publiques, identiques pour tous : aucune ne doit porter de formulaire POST.
+def page_catalogue_en_cache(vue):
+    @wraps(vue)
+    async def vue_en_cache(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await vue(request, *args, **kwargs)
+        cle = await acle_cache_catalogue(f'page:{vue.__module__}.{vue.__qualname__}', request.GET)
+        contenu = await cache.aget(cle)
+        if contenu is not None:
+            return HttpResponse(contenu)
+
+        response = await vue(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            await cache.aset(cle, response.content, DUREE_CACHE_CATALOGUE)
+        return response
+
+    return vue_en_cache
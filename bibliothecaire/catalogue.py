@@ -0,0 +1,217 @@
+# Maintenance et lecture du catalogue dénormalisé (CatalogueMedia)
+import asyncio
+import re
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import disponibilite, index_disponibilite
+from .models import CatalogueMedia, MODELES_MEDIA, CHAMPS_CREATEUR
+
+# Nombre de médias affichés par page du catalogue
+TAILLE_PAGE_CATALOGUE = 50
+
+# Tris proposés sur les pages catalogue (l’id départage les ex æquo)
+TRIS_CATALOGUE = {
+    'nom': ('name', 'id'),
+    'createur': ('createur', 'id'),
+}
+
+
+# Nombre maximal de résultats renvoyés par une recherche
+LIMITE_RECHERCHE = 20
+
+# Poids bm25 des colonnes de l’index plein texte : name, createur, type_media
+POIDS_RECHERCHE = '10.0, 5.0, 0.0'
+
+
+# Retrouve le code de type ('CD', 'DVD', ...) d’une instance ou d’un modèle
+def type_media_de(media):
+    for type_media, modele in MODELES_MEDIA.items():
+        if type(media) is modele or media is modele:
+            return type_media
+    return None
+
+
+# Code du type de média d’un emprunt, d’après sa colonne content_type (cache des ContentType)
+def type_media_du_contenu(content_type_id):
+    if content_type_id is None:
+        return None
+    return type_media_de(ContentType.objects.get_for_id(content_type_id).model_class())
+
+
+# Valeurs d’une ligne de catalogue pour un média donné
+def valeurs_catalogue(type_media, media):
+    return {
+        'name': media.name,
+        'createur': getattr(media, CHAMPS_CREATEUR[type_media]) or '',
+        'disponible': media.disponible,
+    }
+
+
+# Crée ou met à jour la ligne de catalogue d’un média
+def synchroniser(type_media, media):
+    CatalogueMedia.objects.update_or_create(
+        type_media=type_media,
+        media_id=media.pk,
+        defaults=valeurs_catalogue(type_media, media),
+    )
+
+
+# Supprime la ligne de catalogue d’un média
+def retirer(type_media, media_id):
+    CatalogueMedia.objects.filter(type_media=type_media, media_id=media_id).delete()
+
+
+# Répercute un changement de disponibilité fait par UPDATE direct (sans signal).
+# type_media None : média connu seulement par son id de Media (CD, DVD ou Livre).
+def changer_disponibilite(type_media, media_id, disponible):
+    lignes = CatalogueMedia.objects.filter(media_id=media_id)
+    if type_media:
+        lignes = lignes.filter(type_media=type_media)
+        disponibilite.invalider(type_media)
+        index_disponibilite.marquer(type_media, [media_id], disponible)
+    else:
+        lignes = lignes.exclude(type_media='JEU')
+        disponibilite.invalider('CD', 'DVD', 'LIVRE')
+        marquer_media_parent(media_id, disponible)
+    lignes.update(disponible=disponible)
+
+
+# Index de disponibilité d’un média connu seulement par son id de Media : son type
+# est lu dans le catalogue
+def marquer_media_parent(media_id, disponible):
+    types_media = CatalogueMedia.objects.filter(media_id=media_id).exclude(type_media='JEU')
+    for type_media in types_media.values_list('type_media', flat=True):
+        index_disponibilite.marquer(type_media, [media_id], disponible)
+
+
+# Reconstruit entièrement le catalogue par lots (insertion en masse)
+def reconstruire(taille_lot=2000):
+    total = 0
+    with transaction.atomic():
+        CatalogueMedia.objects.all().delete()
+        for type_media, modele in MODELES_MEDIA.items():
+            champ_createur = CHAMPS_CREATEUR[type_media]
+            lignes = modele.objects.order_by('pk').values_list('pk', 'name', champ_createur, 'disponible')
+            lot = []
+            for pk, name, createur, disponible in lignes.iterator(chunk_size=taille_lot):
+                lot.append(CatalogueMedia(
+                    type_media=type_media, media_id=pk, name=name,
+                    createur=createur or '', disponible=disponible,
+                ))
+                if len(lot) >= taille_lot:
+                    CatalogueMedia.objects.bulk_create(lot)
+                    total += len(lot)
+                    lot = []
+            CatalogueMedia.objects.bulk_create(lot)
+            total += len(lot)
+    return total
+
+
+# Recherche plein texte sur le nom et le créateur (préfixes acceptés : « beat » trouve
+# « Beatles »), classée par pertinence. S’appuie sur l’index FTS5 sous SQLite.
+def rechercher(texte, type_media='', limite=LIMITE_RECHERCHE):
+    termes = re.findall(r'\w+', texte or '')
+    if not termes:
+        return []
+    if type_media not in MODELES_MEDIA:
+        type_media = ''
+    limite = max(limite, 1)  # LIMIT -1 : aucune limite sous SQLite
+
+    if connection.vendor != 'sqlite':
+        medias = CatalogueMedia.objects.all()
+        for terme in termes:
+            medias = medias.filter(Q(name__icontains=terme) | Q(createur__icontains=terme))
+        if type_media:
+            medias = medias.filter(type_media=type_media)
+        return list(medias.order_by('name', 'id')[:limite])
+
+    # Chaque terme est cité (pas d’opérateur FTS injecté) et recherché comme préfixe
+    expression = '{name createur} : (%s)' % ' '.join(f'"{terme}"*' for terme in termes)
+    if type_media:
+        expression = f'type_media : "{type_media}" AND {expression}'
+    return list(CatalogueMedia.objects.raw(
+        f"""
+        SELECT c.* FROM bibliothecaire_catalogue_fts
+        JOIN bibliothecaire_cataloguemedia c ON c.id = bibliothecaire_catalogue_fts.rowid
+        WHERE bibliothecaire_catalogue_fts MATCH %s
+        ORDER BY bm25(bibliothecaire_catalogue_fts, {POIDS_RECHERCHE}), c.id
+        LIMIT %s
+        """,
+        [expression, limite],
+    ))
+
+
+# Filtres communs aux pages catalogue : (requête triée, type, tri, texte recherché)
+def _filtrer_catalogue(params):
+    medias = CatalogueMedia.objects.all()
+
+    type_media = params.get('type', '')
+    if type_media in MODELES_MEDIA:
+        medias = medias.filter(type_media=type_media)
+    else:
+        type_media = ''
+
+    q = params.get('q', '').strip()
+    tri = params.get('tri', 'nom')
+    if tri not in TRIS_CATALOGUE:
+        tri = 'nom'
+    return medias.order_by(*TRIS_CATALOGUE[tri]), type_media, ('' if q else tri), q
+
+
+def _contexte_catalogue(page, medias, type_media, tri, q):
+    return {
+        'page': page,
+        'medias': medias,
+        'type_media': type_media,
+        'tri': tri,
+        'q': q,
+        'types_media': CatalogueMedia.TYPE_CHOICES,
+    }
+
+
+# Page du catalogue filtrée par type et triée, en une requête (plus le comptage).
+# Avec un texte de recherche « q », renvoie les meilleurs résultats sans pagination.
+def page_catalogue(params):
+    medias, type_media, tri, q = _filtrer_catalogue(params)
+    if q:
+        return _contexte_catalogue(None, rechercher(q, type_media, limite=TAILLE_PAGE_CATALOGUE), type_media, tri, q)
+
+    page = Paginator(medias, TAILLE_PAGE_CATALOGUE).get_page(params.get('page'))
+    return _contexte_catalogue(page, page.object_list, type_media, tri, q)
+
+
+# Version asynchrone de page_catalogue, pour les vues ASGI. Le comptage et la lecture
+# de la page demandée sont lancés ensemble ; si ce numéro de page n’existe pas (hors
+# bornes), la page retenue par le Paginator est relue ensuite.
+async def apage_catalogue(params):
+    medias, type_media, tri, q = _filtrer_catalogue(params)
+    if q:
+        resultats = await sync_to_async(rechercher)(q, type_media, limite=TAILLE_PAGE_CATALOGUE)
+        return _contexte_catalogue(None, resultats, type_media, tri, q)
+
+    try:
+        numero = max(int(params.get('page') or 1), 1)
+    except ValueError:
+        numero = 1
+    debut = (numero - 1) * TAILLE_PAGE_CATALOGUE
+    paginator = Paginator(medias, TAILLE_PAGE_CATALOGUE)
+    paginator.count, lignes = await asyncio.gather(
+        medias.acount(),
+        _alister(medias[debut:debut + TAILLE_PAGE_CATALOGUE]),
+    )
+
+    page = paginator.get_page(params.get('page'))
+    if page.number != numero:
+        lignes = await _alister(page.object_list)
+    page.object_list = lignes  # Le gabarit ne doit plus toucher la base
+    return _contexte_catalogue(page, lignes, type_media, tri, q)
+
+
+async def _alister(medias):
+    return [media async for media in medias.aiterator()]
@@ -0,0 +1,154 @@
+# Insertion en masse de médias (import de catalogue, jeux de données de test).
+# bulk_create refuse les modèles à héritage multi-table (CD, DVD, Livre) : on insère
+# les lignes parentes Media, puis les lignes filles, puis le catalogue, chacune en un
+# seul executemany.
+from itertools import islice
+
+from django.db import connection, transaction
+
+from . import disponibilite, index_disponibilite
+from .models import CatalogueMedia, Emprunt, Media, MODELES_MEDIA, CHAMPS_CREATEUR
+
+# Index plein texte du catalogue et son trigger d’insertion (migration 0006)
+TABLE_FTS = 'bibliothecaire_catalogue_fts'
+TRIGGER_FTS_INSERTION = 'bibliothecaire_catalogue_fts_ai'
+
+
+# Insère des médias d’un même type et leurs lignes de catalogue ; renvoie leurs ids.
+# Chaque ligne est un dict {'name', 'createur', 'disponible'}. Les signaux ne sont pas
+# envoyés : le catalogue et son index plein texte sont remplis ici.
+def creer_medias_en_masse(type_media, lignes, taille_lot=1000):
+    if not lignes:
+        return []
+    modele = MODELES_MEDIA[type_media]
+    champ_createur = CHAMPS_CREATEUR[type_media]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Première écriture de la transaction : sous SQLite, le verrou d’écriture est
+        # pris ici, ce qui rend sûre la réservation des ids qui suit
+        trigger_fts = _suspendre_trigger_fts(cursor)
+
+        if issubclass(modele, Media):
+            ids = _inserer(cursor, Media, ['name', 'disponible'],
+                           [(l['name'], l['disponible']) for l in lignes], taille_lot)
+            cursor.executemany(
+                f'INSERT INTO {_table(modele)} ({_colonnes(modele, modele._meta.pk.name, champ_createur)}) '
+                'VALUES (%s, %s)',
+                [(pk, ligne['createur']) for pk, ligne in zip(ids, lignes)],
+            )
+        else:
+            ids = _inserer(cursor, modele, ['name', champ_createur, 'disponible'],
+                           [(l['name'], l['createur'], l['disponible']) for l in lignes], taille_lot)
+
+        if trigger_fts:
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {_table(CatalogueMedia)}')
+            dernier_id = cursor.fetchone()[0]
+        cursor.executemany(
+            f'INSERT INTO {_table(CatalogueMedia)} '
+            f'({_colonnes(CatalogueMedia, "type_media", "media_id", "name", "createur", "disponible")}) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            [(type_media, pk, l['name'], l['createur'], l['disponible']) for pk, l in zip(ids, lignes)],
+        )
+        if trigger_fts:
+            # Indexation plein texte des nouvelles lignes en une seule requête
+            cursor.execute(
+                f'INSERT INTO {TABLE_FTS}(rowid, name, createur, type_media) '
+                f'SELECT id, name, createur, type_media FROM {_table(CatalogueMedia)} WHERE id > %s',
+                [dernier_id],
+            )
+            cursor.execute(trigger_fts)
+
+    disponibilite.invalider(type_media)
+    for disponible in (True, False):
+        index_disponibilite.marquer(type_media, [pk for pk, l in zip(ids, lignes) if bool(l['disponible']) == disponible],
+                                    disponible)
+    return ids
+
+
+def _table(modele):
+    return connection.ops.quote_name(modele._meta.db_table)
+
+
+def _colonnes(modele, *champs):
+    return ', '.join(connection.ops.quote_name(modele._meta.get_field(champ).column) for champ in champs)
+
+
+# Insère dans la table d’un modèle les lignes d’un queryset, en une seule requête
+# INSERT ... SELECT : les lignes (agrégats des statistiques, emprunts archivés) restent
+# dans la base, sans passer par Python. Les colonnes du SELECT suivent l’ordre de values_list.
+# Renvoie le nombre de lignes insérées.
+def inserer_selection(modele, champs, requete):
+    sql, params = requete.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {_table(modele)} ({_colonnes(modele, *champs)}) {sql}', params)
+        return cursor.rowcount
+
+
+# Insère des lignes dans la table d’un modèle et renvoie leurs ids, dans l’ordre
+def _inserer(cursor, modele, champs, valeurs, taille_lot):
+    if connection.vendor == 'sqlite':
+        # Le verrou d’écriture est détenu : les ids suivant le plus grand id déjà
+        # attribué (sqlite_sequence, AUTOINCREMENT) sont libres, on les fixe nous-mêmes
+        cursor.execute(
+            f'SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = %s), 0), '
+            f'COALESCE((SELECT MAX(id) FROM {_table(modele)}), 0))',
+            [modele._meta.db_table],
+        )
+        premier = cursor.fetchone()[0] + 1
+        ids = list(range(premier, premier + len(valeurs)))
+        cursor.executemany(
+            f'INSERT INTO {_table(modele)} ({_colonnes(modele, "id", *champs)}) '
+            f'VALUES ({", ".join(["%s"] * (len(champs) + 1))})',
+            [(pk, *ligne) for pk, ligne in zip(ids, valeurs)],
+        )
+        return ids
+
+    objets = [modele(**dict(zip(champs, ligne))) for ligne in valeurs]
+    if connection.features.can_return_rows_from_bulk_insert:
+        modele.objects.bulk_create(objets, batch_size=taille_lot)
+    else:
+        for objet in objets:
+            objet.save_base(raw=True)
+    return [objet.pk for objet in objets]
+
+
+# Sous SQLite, le trigger qui alimente l’index FTS5 ligne par ligne est plusieurs fois
+# plus lent qu’un INSERT ... SELECT groupé : on le retire le temps du lot, dans la même
+# transaction (les autres connexions ne le voient jamais absent), et on renvoie le SQL
+# qui le recrée. None si la base n’a pas d’index plein texte.
+def _suspendre_trigger_fts(cursor):
+    if connection.vendor != 'sqlite':
+        return None
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = %s", [TRIGGER_FTS_INSERTION])
+    ligne = cursor.fetchone()
+    if ligne is None:
+        return None
+    cursor.execute(f'DROP TRIGGER {TRIGGER_FTS_INSERTION}')
+    return ligne[0]
+
+
+# Insère des emprunts en masse, sans signaux ni compteurs : les lignes sont des tuples
+# (membre_id, content_type_id, media_id, date_emprunt, date_retour_prevue, date_retour).
+# Contrairement à bulk_create, date_emprunt (auto_now_add) est conservée telle quelle.
+# Les compteurs des membres sont à recalculer ensuite (services.reconcilier_compteurs).
+def creer_emprunts_en_masse(lignes, taille_lot=10000):
+    champs = ('membre', 'content_type', 'media', 'date_emprunt', 'date_retour_prevue', 'date_retour')
+    with transaction.atomic():
+        inserer_lignes(Emprunt, champs, lignes, taille_lot)
+
+
+# Insère des tuples (valeurs des champs, dans l’ordre) dans la table d’un modèle, par
+# executemany de taille_lot lignes ; les lignes peuvent venir d’un générateur.
+# Renvoie le nombre de lignes insérées.
+def inserer_lignes(modele, champs, lignes, taille_lot=10000):
+    requete = (
+        f'INSERT INTO {_table(modele)} ({_colonnes(modele, *champs)}) '
+        f'VALUES ({", ".join(["%s"] * len(champs))})'
+    )
+    total = 0
+    lignes = iter(lignes)
+    with connection.cursor() as cursor:
+        while lot := list(islice(lignes, taille_lot)):
+            cursor.executemany(requete, lot)
+            total += len(lot)
+    return total
@@ -0,0 +1,50 @@
+# Compteurs de version de la disponibilité des médias, par type.
+# Toute modification d’un média (disponible, nom, ajout, suppression) incrémente le
+# compteur de son type : les réponses mises en cache sous l’ancienne version sont
+# alors simplement ignorées, sans avoir à les supprimer une à une.
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import MODELES_MEDIA
+
+
+def cle_version(type_media):
+    return f'disponibilite:version:{type_media}'
+
+
+# Version courante d’un type. Une clé absente (cache vidé ou évincé) est réinitialisée
+# à partir de l’horloge, pour ne jamais retomber sur une version déjà utilisée.
+def version(type_media):
+    cle = cle_version(type_media)
+    valeur = cache.get(cle)
+    if valeur is None:
+        cache.add(cle, time.time_ns() // 1000, timeout=None)
+        valeur = cache.get(cle)
+    return valeur
+
+
+# Version de version(), pour les vues asynchrones : le cache est lu hors de la boucle d’événements
+async def aversion(type_media):
+    cle = cle_version(type_media)
+    valeur = await cache.aget(cle)
+    if valeur is None:
+        await cache.aadd(cle, time.time_ns() // 1000, timeout=None)
+        valeur = await cache.aget(cle)
+    return valeur
+
+
+def _incrementer(types_media):
+    for type_media in types_media:
+        try:
+            cache.incr(cle_version(type_media))
+        except ValueError:
+            version(type_media)  # Clé absente : une nouvelle version est créée
+
+
+# Incrémente la version des types donnés (tous si aucun) une fois la transaction
+# validée, pour qu’aucune lecture ne mette en cache des données non encore visibles
+def invalider(*types_media):
+    types_media = types_media or tuple(MODELES_MEDIA)
+    transaction.on_commit(lambda: _incrementer(types_media))
@@ -0,0 +1,192 @@
+# Exports CSV / JSONL des emprunts, membres et médias, produits en flux : les lignes
+# sont lues par lots (iterator) et envoyées au fur et à mesure, jamais toutes en mémoire.
+# Utilisés par la vue « exporter » (StreamingHttpResponse) et la commande du même nom.
+# Sous ASGI, la vue envoie une version asynchrone du flux (en_flux_async) : Django lirait
+# sinon tout un itérateur synchrone avant d’envoyer le premier octet.
+import csv
+import json
+import zlib
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .catalogue import type_media_du_contenu
+from .models import CatalogueMedia, Emprunt, EmpruntHistorique, Membre, MODELES_MEDIA
+
+# Nombre de lignes lues par requête, et regroupées par morceau envoyé
+TAILLE_LOT_EXPORT = 2000
+
+FORMATS = ('csv', 'jsonl')
+
+
+# Filtre invalide (date mal formée, statut inconnu...)
+class FiltreInvalide(ValueError):
+    pass
+
+
+def _date(valeur, nom):
+    if not valeur:
+        return None
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise FiltreInvalide(f"Date « {nom} » invalide : {valeur} (attendu AAAA-MM-JJ).")
+
+
+def _emprunts(filtres):
+    statut = filtres.get('statut') or ''
+    # Emprunts rendus et tous les emprunts : historique complet, archives comprises
+    emprunts = (Emprunt if statut in ('actifs', 'retard') else EmpruntHistorique).objects.all()
+    if statut == 'actifs':
+        emprunts = emprunts.actifs()
+    elif statut == 'rendus':
+        emprunts = emprunts.rendus()
+    elif statut == 'retard':
+        emprunts = emprunts.en_retard()
+    elif statut:
+        raise FiltreInvalide(f"Statut inconnu : {statut}.")
+    du = _date(filtres.get('du'), 'du')
+    au = _date(filtres.get('au'), 'au')
+    if du:
+        emprunts = emprunts.filter(date_emprunt__gte=du)
+    if au:
+        emprunts = emprunts.filter(date_emprunt__lte=au)
+
+    # Membres et médias joints : une seule requête par lot
+    emprunts = emprunts.select_related('membre', 'media').order_by('id')
+    return _lignes_emprunts(emprunts.iterator(chunk_size=TAILLE_LOT_EXPORT))
+
+
+def _lignes_emprunts(emprunts):
+    for emprunt in emprunts:
+        media = emprunt.media
+        yield (
+            emprunt.id, emprunt.membre_id, str(emprunt.membre), emprunt.membre.email,
+            type_media_du_contenu(emprunt.content_type_id) if media else '', emprunt.media_id,
+            media.name if media else '',
+            emprunt.date_emprunt, emprunt.date_retour_prevue, emprunt.date_retour,
+        )
+
+
+def _membres(filtres):
+    membres = Membre.objects.all()
+    statut = filtres.get('statut') or ''
+    if statut == 'actifs':
+        membres = membres.filter(nb_emprunts_actifs__gt=0)
+    elif statut == 'retard':
+        membres = membres.filter(prochaine_echeance__lt=timezone.now().date())
+    elif statut:
+        raise FiltreInvalide(f"Statut inconnu : {statut}.")
+    membres = membres.order_by('id').values_list(
+        'id', 'prenom', 'nom', 'email', 'nb_emprunts_actifs', 'prochaine_echeance')
+    return membres.iterator(chunk_size=TAILLE_LOT_EXPORT)
+
+
+def _medias(filtres):
+    medias = CatalogueMedia.objects.order_by('id')
+    type_media = filtres.get('type') or ''
+    if type_media:
+        if type_media not in MODELES_MEDIA:
+            raise FiltreInvalide(f"Type de média inconnu : {type_media}.")
+        medias = medias.filter(type_media=type_media)
+    statut = filtres.get('statut') or ''
+    if statut == 'disponibles':
+        medias = medias.filter(disponible=True)
+    elif statut == 'empruntes':
+        medias = medias.filter(disponible=False)
+    elif statut:
+        raise FiltreInvalide(f"Statut inconnu : {statut}.")
+    return medias.values_list('type_media', 'media_id', 'name', 'createur', 'disponible').iterator(
+        chunk_size=TAILLE_LOT_EXPORT)
+
+
+# Exports disponibles : colonnes et source des lignes (tuples dans l’ordre des colonnes).
+# Chaque source valide ses filtres immédiatement et renvoie un itérateur paresseux.
+EXPORTS = {
+    'emprunts': (
+        ['id', 'membre_id', 'membre', 'email', 'type_media', 'media_id', 'media',
+         'date_emprunt', 'date_retour_prevue', 'date_retour'],
+        _emprunts,
+    ),
+    'membres': (
+        ['id', 'prenom', 'nom', 'email', 'nb_emprunts_actifs', 'prochaine_echeance'],
+        _membres,
+    ),
+    'medias': (
+        ['type_media', 'media_id', 'name', 'createur', 'disponible'],
+        _medias,
+    ),
+}
+
+
+# Objet « fichier » dont write renvoie simplement la ligne formatée par csv.writer
+class _Echo:
+    def write(self, valeur):
+        return valeur
+
+
+def _en_csv(colonnes, lignes):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(colonnes)
+    for ligne in lignes:
+        yield writer.writerow(['' if valeur is None else valeur for valeur in ligne])
+
+
+def _en_jsonl(colonnes, lignes):
+    for ligne in lignes:
+        yield json.dumps(dict(zip(colonnes, ligne)), ensure_ascii=False, default=str) + '\n'
+
+
+# Regroupe les lignes texte en morceaux d’octets, compressés en gzip si demandé
+def _morceaux(textes, compresser):
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31) if compresser else None  # 31 : en-tête gzip
+    paquet = []
+    for texte in textes:
+        paquet.append(texte)
+        if len(paquet) >= TAILLE_LOT_EXPORT:
+            donnees = ''.join(paquet).encode('utf-8')
+            paquet = []
+            if compresseur:
+                donnees = compresseur.compress(donnees)
+            if donnees:
+                yield donnees
+    donnees = ''.join(paquet).encode('utf-8')
+    if compresseur:
+        donnees = compresseur.compress(donnees) + compresseur.flush()
+    if donnees:
+        yield donnees
+
+
+# Prépare un export : renvoie (générateur d’octets, nom de fichier, type MIME).
+# Les filtres sont validés ici, avant le premier octet envoyé.
+def exporter(quoi, format_export='csv', filtres=None, compresser=False):
+    if quoi not in EXPORTS:
+        raise FiltreInvalide(f"Export inconnu : {quoi}.")
+    if format_export not in FORMATS:
+        raise FiltreInvalide(f"Format inconnu : {format_export}.")
+    colonnes, source = EXPORTS[quoi]
+    lignes = source(filtres or {})
+    serialiser = _en_csv if format_export == 'csv' else _en_jsonl
+
+    nom = f"{quoi}.{format_export}"
+    type_mime = 'text/csv' if format_export == 'csv' else 'application/x-ndjson'
+    if compresser:
+        nom += '.gz'
+        type_mime = 'application/gzip'
+    return _morceaux(serialiser(colonnes, lignes), compresser), nom, type_mime
+
+
+
+# Version asynchrone d’un flux d’export, pour StreamingHttpResponse sous ASGI. Chaque
+# morceau (un lot de lignes) est produit dans le thread des requêtes synchrones, où reste
+# ouvert le curseur de iterator() ; la boucle d’événements n’attend jamais la base.
+async def en_flux_async(morceaux):
+    suivant = sync_to_async(next, thread_sensitive=True)
+    fin = object()
+    try:
+        while (morceau := await suivant(morceaux, fin)) is not fin:
+            yield morceau
+    finally:
+        # Client parti en cours de route : le curseur est fermé dans son thread
+        await sync_to_async(morceaux.close, thread_sensitive=True)()
@@ -2,6 +2,7 @@
 from django import forms
 from .models import Livre, CD, DVD, JeuDePlateau, Media, Emprunt, Membre
 from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 
 # Formulaire basé sur le modèle Membre, utilisé pour créer ou modifier un membre
 class MembreForm(forms.ModelForm):
@@ -10,6 +11,17 @@ class MembreForm(forms.ModelForm):
         fields = ['prenom', 'nom', 'email']  # Champs affichés et modifiables dans le formulaire
 
 
+# Membre choisi par son id, trouvé avec la recherche de membres (vue recherche_membres,
+# voir bibliothecaire/membre/recherche.html) : le champ n’énumère jamais la table des
+# membres et l’id saisi est validé par une seule lecture sur la clé primaire
+class ChampMembre(forms.ModelChoiceField):
+    widget = forms.NumberInput
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('label', 'Membre (n°)')
+        super().__init__(queryset=Membre.objects.all(), **kwargs)
+
+
 # Formulaire pour gérer les emprunts (association entre un membre et un média)
 class EmpruntForm(forms.ModelForm):
     # Liste des types de médias possibles à emprunter
@@ -20,6 +32,7 @@ class EmpruntForm(forms.ModelForm):
         ('JEU', 'Jeu de plateau'),  # Ici, l'option est présente mais sera interdite plus bas
     ]
 
+    membre = ChampMembre()  # Id du membre, saisi via la recherche
     type_media = forms.ChoiceField(choices=TYPE_CHOICES, label='Type de média')  # Sélection du type
     media = forms.ModelChoiceField(queryset=CD.objects.none(), label='Média')  # Sélection dynamique du média
 
@@ -71,15 +84,40 @@ class EmpruntForm(forms.ModelForm):
         type_media = self.cleaned_data['type_media']
         media_obj = self.cleaned_data['media']
 
-        # Association générique avec le bon type d’objet via ContentType
+        # Média emprunté, et son type concret via ContentType
+        emprunt.media_id = media_obj.pk
         emprunt.content_type = ContentType.objects.get_for_model(media_obj.__class__)
-        emprunt.object_id = media_obj.pk
 
         if commit:
             emprunt.save()  # Sauvegarde effective en base
         return emprunt
 
 
+# Formulaire de retour d’un emprunt : seule la date de retour est saisie
+class RetourForm(forms.Form):
+    date_retour = forms.DateField(label='Date de retour', initial=timezone.localdate)
+
+    def __init__(self, *args, emprunt, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.emprunt = emprunt
+
+    # Le retour se situe entre l’emprunt et aujourd’hui : la date alimente les statistiques
+    # et le calcul des amendes
+    def clean_date_retour(self):
+        date_retour = self.cleaned_data['date_retour']
+        if date_retour < self.emprunt.date_emprunt:
+            raise forms.ValidationError(
+                f"La date de retour ne peut précéder la date d’emprunt ({self.emprunt.date_emprunt:%d/%m/%Y}).")
+        if date_retour > timezone.localdate():
+            raise forms.ValidationError("La date de retour ne peut être dans le futur.")
+        return date_retour
+
+
+# Formulaire de réservation d’un média emprunté : le média est fixé par l’URL
+class ReservationForm(forms.Form):
+    membre = ChampMembre()
+
+
 # Formulaire de base pour le modèle Media
 class MediaForm(forms.ModelForm):
     disponible = forms.BooleanField(required=False)  # Champ booléen optionnel
@@ -0,0 +1,278 @@
+# Index de disponibilité des médias, hors base de données. Pour chaque type, un tableau
+# de bits indexé par id (bit à 1 : média disponible), dans un fichier projeté en mémoire
+# (mmap) partagé par tous les processus de la machine : « ce média est-il disponible ? »
+# et « ids disponibles d’un type » se lisent sans requête SQL.
+#  - Le fichier est construit depuis la base au premier usage, ou par
+#    « manage.py reconstruire_index_disponibilite », à lancer au démarrage avant les workers.
+#  - Emprunts, retours, ajouts et suppressions le mettent à jour bit par bit, une fois
+#    la transaction validée (catalogue.changer_disponibilite, signals.py, chargement.py).
+#  - La base reste la référence : services.emprunter réserve toujours le média par un
+#    UPDATE conditionnel ; l’index ne sert que les lectures.
+# Les fichiers sont rangés à côté de la base SQLite (« db.sqlite3-disponibilite/ ») ou
+# dans settings.INDEX_DISPONIBILITE_DIR. Avec une base en mémoire (tests), l’index est
+# propre au processus.
+import mmap
+import os
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+from .models import MODELES_MEDIA
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
+
+SIGNATURE = b'DISPO-01'
+
+# En-tête : signature, capacité (en bits), drapeau « fichier remplacé »
+ENTETE = struct.Struct('<8sQQ')
+POSITION_REMPLACE = 16
+TAILLE_ENTETE = 64  # Les bits commencent sur une frontière de 64 octets
+
+# La capacité croît par pas de 65 536 ids (8 Ko)
+PAS_CAPACITE = 1 << 16
+
+_verrou_processus = threading.Lock()
+
+# Tableaux projetés par ce processus, par type
+_tableaux = {}
+
+
+class _Tableau:
+
+    def __init__(self, carte):
+        self.carte = carte
+
+    @property
+    def capacite(self):
+        return ENTETE.unpack_from(self.carte)[1]
+
+    # Un autre processus a reconstruit ou agrandi le fichier : il faut le reprojeter
+    @property
+    def remplace(self):
+        return ENTETE.unpack_from(self.carte)[2] != 0
+
+
+# Est-ce que le média est disponible ? Un id inconnu de l’index ne l’est pas.
+def est_disponible(type_media, media_id):
+    return _lecture(type_media, lambda tableau: _est_disponible(tableau, media_id))
+
+
+def _est_disponible(tableau, media_id):
+    if not 0 <= media_id < tableau.capacite:
+        return False
+    return bool(tableau.carte[TAILLE_ENTETE + (media_id >> 3)] >> (media_id & 7) & 1)
+
+
+# Ids des médias disponibles d’un type, croissants. Le tableau est parcouru par mots
+# de 64 bits : les mots nuls (aucun média disponible) sont sautés d’un coup.
+def ids_disponibles(type_media):
+    return _lecture(type_media, _ids_disponibles)
+
+
+def _ids_disponibles(tableau):
+    ids = []
+    with memoryview(tableau.carte) as vue, vue[TAILLE_ENTETE:].cast('Q') as mots:
+        for numero, mot in enumerate(mots):
+            if not mot:
+                continue
+            if sys.byteorder != 'little':
+                mot = int.from_bytes(mot.to_bytes(8, sys.byteorder), 'little')
+            base = numero * 64
+            while mot:
+                bit = mot & -mot
+                ids.append(base + bit.bit_length() - 1)
+                mot ^= bit
+    return ids
+
+
+def nb_disponibles(type_media):
+    return _lecture(type_media, lambda tableau: int.from_bytes(tableau.carte[TAILLE_ENTETE:], 'little').bit_count())
+
+
+# Marque des médias d’un type disponibles ou non, une fois la transaction validée.
+# Un index pas encore construit est laissé tel quel : il sera lu depuis la base.
+def marquer(type_media, ids, disponible):
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: _marquer(type_media, ids, disponible))
+
+
+def _marquer(type_media, ids, disponible):
+    with _verrou():
+        tableau = _ouvrir(type_media, construire=False)
+        if tableau is None:
+            return
+        if max(ids) >= tableau.capacite:
+            tableau = _agrandir(type_media, tableau, max(ids))
+        carte = tableau.carte
+        for media_id in ids:
+            position, masque = TAILLE_ENTETE + (media_id >> 3), 1 << (media_id & 7)
+            carte[position] = carte[position] | masque if disponible else carte[position] & ~masque
+
+
+# Reconstruit l’index des types donnés (tous si aucun) depuis la base ; renvoie le
+# nombre de médias disponibles par type
+def reconstruire(*types_media):
+    resultat = {}
+    with _verrou():
+        for type_media in types_media or MODELES_MEDIA:
+            capacite, bits = _lire_base(type_media)
+            _remplacer(type_media, capacite, bits)
+            resultat[type_media] = int.from_bytes(bits, 'little').bit_count()
+    return resultat
+
+
+# Oublie les tableaux projetés par ce processus (changement de base, tests)
+def reinitialiser():
+    with _verrou_processus:
+        for tableau in _tableaux.values():
+            _fermer(tableau)
+        _tableaux.clear()
+
+
+def _lire(type_media):
+    tableau = _tableaux.get(type_media)
+    if tableau is None or tableau.remplace:
+        with _verrou():
+            tableau = _ouvrir(type_media)
+    return tableau
+
+
+# Applique lecture(tableau) au tableau à jour d’un type. Les lectures se font sans verrou :
+# si un autre thread a remplacé et fermé le tableau entre-temps, elle est refaite sur le
+# nouveau.
+def _lecture(type_media, lecture):
+    try:
+        return lecture(_lire(type_media))
+    except ValueError:  # mmap closed or invalid
+        return lecture(_lire(type_media))
+
+
+# Libère la projection d’un tableau remplacé (mapping et descripteur de fichier). Un
+# thread qui parcourt encore ses mots la retient : elle est alors libérée à la fin de
+# sa lecture, avec le dernier objet qui la référence.
+def _fermer(tableau):
+    try:
+        tableau.carte.close()
+    except BufferError:
+        pass
+
+
+# Dossier des fichiers d’index (None : mémoire du processus)
+def _dossier():
+    dossier = getattr(settings, 'INDEX_DISPONIBILITE_DIR', None)
+    if dossier:
+        return os.fspath(dossier)
+    base = connections[DEFAULT_DB_ALIAS]
+    if base.vendor != 'sqlite':
+        return os.path.join(settings.BASE_DIR, 'index_disponibilite')
+    if base.is_in_memory_db():
+        return None
+    return f"{base.settings_dict['NAME']}-disponibilite"
+
+
+def _chemin(type_media):
+    dossier = _dossier()
+    return None if dossier is None else os.path.join(dossier, f'{type_media}.bits')
+
+
+# Verrou des écritures : entre threads du processus, et entre processus par flock
+@contextmanager
+def _verrou():
+    with _verrou_processus:
+        dossier = _dossier()
+        if dossier is None or fcntl is None:
+            yield
+            return
+        os.makedirs(dossier, exist_ok=True)
+        with open(os.path.join(dossier, 'verrou'), 'a+b') as fichier:
+            fcntl.flock(fichier, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fichier, fcntl.LOCK_UN)
+
+
+# Tableau à jour d’un type, projeté depuis son fichier ou construit depuis la base
+# (verrou détenu). None si l’index n’existe pas encore et construire=False.
+def _ouvrir(type_media, construire=True):
+    tableau = _tableaux.get(type_media)
+    if tableau is not None and not tableau.remplace:
+        return tableau
+    chemin = _chemin(type_media)
+    if chemin is not None and os.path.exists(chemin):
+        if tableau is not None:
+            _fermer(tableau)
+        tableau = _tableaux[type_media] = _Tableau(_projeter(chemin))
+        return tableau
+    if not construire:
+        return None
+    return _remplacer(type_media, *_lire_base(type_media))
+
+
+def _projeter(chemin):
+    with open(chemin, 'r+b') as fichier:
+        carte = mmap.mmap(fichier.fileno(), 0)
+    if carte[:len(SIGNATURE)] != SIGNATURE:
+        carte.close()
+        raise ValueError(f"{chemin} n’est pas un index de disponibilité.")
+    return carte
+
+
+def _capacite(media_id):
+    return (media_id // PAS_CAPACITE + 1) * PAS_CAPACITE
+
+
+# (capacité, bits) d’un type, lus dans sa table
+def _lire_base(type_media):
+    modele = MODELES_MEDIA[type_media]
+    capacite = _capacite(modele.objects.aggregate(m=Max('pk'))['m'] or 0)
+    bits = bytearray(capacite // 8)
+    for media_id in modele.objects.filter(disponible=True).values_list('pk', flat=True).iterator(chunk_size=10000):
+        bits[media_id >> 3] |= 1 << (media_id & 7)
+    return capacite, bits
+
+
+def _agrandir(type_media, tableau, media_id):
+    capacite = _capacite(media_id)
+    bits = bytearray(capacite // 8)
+    ancien = tableau.carte[TAILLE_ENTETE:]
+    bits[:len(ancien)] = ancien
+    return _remplacer(type_media, capacite, bits)
+
+
+# Écrit un nouveau fichier (renommage atomique : les lecteurs voient l’ancien ou le
+# nouveau, jamais un fichier partiel), puis signale l’ancien comme remplacé aux
+# processus qui le projettent encore ; la projection de ce processus est fermée
+# (verrou détenu)
+def _remplacer(type_media, capacite, bits):
+    contenu = ENTETE.pack(SIGNATURE, capacite, 0).ljust(TAILLE_ENTETE, b'\0') + bytes(bits)
+    chemin = _chemin(type_media)
+    if chemin is None:
+        carte = mmap.mmap(-1, len(contenu))
+        carte.write(contenu)
+    else:
+        ancien = _projeter(chemin) if os.path.exists(chemin) else None
+        temporaire = f'{chemin}.{os.getpid()}.tmp'
+        with open(temporaire, 'wb') as fichier:
+            fichier.write(contenu)
+        os.replace(temporaire, chemin)
+        carte = _projeter(chemin)
+        if ancien is not None:
+            struct.pack_into('<Q', ancien, POSITION_REMPLACE, 1)
+            ancien.close()
+    tableau = _tableaux.get(type_media)
+    if tableau is not None:
+        struct.pack_into('<Q', tableau.carte, POSITION_REMPLACE, 1)  # Tableau périmé, même en mémoire
+    _tableaux[type_media] = _Tableau(carte)
+    if tableau is not None:
+        _fermer(tableau)
+    return _tableaux[type_media]
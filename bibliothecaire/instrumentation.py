@@ -0,0 +1,113 @@
+# Mesure de chaque requête HTTP : nombre de requêtes SQL, temps SQL et durée de la vue
+# (rendu du gabarit compris). Les mesures partent dans l’en-tête Server-Timing (visible
+# dans les outils de développement du navigateur) et dans le journal
+# « bibliothecaire.instrumentation ».
+#
+# Les budgets de requêtes SQL sont déclarés à côté des motifs d’URL :
+#     budget(path('membres/', views.liste_membres, name='liste_membres'), requetes=2)
+# Un dépassement est journalisé en WARNING ; en test, BudgetRequetesMixin le fait échouer.
+import logging
+import time
+from functools import lru_cache
+
+from django.db import connections
+from django.urls import get_resolver, URLResolver
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger('bibliothecaire.instrumentation')
+
+
+# Déclare le nombre maximal de requêtes SQL de la vue d’un motif d’URL
+def budget(motif, requetes):
+    motif.budget_requetes = requetes
+    return motif
+
+
+# Budgets par nom de vue complet ('bibliothecaire:liste_emprunts'), lus une fois
+# dans la configuration d’URL
+@lru_cache(maxsize=None)
+def budgets_requetes(urlconf=None):
+    budgets = {}
+
+    def parcourir(motifs, prefixe):
+        for motif in motifs:
+            if isinstance(motif, URLResolver):
+                espace = f'{prefixe}{motif.namespace}:' if motif.namespace else prefixe
+                parcourir(motif.url_patterns, espace)
+            elif motif.name and hasattr(motif, 'budget_requetes'):
+                budgets[prefixe + motif.name] = motif.budget_requetes
+
+    parcourir(get_resolver(urlconf).url_patterns, '')
+    return budgets
+
+
+class Mesures:
+
+    def __init__(self):
+        self.requetes = 0
+        self.duree_sql = 0.0
+        self.debut = time.perf_counter()
+        self.duree = 0.0
+
+    # execute_wrapper branché sur chaque connexion pendant la vue
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree_sql += time.perf_counter() - debut
+            self.requetes += 1
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mesures = Mesures()
+        for alias in connections:
+            connections[alias].execute_wrappers.append(mesures)
+        request.mesures = mesures
+        return None
+
+    # Les requêtes d’une réponse en flux (exports), exécutées après, ne sont pas comptées
+    def process_response(self, request, response):
+        mesures = getattr(request, 'mesures', None)
+        if mesures is None:
+            return response
+        for alias in connections:
+            if mesures in connections[alias].execute_wrappers:
+                connections[alias].execute_wrappers.remove(mesures)
+        mesures.duree = time.perf_counter() - mesures.debut
+
+        vue = request.resolver_match.view_name if request.resolver_match else ''
+        budget_vue = budgets_requetes(getattr(request, 'urlconf', None)).get(vue)
+        response.mesures = mesures
+        response.budget_requetes = budget_vue
+        response['Server-Timing'] = (
+            f'sql;dur={mesures.duree_sql * 1000:.1f};desc="{mesures.requetes} requetes", '
+            f'vue;dur={mesures.duree * 1000:.1f}'
+        )
+
+        message = "%s %s (%s) : %d requête(s) SQL en %.1f ms, vue en %.1f ms"
+        arguments = [request.method, request.path, vue, mesures.requetes,
+                     mesures.duree_sql * 1000, mesures.duree * 1000]
+        if budget_vue is not None and mesures.requetes > budget_vue:
+            logger.warning(message + " — budget de %d requête(s) dépassé", *arguments, budget_vue)
+        else:
+            logger.info(message, *arguments)
+        return response
+
+
+# Pour les TestCase : vérifie qu’une réponse respecte le budget de requêtes de sa vue
+class BudgetRequetesMixin:
+
+    def assertBudgetRequetes(self, response):
+        mesures = getattr(response, 'mesures', None)
+        if mesures is None:
+            self.fail("Réponse non mesurée : InstrumentationMiddleware est-il installé ?")
+        if response.budget_requetes is None:
+            self.fail(f"Aucun budget de requêtes déclaré pour {response.resolver_match.view_name}.")
+        self.assertLessEqual(
+            mesures.requetes, response.budget_requetes,
+            f"{response.resolver_match.view_name} : {mesures.requetes} requêtes SQL "
+            f"pour un budget de {response.budget_requetes}.",
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bibliothecaire import archives
+
+
+class Command(BaseCommand):
+    help = ("Déplace les emprunts rendus depuis plus de --older-than jours de la table Emprunt vers "
+            "EmpruntArchive, par lots d’une transaction chacun. La liste des emprunts rendus, les "
+            "exports et les statistiques lisent les deux tables. À lancer régulièrement (cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='JOURS',
+                            help="Ancienneté minimale du retour, en jours.")
+        parser.add_argument('--taille-lot', type=int, default=archives.TAILLE_LOT_ARCHIVE,
+                            help=f"Emprunts déplacés par transaction (défaut : {archives.TAILLE_LOT_ARCHIVE}).")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0:
+            raise CommandError("--older-than doit être positif ou nul.")
+        if options['taille_lot'] <= 0:
+            raise CommandError("--taille-lot doit être positif.")
+
+        progression = None
+        if options['verbosity'] > 1:
+            progression = lambda total: self.stderr.write(f"  {total} emprunt(s) archivé(s)…")
+        total = archives.archiver(options['older_than'], options['taille_lot'], apres_lot=progression)
+        self.stdout.write(self.style.SUCCESS(f"{total} emprunt(s) rendu(s) archivé(s)."))
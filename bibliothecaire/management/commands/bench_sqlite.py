@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from bibliothecaire.chargement import creer_medias_en_masse
+from bibliothecaire.models import Emprunt, Membre, MODELES_MEDIA
+
+# Profil « defaut » : configuration Django d’origine (journal rollback, une connexion
+# par requête). Le profil « production » reprend la configuration de settings.DATABASES.
+PROFIL_DEFAUT = {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}
+
+TYPES_EMPRUNTABLES = ['CD', 'DVD', 'LIVRE']
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit des vues de catalogue (lecture) et d’emprunt/retour (écriture) "
+            "sous plusieurs processus concurrents, avec la configuration SQLite d’origine puis "
+            "celle de settings.py, sur une base temporaire.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Processus concurrents (défaut : 4).")
+        parser.add_argument('--duree', type=float, default=10, help="Durée par profil en secondes (défaut : 10).")
+        parser.add_argument('--part-ecritures', type=float, default=0.2,
+                            help="Part des opérations qui sont un emprunt suivi d’un retour (défaut : 0.2).")
+        parser.add_argument('--membres', type=int, default=200, help="Membres créés (défaut : 200).")
+        parser.add_argument('--medias', type=int, default=2000,
+                            help="Médias créés par type CD, DVD, Livre (défaut : 2000).")
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError("Ce banc d’essai lance ses workers par fork (Linux, macOS).")
+        if connection.vendor != 'sqlite':
+            raise CommandError("Ce banc d’essai ne concerne que SQLite.")
+
+        production = {cle: connection.settings_dict[cle] for cle in PROFIL_DEFAUT}
+        with tempfile.TemporaryDirectory() as dossier:
+            modele = os.path.join(dossier, 'modele.sqlite3')
+            self.stderr.write("Préparation de la base de test...")
+            self._preparer(modele, options)
+
+            resultats = {}
+            for nom, profil in (('defaut', PROFIL_DEFAUT), ('production', production)):
+                chemin = os.path.join(dossier, f'{nom}.sqlite3')
+                shutil.copy(modele, chemin)
+                resultats[nom] = self._mesurer(chemin, profil, options)
+                self._afficher(nom, resultats[nom], options['duree'])
+
+        for cle, libelle in (('lectures', "lectures"), ('ecritures', "écritures")):
+            avant = resultats['defaut'][cle]
+            if avant:
+                self.stdout.write(f"Gain {libelle} : x{resultats['production'][cle] / avant:.2f}")
+
+    # Crée la base temporaire (migrations) et la remplit de membres et de médias disponibles
+    def _preparer(self, chemin, options):
+        self._utiliser(chemin, PROFIL_DEFAUT)
+        call_command('migrate', verbosity=0, interactive=False)
+        Membre.objects.bulk_create(
+            Membre(prenom=f"Prénom{i}", nom=f"Nom{i}", email=f"membre{i}@example.com")
+            for i in range(options['membres'])
+        )
+        for type_media in TYPES_EMPRUNTABLES:
+            creer_medias_en_masse(type_media, [
+                {'name': f"{type_media} {i}", 'createur': f"Créateur {i % 50}", 'disponible': True}
+                for i in range(options['medias'])
+            ])
+        connection.close()
+
+    # Redirige la connexion par défaut vers une autre base et un autre profil
+    def _utiliser(self, chemin, profil):
+        connection.close()
+        connection.settings_dict.update(profil, NAME=chemin)
+
+    def _mesurer(self, chemin, profil, options):
+        contexte = multiprocessing.get_context('fork')
+        file_resultats = contexte.Queue()
+        connection.close()  # Aucune connexion ouverte ne doit être partagée par fork
+        processus = [
+            contexte.Process(target=self._worker, args=(numero, chemin, profil, options, file_resultats))
+            for numero in range(options['workers'])
+        ]
+        for p in processus:
+            p.start()
+        parts = [file_resultats.get() for _ in processus]
+        for p in processus:
+            p.join()
+
+        total = {'lectures': 0, 'ecritures': 0, 'erreurs': 0, 'latences_lecture': [], 'latences_ecriture': []}
+        for part in parts:
+            for cle, valeur in part.items():
+                total[cle] += valeur
+        return total
+
+    # Un worker (comme un worker gunicorn) : boucle de requêtes jusqu’à l’échéance
+    def _worker(self, numero, chemin, profil, options, file_resultats):
+        self._utiliser(chemin, profil)
+        setup_test_environment()  # Autorise l’hôte « testserver » du client de test
+        client = Client()
+        aleatoire = random.Random(numero)
+        workers = options['workers']
+
+        # Chaque worker emprunte ses propres médias avec ses propres membres : les refus
+        # métier (média déjà emprunté, limite atteinte) ne faussent pas la mesure
+        membres = [pk for pk in Membre.objects.values_list('id', flat=True) if pk % workers == numero]
+        medias = [
+            (type_media, pk)
+            for type_media in TYPES_EMPRUNTABLES
+            for pk in MODELES_MEDIA[type_media].objects.values_list('pk', flat=True) if pk % workers == numero
+        ]
+        nb_pages = max(1, options['medias'] * len(TYPES_EMPRUNTABLES) // 50)
+        connection.close()
+
+        mesures = {'lectures': 0, 'ecritures': 0, 'erreurs': 0, 'latences_lecture': [], 'latences_ecriture': []}
+        echeance = time.monotonic() + options['duree']
+        try:
+            while time.monotonic() < echeance:
+                debut = time.monotonic()
+                try:
+                    if aleatoire.random() < options['part_ecritures']:
+                        if self._emprunter_et_rendre(client, aleatoire.choice(membres), aleatoire.choice(medias)):
+                            mesures['ecritures'] += 2
+                            mesures['latences_ecriture'].append(time.monotonic() - debut)
+                    else:
+                        client.get(reverse('bibliothecaire:liste_media'), {
+                            'page': aleatoire.randint(1, nb_pages), 'tri': aleatoire.choice(['nom', 'createur']),
+                        })
+                        mesures['lectures'] += 1
+                        mesures['latences_lecture'].append(time.monotonic() - debut)
+                except OperationalError:  # « database is locked »
+                    mesures['erreurs'] += 1
+        finally:
+            # Toujours répondre, même en cas d’erreur inattendue, pour ne pas bloquer le parent
+            connection.close()
+            file_resultats.put(mesures)
+
+    def _emprunter_et_rendre(self, client, membre_id, media):
+        type_media, media_id = media
+        reponse = client.post(reverse('bibliothecaire:creer_emprunt'), {
+            'membre': membre_id, 'type_media': type_media, 'media': media_id,
+        })
+        if reponse.status_code != 302:
+            return False
+        emprunt_id = Emprunt.objects.actifs().filter(media=media_id).values_list('id', flat=True).first()
+        reponse = client.post(reverse('bibliothecaire:rentrer_emprunt', args=[emprunt_id]), {
+            'date_retour': timezone.localdate().isoformat(),
+        })
+        return reponse.status_code == 302
+
+    def _afficher(self, nom, mesures, duree):
+        def p95(latences):
+            if not latences:
+                return 0
+            return sorted(latences)[int(len(latences) * 0.95)] * 1000
+
+        self.stdout.write(
+            f"{nom:<11} lectures {mesures['lectures'] / duree:8.1f}/s (p95 {p95(mesures['latences_lecture']):6.1f} ms)  "
+            f"écritures {mesures['ecritures'] / duree:7.1f}/s (p95 {p95(mesures['latences_ecriture']):6.1f} ms)  "
+            f"erreurs de verrou {mesures['erreurs']}"
+        )
@@ -0,0 +1,197 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import get_resolver, URLResolver, reverse
+from django.utils import timezone
+
+from bibliothecaire.models import CatalogueMedia, Emprunt, Membre, Recommandation, Reservation
+
+# Espaces de noms mesurés : toutes les URL de bibliothecaire.urls et membre.urls
+ESPACES_MESURES = ('bibliothecaire', 'membre')
+
+
+class Command(BaseCommand):
+    help = ("Mesure chaque URL de bibliothecaire.urls et membre.urls (GET) sur la base courante, "
+            "idéalement remplie par seed_benchmark : temps p50/p95, requêtes SQL et pic mémoire. "
+            "Écrit les résultats en JSON, comparables d’un commit à l’autre avec --comparer.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Mesures par scénario (défaut : 20).")
+        parser.add_argument('--echauffement', type=int, default=2,
+                            help="Requêtes non mesurées avant chaque scénario (défaut : 2).")
+        parser.add_argument('--sortie', help="Fichier JSON des résultats.")
+        parser.add_argument('--comparer', help="Fichier JSON d’une mesure précédente à comparer.")
+        parser.add_argument('--filtre', help="Ne mesure que les scénarios dont le nom contient ce texte.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] <= 0:
+            raise CommandError("--iterations doit être positif.")
+        reference = self._lire(options['comparer']) if options['comparer'] else None
+
+        settings.DEBUG = False  # Pas de journal des requêtes SQL pendant la mesure
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']  # Hôte du client de test
+        scenarios = self._scenarios()
+        self._verifier_couverture(scenarios)
+        if options['filtre']:
+            scenarios = [s for s in scenarios if options['filtre'] in s[0]]
+
+        client = Client()
+        resultats = {}
+        for nom, url, params in scenarios:
+            resultats[nom] = self._mesurer(client, url, params, options['iterations'], options['echauffement'])
+            self._afficher(nom, resultats[nom], reference)
+
+        rapport = {
+            'date': timezone.now().isoformat(),
+            'commit': self._commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base': {
+                'moteur': connection.vendor,
+                'membres': Membre.objects.count(),
+                'medias': CatalogueMedia.objects.count(),
+                'emprunts': Emprunt.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'resultats': resultats,
+        }
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(rapport, fichier, ensure_ascii=False, indent=2)
+            self.stderr.write(f"Résultats écrits dans {options['sortie']}.")
+
+    # Scénarios (nom, url, paramètres GET), avec des identifiants pris dans la base
+    def _scenarios(self):
+        membre, nom = Membre.objects.order_by('pk').values_list('pk', 'nom').first() or (None, '')
+        emprunt = Emprunt.objects.actifs().order_by('pk').values_list('pk', flat=True).first()
+        media = CatalogueMedia.objects.filter(type_media='CD').order_by('pk').first()
+        reservation = Reservation.objects.order_by('pk').values_list('pk', flat=True).first()
+        retenue = Reservation.objects.filter(statut=Reservation.RETENUE).order_by('pk').values_list('pk', flat=True).first()
+        if membre is None or emprunt is None or media is None:
+            raise CommandError("Base vide ou sans emprunt en cours : lancer d’abord seed_benchmark.")
+        if reservation is None or retenue is None:
+            raise CommandError("Base sans réservation ni média mis de côté : lancer d’abord seed_benchmark.")
+        emprunte = CatalogueMedia.objects.filter(type_media='CD', disponible=False).order_by('pk').first()
+        mot = media.name.split()[0]
+        # Média qui a des recommandations (reconstruire_recommandations), sinon le premier CD
+        recommande = Recommandation.objects.order_by('media_id').values_list('media_id', flat=True).first()
+        dernier = Emprunt.objects.order_by('date_emprunt', 'id').values_list('date_emprunt', 'id')[500:501].first()
+        curseur = f"{dernier[0].isoformat()}_{dernier[1]}" if dernier else ''
+
+        aujourd_hui = timezone.localdate()
+        annee = {'du': (aujourd_hui - timezone.timedelta(days=364)).isoformat(), 'au': aujourd_hui.isoformat()}
+
+        b = 'bibliothecaire'
+        return [
+            ('bibliothecaire:liste_membres', reverse(f'{b}:liste_membres'), {}),
+            ('bibliothecaire:recherche_membres', reverse(f'{b}:recherche_membres'), {'q': nom[:3]}),
+            ('bibliothecaire:recherche_membres?complet', reverse(f'{b}:recherche_membres'), {'q': f'{nom} membre1'}),
+            ('bibliothecaire:creer_membre', reverse(f'{b}:creer_membre'), {}),
+            ('bibliothecaire:modifier_membre', reverse(f'{b}:modifier_membre', args=[membre]), {}),
+            ('bibliothecaire:supprimer_membre', reverse(f'{b}:supprimer_membre', args=[membre]), {}),
+            ('bibliothecaire:liste_media', reverse(f'{b}:liste_media'), {}),
+            ('bibliothecaire:liste_media?page=profonde', reverse(f'{b}:liste_media'), {'page': 2000, 'tri': 'createur'}),
+            ('bibliothecaire:liste_media?q', reverse(f'{b}:liste_media'), {'q': mot}),
+            ('bibliothecaire:supprimer_media', reverse(f'{b}:supprimer_media', args=['CD', media.media_id]), {}),
+            ('bibliothecaire:ajouter_media', reverse(f'{b}:ajouter_media'), {}),
+            ('bibliothecaire:medias_disponibles', reverse(f'{b}:medias_disponibles'), {'type_media': 'CD'}),
+            ('bibliothecaire:recherche_media', reverse(f'{b}:recherche_media'), {'q': mot}),
+            ('bibliothecaire:ids_disponibles', reverse(f'{b}:ids_disponibles', args=['CD']), {}),
+            ('bibliothecaire:media_disponible', reverse(f'{b}:media_disponible', args=['CD', media.media_id]), {}),
+            ('bibliothecaire:creer_emprunt', reverse(f'{b}:creer_emprunt'), {}),
+            ('bibliothecaire:rentrer_emprunt', reverse(f'{b}:rentrer_emprunt', args=[emprunt]), {}),
+            ('bibliothecaire:liste_emprunts', reverse(f'{b}:liste_emprunts'), {}),
+            ('bibliothecaire:liste_emprunts?statut=retard', reverse(f'{b}:liste_emprunts'), {'statut': 'retard'}),
+            ('bibliothecaire:liste_emprunts?apres', reverse(f'{b}:liste_emprunts'), {'apres': curseur}),
+            ('bibliothecaire:liste_reservations', reverse(f'{b}:liste_reservations'), {}),
+            ('bibliothecaire:reserver_media', reverse(f'{b}:reserver_media', args=['CD', emprunte.media_id]), {}),
+            ('bibliothecaire:preter_reservation', reverse(f'{b}:preter_reservation', args=[retenue]), {}),
+            ('bibliothecaire:supprimer_reservation', reverse(f'{b}:supprimer_reservation', args=[reservation]), {}),
+            ('bibliothecaire:statistiques', reverse(f'{b}:statistiques'), {}),
+            ('bibliothecaire:statistiques?annee', reverse(f'{b}:statistiques'), annee),
+            ('bibliothecaire:statistiques_json', reverse(f'{b}:statistiques_json'), annee),
+            ('bibliothecaire:exporter', reverse(f'{b}:exporter', args=['emprunts']), {'statut': 'retard'}),
+            ('bibliothecaire:accueil', reverse(f'{b}:accueil'), {}),
+            ('membre:liste_media', reverse('membre:liste_media'), {}),
+            ('membre:liste_media?q', reverse('membre:liste_media'), {'q': mot}),
+            ('membre:fiche_media', reverse('membre:fiche_media', args=[recommande or media.media_id]), {}),
+        ]
+
+    # Signale les URL nommées des espaces mesurés qui n’ont pas de scénario
+    def _verifier_couverture(self, scenarios):
+        couvertes = {nom.split('?')[0] for nom, _, _ in scenarios}
+        for resolveur in get_resolver().url_patterns:
+            if isinstance(resolveur, URLResolver) and resolveur.namespace in ESPACES_MESURES:
+                for motif in resolveur.url_patterns:
+                    nom = f'{resolveur.namespace}:{motif.name}'
+                    if motif.name and nom not in couvertes:
+                        self.stderr.write(self.style.WARNING(f"Aucun scénario pour {nom}."))
+
+    def _mesurer(self, client, url, params, iterations, echauffement):
+        for _ in range(echauffement):
+            self._requete(client, url, params)
+        durees, requetes, statut = [], None, None
+        for _ in range(iterations):
+            debut = time.perf_counter()
+            response = self._requete(client, url, params)
+            durees.append(time.perf_counter() - debut)
+            mesures = getattr(response, 'mesures', None)
+            requetes = mesures.requetes if mesures else None
+            statut = response.status_code
+
+        # Pic mémoire mesuré à part : tracemalloc ralentit l’exécution
+        tracemalloc.start()
+        self._requete(client, url, params)
+        _, pic = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        durees.sort()
+        return {
+            'url': url,
+            'params': params,
+            'statut': statut,
+            'p50_ms': round(statistics.median(durees) * 1000, 2),
+            'p95_ms': round(durees[min(len(durees) - 1, int(len(durees) * 0.95))] * 1000, 2),
+            'requetes': requetes,
+            'memoire_pic_ko': round(pic / 1024, 1),
+        }
+
+    # Une requête, contenu en flux compris
+    def _requete(self, client, url, params):
+        response = client.get(url, params)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def _afficher(self, nom, resultat, reference):
+        ligne = (f"{nom:<46} p50 {resultat['p50_ms']:9.2f} ms  p95 {resultat['p95_ms']:9.2f} ms  "
+                 f"{resultat['requetes'] if resultat['requetes'] is not None else '-':>3} req.  "
+                 f"{resultat['memoire_pic_ko']:9.1f} Ko")
+        ancien = reference['resultats'].get(nom) if reference else None
+        if ancien and ancien['p50_ms']:
+            ligne += f"  (p50 x{resultat['p50_ms'] / ancien['p50_ms']:.2f}, req. {ancien['requetes']} → {resultat['requetes']})"
+        self.stdout.write(ligne)
+
+    def _lire(self, chemin):
+        try:
+            with open(chemin, encoding='utf-8') as fichier:
+                return json.load(fichier)
+        except (OSError, ValueError) as erreur:
+            raise CommandError(f"Lecture de {chemin} impossible : {erreur}")
+
+    def _commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,75 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Pages catalogue et disponibilités : les vues asynchrones
+CHEMINS_PAR_DEFAUT = [
+    '/bibliothecaire/media/?page=2',
+    '/bibliothecaire/medias-disponibles/?type_media=CD',
+    '/membre/?tri=createur',
+]
+
+
+class Command(BaseCommand):
+    help = ("Test de charge HTTP d’un serveur déjà lancé : des clients concurrents (connexions "
+            "persistantes) enchaînent les GET et le débit est affiché. Pour comparer les déploiements, "
+            "lancer tour à tour « gunicorn mediatheque.wsgi -w 4 » puis "
+            "« uvicorn mediatheque.asgi:application --workers 4 » et exécuter la commande contre chacun.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--serveur', default='http://127.0.0.1:8000',
+                            help="Adresse du serveur (défaut : http://127.0.0.1:8000).")
+        parser.add_argument('--chemin', action='append', dest='chemins',
+                            help="Chemin à demander, répétable (défaut : pages catalogue et disponibilités).")
+        parser.add_argument('--concurrence', type=int, default=16, help="Clients simultanés (défaut : 16).")
+        parser.add_argument('--duree', type=float, default=10, help="Durée en secondes (défaut : 10).")
+
+    def handle(self, *args, **options):
+        serveur = urlsplit(options['serveur'])
+        if serveur.scheme != 'http' or not serveur.hostname:
+            raise CommandError("--serveur doit être une adresse http://hôte[:port].")
+        chemins = options['chemins'] or CHEMINS_PAR_DEFAUT
+        echeance = time.monotonic() + options['duree']
+        mesures = []
+
+        def client(numero):
+            latences, erreurs = [], 0
+            connexion = http.client.HTTPConnection(serveur.hostname, serveur.port or 80, timeout=30)
+            i = numero
+            while time.monotonic() < echeance:
+                debut = time.monotonic()
+                try:
+                    connexion.request('GET', chemins[i % len(chemins)])
+                    reponse = connexion.getresponse()
+                    reponse.read()
+                    if reponse.status >= 400:
+                        erreurs += 1
+                    else:
+                        latences.append(time.monotonic() - debut)
+                except (OSError, http.client.HTTPException):
+                    erreurs += 1
+                    connexion.close()  # Rouverte automatiquement à la requête suivante
+                i += 1
+            connexion.close()
+            mesures.append((latences, erreurs))
+
+        clients = [threading.Thread(target=client, args=(n,)) for n in range(options['concurrence'])]
+        debut = time.monotonic()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        duree = time.monotonic() - debut
+
+        latences = sorted(latence for part, _ in mesures for latence in part)
+        erreurs = sum(e for _, e in mesures)
+        if not latences:
+            raise CommandError(f"Aucune réponse réussie ({erreurs} erreur(s)).")
+        self.stdout.write(
+            f"{len(latences) / duree:.1f} requêtes/s sur {duree:.1f} s — "
+            f"p50 {latences[len(latences) // 2] * 1000:.1f} ms, "
+            f"p95 {latences[int(len(latences) * 0.95)] * 1000:.1f} ms, {erreurs} erreur(s)"
+        )
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bibliothecaire import amendes
+
+
+class Command(BaseCommand):
+    help = ("Calcule les amendes de retard selon les tarifs par type de média (settings.TARIFS_RETARD) : "
+            "provisoires pour les emprunts en cours en retard, définitives pour les emprunts rendus en "
+            "retard depuis le dernier calcul. Relancer pour la même date ne change rien. "
+            "À lancer chaque nuit (cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Date de référence AAAA-MM-JJ (défaut : aujourd’hui).")
+        parser.add_argument('--depuis', type=date.fromisoformat,
+                            help="Premier jour de retour pris en compte, AAAA-MM-JJ "
+                                 "(défaut : jour du dernier calcul ; tout l’historique au premier).")
+        parser.add_argument('--taille-tranche', type=int, default=amendes.TAILLE_TRANCHE,
+                            help=f"Ids d’emprunts parcourus par transaction (défaut : {amendes.TAILLE_TRANCHE}).")
+
+    def handle(self, *args, **options):
+        if options['taille_tranche'] <= 0:
+            raise CommandError("--taille-tranche doit être positif.")
+        aujourd_hui = options['date'] or timezone.now().date()
+        if options['depuis'] and options['depuis'] > aujourd_hui:
+            raise CommandError("--depuis doit précéder --date.")
+
+        progression = None
+        if options['verbosity'] > 1:
+            progression = lambda total: self.stderr.write(f"  {total} amende(s) écrite(s)…")
+        provisoires, definitives = amendes.calculer(aujourd_hui, options['depuis'], options['taille_tranche'],
+                                                    apres_tranche=progression)
+        self.stdout.write(self.style.SUCCESS(
+            f"{provisoires} amende(s) provisoire(s) et {definitives} amende(s) définitive(s) "
+            f"au {aujourd_hui.isoformat()}."))
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bibliothecaire.services import expirer_reservations
+
+
+class Command(BaseCommand):
+    help = ("Supprime les mises de côté expirées (média rendu mais pas venu chercher à temps) : "
+            "chaque média passe au suivant de sa file d’attente, ou redevient disponible. "
+            "À lancer chaque jour (cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Date de référence AAAA-MM-JJ (défaut : aujourd’hui).")
+        parser.add_argument('--taille-lot', type=int, default=500,
+                            help="Réservations traitées par transaction (défaut : 500).")
+
+    def handle(self, *args, **options):
+        if options['taille_lot'] <= 0:
+            raise CommandError("--taille-lot doit être positif.")
+        aujourd_hui = options['date'] or timezone.now().date()
+        total = expirer_reservations(aujourd_hui, options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(f"{total} réservation(s) expirée(s) au {aujourd_hui.isoformat()}."))
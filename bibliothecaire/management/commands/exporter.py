@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bibliothecaire.exports import exporter, EXPORTS, FORMATS, FiltreInvalide
+
+
+class Command(BaseCommand):
+    help = ("Exporte en flux les emprunts, membres ou médias au format CSV ou JSONL, "
+            "éventuellement compressé en gzip.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('quoi', choices=list(EXPORTS), help="Données à exporter.")
+        parser.add_argument('--format', choices=FORMATS, default='csv',
+                            help="Format de sortie (défaut : csv).")
+        parser.add_argument('--gzip', action='store_true', help="Compresse la sortie en gzip.")
+        parser.add_argument('--du', help="Emprunts à partir de cette date (AAAA-MM-JJ).")
+        parser.add_argument('--au', help="Emprunts jusqu’à cette date incluse (AAAA-MM-JJ).")
+        parser.add_argument('--statut',
+                            help="emprunts : actifs, rendus, retard ; membres : actifs, retard ; "
+                                 "medias : disponibles, empruntes.")
+        parser.add_argument('--type', help="Type de média (CD, DVD, LIVRE, JEU) pour l’export des médias.")
+        parser.add_argument('--sortie', help="Fichier de sortie (défaut : sortie standard).")
+
+    def handle(self, *args, **options):
+        filtres = {cle: options[cle] for cle in ('du', 'au', 'statut', 'type') if options[cle]}
+        try:
+            morceaux, _, _ = exporter(options['quoi'], options['format'], filtres, options['gzip'])
+        except FiltreInvalide as erreur:
+            raise CommandError(str(erreur))
+
+        # Écriture en octets, morceau par morceau : la mémoire reste constante
+        sortie = open(options['sortie'], 'wb') if options['sortie'] else sys.stdout.buffer
+        try:
+            for morceau in morceaux:
+                sortie.write(morceau)
+        finally:
+            if options['sortie']:
+                sortie.close()
+            else:
+                sortie.flush()
@@ -0,0 +1,178 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bibliothecaire.chargement import creer_medias_en_masse
+from bibliothecaire.models import CatalogueMedia, MODELES_MEDIA
+
+VRAI = {'1', 'true', 'vrai', 'oui', 'yes', 'o', 'y'}
+FAUX = {'0', 'false', 'faux', 'non', 'no', 'n'}
+
+
+# Ligne invalide du fichier (message affiché avec son numéro de ligne)
+class LigneInvalide(ValueError):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Importe des CD, DVD, Livres et jeux de plateau depuis un fichier CSV ou JSONL "
+            "(colonnes : type, name, createur, disponible), par lots transactionnels.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Fichier .csv ou .jsonl à importer.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Format du fichier (défaut : déduit de l’extension).")
+        parser.add_argument('--taille-lot', type=int, default=5000,
+                            help="Nombre de lignes par transaction (défaut : 5000).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Valide le fichier et compte les doublons sans rien écrire.")
+        parser.add_argument('--progression',
+                            help="Fichier d’avancement (défaut : <fichier>.progression).")
+        parser.add_argument('--reprendre', action='store_true',
+                            help="Reprend après les lignes déjà importées d’après le fichier d’avancement.")
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        format_fichier = options['format'] or ('jsonl' if chemin.endswith(('.jsonl', '.ndjson')) else 'csv')
+        taille_lot = options['taille_lot']
+        if taille_lot <= 0:
+            raise CommandError("--taille-lot doit être positif.")
+        chemin_progression = options['progression'] or f'{chemin}.progression'
+        dry_run = options['dry_run']
+
+        deja_faites = self._lire_progression(chemin_progression) if options['reprendre'] else 0
+        stats = {'importes': 0, 'doublons': 0, 'invalides': 0}
+        vues = set()  # Clés déjà rencontrées en dry-run (rien n’est écrit en base)
+        debut = time.monotonic()
+
+        try:
+            with open(chemin, newline='', encoding='utf-8') as fichier:
+                lignes = islice(self._lire(fichier, format_fichier), deja_faites, None)
+                numero = deja_faites
+                while True:
+                    lot = list(islice(lignes, taille_lot))
+                    if not lot:
+                        break
+                    valides = []
+                    for brute in lot:
+                        numero += 1
+                        try:
+                            valides.append(self._valider(brute))
+                        except LigneInvalide as erreur:
+                            stats['invalides'] += 1
+                            self.stderr.write(f"Ligne {numero} ignorée : {erreur}")
+
+                    if dry_run:
+                        nouvelles = self._sans_doublons(valides, vues)
+                        vues.update(self._cle(ligne) for ligne in nouvelles)
+                    else:
+                        with transaction.atomic():
+                            nouvelles = self._sans_doublons(valides, set())
+                            self._inserer(nouvelles)
+                        self._ecrire_progression(chemin_progression, numero)
+                    stats['importes'] += len(nouvelles)
+                    stats['doublons'] += len(valides) - len(nouvelles)
+        except (OSError, csv.Error) as erreur:
+            raise CommandError(f"Lecture de {chemin} impossible : {erreur}")
+
+        if not dry_run and os.path.exists(chemin_progression):
+            os.remove(chemin_progression)  # Import terminé : plus rien à reprendre
+
+        duree = time.monotonic() - debut
+        verbe = "à importer" if dry_run else "importé(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['importes']} média(s) {verbe}, {stats['doublons']} doublon(s), "
+            f"{stats['invalides']} ligne(s) invalide(s) en {duree:.1f} s."
+        ))
+
+    # Lecture en flux : une ligne à la fois, jamais le fichier entier en mémoire
+    def _lire(self, fichier, format_fichier):
+        if format_fichier == 'csv':
+            yield from csv.DictReader(fichier)
+        else:
+            for texte in fichier:
+                if texte.strip():
+                    try:
+                        yield json.loads(texte)
+                    except json.JSONDecodeError as erreur:
+                        # Comptée comme invalide à la validation, comme une ligne CSV mal formée
+                        yield LigneInvalide(f"JSON invalide ({erreur.msg}, colonne {erreur.colno})")
+
+    def _valider(self, brute):
+        if isinstance(brute, LigneInvalide):
+            raise brute
+        if not isinstance(brute, dict):
+            raise LigneInvalide("objet attendu")
+        type_media = str(brute.get('type') or brute.get('type_media') or '').strip().upper()
+        if type_media not in MODELES_MEDIA:
+            raise LigneInvalide(f"type inconnu « {type_media} »")
+        name = str(brute.get('name') or '').strip()
+        if not name or len(name) > 100:
+            raise LigneInvalide("nom vide ou de plus de 100 caractères")
+        createur = str(brute.get('createur') or '').strip()
+        if len(createur) > 100:
+            raise LigneInvalide("créateur de plus de 100 caractères")
+
+        disponible = brute.get('disponible', True)
+        if not isinstance(disponible, bool):
+            texte = str(disponible).strip().lower()
+            if texte in VRAI or texte == '':
+                disponible = True
+            elif texte in FAUX:
+                disponible = False
+            else:
+                raise LigneInvalide(f"disponible invalide « {disponible} »")
+        return {'type_media': type_media, 'name': name, 'createur': createur, 'disponible': disponible}
+
+    # Clé naturelle d’un média : type, nom et créateur
+    def _cle(self, ligne):
+        return ligne['type_media'], ligne['name'], ligne['createur']
+
+    # Écarte les doublons internes au lot et les médias déjà présents au catalogue
+    # (une requête indexée sur (type_media, name) par type présent dans le lot)
+    def _sans_doublons(self, lignes, vues):
+        existantes = set(vues)
+        noms_par_type = {}
+        for ligne in lignes:
+            noms_par_type.setdefault(ligne['type_media'], set()).add(ligne['name'])
+        for type_media, noms in noms_par_type.items():
+            existantes.update(
+                (type_media, name, createur)
+                for name, createur in CatalogueMedia.objects.filter(type_media=type_media, name__in=noms)
+                .values_list('name', 'createur')
+            )
+
+        nouvelles = []
+        for ligne in lignes:
+            cle = self._cle(ligne)
+            if cle not in existantes:
+                existantes.add(cle)
+                nouvelles.append(ligne)
+        return nouvelles
+
+    def _inserer(self, lignes):
+        par_type = {}
+        for ligne in lignes:
+            par_type.setdefault(ligne['type_media'], []).append(ligne)
+        for type_media, lignes_du_type in par_type.items():
+            creer_medias_en_masse(type_media, lignes_du_type)
+
+    def _lire_progression(self, chemin):
+        try:
+            with open(chemin, encoding='utf-8') as fichier:
+                return json.load(fichier)['lignes']
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError) as erreur:
+            raise CommandError(f"Fichier d’avancement {chemin} illisible : {erreur}")
+
+    def _ecrire_progression(self, chemin, lignes):
+        temporaire = f'{chemin}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump({'lignes': lignes}, fichier)
+        os.replace(temporaire, chemin)  # Écriture atomique
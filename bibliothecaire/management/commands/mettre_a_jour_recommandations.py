@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bibliothecaire import recommandations
+
+
+class Command(BaseCommand):
+    help = ("Applique aux recommandations « ils ont aussi emprunté » les emprunts commencés depuis "
+            "--depuis (défaut : hier), sans tout recalculer : seules les listes des médias "
+            "empruntés et de leurs voisins sont réécrites. À lancer chaque nuit (cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depuis', type=date.fromisoformat,
+                            help="Premier jour d’emprunt pris en compte, AAAA-MM-JJ (défaut : hier).")
+
+    def handle(self, *args, **options):
+        depuis = options['depuis'] or timezone.now().date() - timezone.timedelta(days=1)
+        try:
+            total = recommandations.mettre_a_jour(depuis)
+        except recommandations.RecommandationsIndisponibles as erreur:
+            raise CommandError(str(erreur))
+        self.stdout.write(self.style.SUCCESS(
+            f"Recommandations de {total} média(s) mises à jour (emprunts depuis le {depuis.isoformat()})."))
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bibliothecaire import statistiques
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les tables de statistiques de circulation depuis les emprunts, sur tout "
+            "l’historique ou sur une période (les classements mensuels sur les mois entiers). "
+            "À lancer après un import d’emprunts en masse ou pour corriger une dérive.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--du', help="Premier jour recalculé (AAAA-MM-JJ).")
+        parser.add_argument('--au', help="Dernier jour recalculé (AAAA-MM-JJ).")
+
+    def handle(self, *args, **options):
+        try:
+            du = options['du'] and date.fromisoformat(options['du'])
+            au = options['au'] and date.fromisoformat(options['au'])
+        except ValueError:
+            raise CommandError("Dates attendues au format AAAA-MM-JJ.")
+        if du and au and du > au:
+            raise CommandError("--du doit précéder --au.")
+        statistiques.recalculer(du, au)
+        self.stdout.write(self.style.SUCCESS("Statistiques recalculées."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from bibliothecaire.services import reconcilier_compteurs
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs d’emprunts des membres (emprunts en cours, prochaine échéance)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=5000,
+                            help="Nombre de membres traités par tranche (défaut : 5000).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Compte les membres à corriger sans rien écrire.")
+
+    def handle(self, *args, **options):
+        corriges = reconcilier_compteurs(taille_lot=options['taille_lot'], corriger=not options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{corriges} membre(s) à corriger.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{corriges} membre(s) corrigé(s)."))
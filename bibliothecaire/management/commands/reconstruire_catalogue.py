@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bibliothecaire import catalogue
+
+
+class Command(BaseCommand):
+    help = "Reconstruit le catalogue dénormalisé à partir des CD, DVD, Livres et jeux de plateau."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=2000,
+                            help="Nombre de lignes insérées par requête (défaut : 2000).")
+
+    def handle(self, *args, **options):
+        total = catalogue.reconstruire(taille_lot=options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(f"Catalogue reconstruit : {total} médias."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bibliothecaire import index_disponibilite
+from bibliothecaire.models import MODELES_MEDIA
+
+
+class Command(BaseCommand):
+    help = ("Reconstruit depuis la base l’index de disponibilité partagé par les workers "
+            "(un tableau de bits par type de média). À lancer au démarrage, avant les workers, "
+            "et après toute modification de la base faite hors de l’application.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('types', nargs='*', help="Types à reconstruire (défaut : tous).")
+
+    def handle(self, *args, **options):
+        inconnus = set(options['types']) - set(MODELES_MEDIA)
+        if inconnus:
+            raise CommandError(f"Type(s) inconnu(s) : {', '.join(sorted(inconnus))}.")
+        for type_media, nombre in index_disponibilite.reconstruire(*options['types']).items():
+            self.stdout.write(f"{type_media} : {nombre} médias disponibles.")
+        self.stdout.write(self.style.SUCCESS("Index de disponibilité reconstruit."))
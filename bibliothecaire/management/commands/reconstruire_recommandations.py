@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bibliothecaire import recommandations
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les recommandations « ils ont aussi emprunté » depuis tout l’historique des "
+            "emprunts (matrice creuse membres × médias, NumPy et SciPy requis) et remplace la table "
+            "d’un bloc. À lancer chaque semaine ; mettre_a_jour_recommandations applique les "
+            "emprunts récents entre deux reconstructions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=recommandations.TAILLE_LOT,
+                            help=f"Lignes insérées par requête (défaut : {recommandations.TAILLE_LOT}).")
+
+    def handle(self, *args, **options):
+        if options['taille_lot'] <= 0:
+            raise CommandError("--taille-lot doit être positif.")
+        debut = time.monotonic()
+        try:
+            total = recommandations.reconstruire(options['taille_lot'])
+        except recommandations.RecommandationsIndisponibles as erreur:
+            raise CommandError(str(erreur))
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} recommandation(s) calculée(s) en {time.monotonic() - debut:.1f} s."))
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ("Copie la base SQLite principale dans la réplique de lecture (settings.BASE_REPLICA), "
+            "une fois ou en boucle. La copie utilise l’API de sauvegarde de SQLite : "
+            "les lecteurs de la réplique voient l’ancienne version jusqu’à la fin de la copie.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vers', help="Fichier de destination (défaut : base de la réplique).")
+        parser.add_argument('--intervalle', type=float, default=0,
+                            help="Recopie toutes les N secondes jusqu’à interruption (défaut : une seule copie).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("La réplication par copie ne concerne que SQLite ; "
+                               "utiliser la réplication native du moteur.")
+        destination = options['vers']
+        if not destination:
+            alias = getattr(settings, 'BASE_REPLICA', None)
+            if alias not in settings.DATABASES:
+                raise CommandError("Aucune réplique configurée (settings.BASE_REPLICA).")
+            destination = settings.DATABASES[alias]['NAME']
+
+        while True:
+            debut = time.monotonic()
+            connection.ensure_connection()
+            cible = sqlite3.connect(destination)
+            try:
+                # Instantané cohérent de la base principale, écrit en une transaction
+                connection.connection.backup(cible)
+            finally:
+                cible.close()
+            self.stdout.write(f"Réplique {destination} copiée en {time.monotonic() - debut:.2f} s.")
+
+            if not options['intervalle']:
+                break
+            connection.close()  # Relâche la base principale entre deux copies
+            time.sleep(options['intervalle'])
@@ -0,0 +1,105 @@
+import csv
+import json
+from datetime import date
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from bibliothecaire.catalogue import type_media_du_contenu
+from bibliothecaire.models import Emprunt
+
+COLONNES = [
+    'emprunt_id', 'membre_id', 'membre', 'email', 'type_media', 'media_id', 'media',
+    'date_emprunt', 'date_retour_prevue', 'jours_de_retard',
+]
+
+
+class Command(BaseCommand):
+    help = ("Parcourt les emprunts en cours dont la date de retour prévue est dépassée, "
+            "écrit un rapport CSV ou JSONL et peut envoyer des rappels par e-mail.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv',
+                            help="Format du rapport (défaut : csv).")
+        parser.add_argument('--sortie', help="Fichier du rapport (défaut : sortie standard).")
+        parser.add_argument('--envoyer-rappels', action='store_true',
+                            help="Envoie un e-mail de rappel par emprunt en retard (backend EMAIL_BACKEND).")
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Date de référence AAAA-MM-JJ (défaut : aujourd’hui).")
+        parser.add_argument('--taille-lot', type=int, default=2000,
+                            help="Nombre d’emprunts lus par lot (défaut : 2000).")
+
+    def handle(self, *args, **options):
+        aujourd_hui = options['date'] or timezone.now().date()
+        taille_lot = options['taille_lot']
+        if taille_lot <= 0:
+            raise CommandError("--taille-lot doit être positif.")
+
+        # Lecture par lots dans l’ordre de l’index (échéance, id) : mémoire constante.
+        # Membres et médias joints : une seule requête par lot.
+        emprunts = (
+            Emprunt.objects.echeance_depassee(aujourd_hui)
+            .select_related('membre', 'media')
+            .order_by('date_retour_prevue', 'id')
+            .iterator(chunk_size=taille_lot)
+        )
+
+        sortie = open(options['sortie'], 'w', newline='', encoding='utf-8') if options['sortie'] else self.stdout
+        connexion_mail = get_connection() if options['envoyer_rappels'] else None
+        rappels = []
+        total = 0
+        try:
+            ecrire = self._ecrivain(sortie, options['format'])
+            for emprunt in emprunts:
+                ligne = self._ligne(emprunt, aujourd_hui)
+                ecrire(ligne)
+                total += 1
+                if connexion_mail:
+                    rappels.append(self._rappel(emprunt, ligne))
+                    if len(rappels) >= taille_lot:
+                        connexion_mail.send_messages(rappels)
+                        rappels = []
+            if rappels:
+                connexion_mail.send_messages(rappels)
+        finally:
+            if sortie is not self.stdout:
+                sortie.close()
+
+        self.stderr.write(self.style.SUCCESS(f"{total} emprunt(s) en retard au {aujourd_hui.isoformat()}."))
+
+    # Renvoie une fonction qui écrit une ligne du rapport dans le format demandé
+    def _ecrivain(self, sortie, format_rapport):
+        if format_rapport == 'jsonl':
+            return lambda ligne: sortie.write(json.dumps(ligne, ensure_ascii=False) + '\n')
+        writer = csv.DictWriter(sortie, fieldnames=COLONNES)
+        writer.writeheader()
+        return writer.writerow
+
+    def _ligne(self, emprunt, aujourd_hui):
+        media = emprunt.media
+        return {
+            'emprunt_id': emprunt.id,
+            'membre_id': emprunt.membre_id,
+            'membre': str(emprunt.membre),
+            'email': emprunt.membre.email,
+            'type_media': type_media_du_contenu(emprunt.content_type_id) if media else '',
+            'media_id': emprunt.media_id,
+            'media': media.name if media else '',
+            'date_emprunt': emprunt.date_emprunt.isoformat(),
+            'date_retour_prevue': emprunt.date_retour_prevue.isoformat(),
+            'jours_de_retard': (aujourd_hui - emprunt.date_retour_prevue).days,
+        }
+
+    def _rappel(self, emprunt, ligne):
+        return EmailMessage(
+            subject=f"Rappel : « {ligne['media']} » à rendre",
+            body=(
+                f"Bonjour {emprunt.membre.prenom},\n\n"
+                f"Le média « {ligne['media']} », emprunté le {emprunt.date_emprunt:%d/%m/%Y}, "
+                f"devait être rendu le {emprunt.date_retour_prevue:%d/%m/%Y} "
+                f"({ligne['jours_de_retard']} jour(s) de retard).\n"
+                f"Merci de le rapporter à la médiathèque.\n"
+            ),
+            to=[emprunt.membre.email],
+        )
@@ -0,0 +1,195 @@
+import random
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from bibliothecaire import disponibilite, index_disponibilite, statistiques
+from bibliothecaire.chargement import creer_emprunts_en_masse, creer_medias_en_masse
+from bibliothecaire.models import (CatalogueMedia, DUREE_EMPRUNT_JOURS, DUREE_RETENUE_JOURS, Emprunt, Media, Membre,
+                                   MODELES_MEDIA, Reservation)
+from bibliothecaire.services import LIMITE_EMPRUNTS_ACTIFS, nb_emprunts_actifs_calcule, prochaine_echeance_calculee
+
+PRENOMS = ["Camille", "Léa", "Hugo", "Louis", "Chloé", "Jules", "Manon", "Arthur", "Inès", "Gabriel",
+           "Emma", "Nathan", "Sarah", "Lucas", "Zoé", "Adam", "Alice", "Raphaël", "Jade", "Noah"]
+NOMS = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau",
+        "Simon", "Laurent", "Lefebvre", "Michel", "Garcia", "David", "Bertrand", "Roux", "Vincent", "Fournier"]
+MOTS = ["nuit", "soleil", "mer", "jardin", "voyage", "silence", "ville", "hiver", "rivière", "lumière",
+        "ombre", "étoile", "forêt", "chemin", "mémoire", "vent", "île", "automne", "miroir", "orage"]
+ADJECTIFS = ["dernier", "grand", "petit", "secret", "long", "bleu", "perdu", "premier", "sauvage", "nouveau"]
+
+# Répartition des médias par type
+PARTS_MEDIAS = {'LIVRE': 0.4, 'CD': 0.25, 'DVD': 0.25, 'JEU': 0.1}
+TYPES_EMPRUNTABLES = ('CD', 'DVD', 'LIVRE')
+
+
+class Command(BaseCommand):
+    help = ("Remplit une base vide avec un jeu de données réaliste pour les mesures de performance : "
+            "membres, médias des quatre types, historique d’emprunts (rendus, en cours, en retard) "
+            "et réservations (files d’attente, médias mis de côté). "
+            "Exemple : DJANGO_DB_NAME=/tmp/bench.sqlite3 manage.py migrate && "
+            "DJANGO_DB_NAME=/tmp/bench.sqlite3 manage.py seed_benchmark")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--membres', type=int, default=100_000, help="Nombre de membres (défaut : 100 000).")
+        parser.add_argument('--medias', type=int, default=500_000, help="Nombre de médias (défaut : 500 000).")
+        parser.add_argument('--emprunts', type=int, default=2_000_000,
+                            help="Nombre d’emprunts, rendus et en cours (défaut : 2 000 000).")
+        parser.add_argument('--part-empruntee', type=float, default=0.1,
+                            help="Part des CD, DVD et livres actuellement empruntés (défaut : 0.1).")
+        parser.add_argument('--reservations', type=int, default=20_000,
+                            help="Nombre de réservations en file d’attente (défaut : 20 000).")
+        parser.add_argument('--graine', type=int, default=42, help="Graine aléatoire (défaut : 42).")
+        parser.add_argument('--taille-lot', type=int, default=50_000, help="Lignes par lot inséré (défaut : 50 000).")
+
+    def handle(self, *args, **options):
+        if Membre.objects.exists() or Media.objects.exists():
+            raise CommandError("La base n’est pas vide : seed_benchmark ne remplit qu’une base neuve "
+                               "(voir DJANGO_DB_NAME).")
+        if options['membres'] <= 0 or options['medias'] <= 0 or options['emprunts'] < 0 or options['reservations'] < 0:
+            raise CommandError("--membres et --medias doivent être positifs, --emprunts et --reservations "
+                               "positifs ou nuls.")
+        self.aleatoire = random.Random(options['graine'])
+        self.aujourd_hui = timezone.localdate()
+        self.taille_lot = options['taille_lot']
+
+        debut = time.monotonic()
+        membres = self._etape("membres", self._creer_membres, options['membres'])
+        # Emprunts en cours plafonnés par le nombre total d’emprunts et la limite par membre
+        max_actifs = min(len(membres) * LIMITE_EMPRUNTS_ACTIFS, options['emprunts'])
+        empruntes, disponibles = self._etape("médias", self._creer_medias, options['medias'],
+                                             options['part_empruntee'], max_actifs)
+        nb_actifs = len(empruntes)
+        self._etape("emprunts", self._creer_emprunts, membres, empruntes,
+                    empruntes + disponibles, options['emprunts'] - nb_actifs)
+        self._etape("compteurs des membres", self._calculer_compteurs)
+        self._etape("réservations", self._creer_reservations, membres, disponibles, options['reservations'])
+        self._etape("index de disponibilité", index_disponibilite.reconstruire)
+        self._etape("statistiques", statistiques.recalculer)
+        disponibilite.invalider()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(membres)} membres, {options['medias']} médias et {options['emprunts']} emprunts "
+            f"({nb_actifs} en cours) créés en {time.monotonic() - debut:.1f} s."
+        ))
+
+    def _etape(self, libelle, fonction, *args):
+        debut = time.monotonic()
+        resultat = fonction(*args)
+        self.stderr.write(f"  {libelle} : {time.monotonic() - debut:.1f} s")
+        return resultat
+
+    def _creer_membres(self, nombre):
+        ids = []
+        for debut in range(0, nombre, self.taille_lot):
+            lot = []
+            for i in range(debut, min(debut + self.taille_lot, nombre)):
+                prenom, nom = self.aleatoire.choice(PRENOMS), self.aleatoire.choice(NOMS)
+                lot.append(Membre(prenom=prenom, nom=nom, email=f"membre{i}@exemple.fr"))
+            ids.extend(membre.pk for membre in Membre.objects.bulk_create(lot, batch_size=5000))
+        return ids
+
+    # Crée les médias par type et renvoie, pour les types empruntables, les médias
+    # empruntés (à qui donner un emprunt en cours) et les autres : (content_type_id, id)
+    def _creer_medias(self, nombre, part_empruntee, max_actifs):
+        empruntes, disponibles = [], []
+        createurs = [f"{p} {n}" for p in PRENOMS for n in NOMS]
+        for type_media, part in PARTS_MEDIAS.items():
+            content_type_id = ContentType.objects.get_for_model(MODELES_MEDIA[type_media]).id
+            total = int(nombre * part) if type_media != 'JEU' else nombre - sum(
+                int(nombre * p) for t, p in PARTS_MEDIAS.items() if t != 'JEU')
+            for debut in range(0, total, self.taille_lot):
+                lignes = []
+                for i in range(debut, min(debut + self.taille_lot, total)):
+                    emprunte = (type_media in TYPES_EMPRUNTABLES and len(empruntes) < max_actifs
+                                and self.aleatoire.random() < part_empruntee)
+                    lignes.append({
+                        'name': f"{self.aleatoire.choice(MOTS).capitalize()} {self.aleatoire.choice(ADJECTIFS)} {i}",
+                        'createur': self.aleatoire.choice(createurs),
+                        'disponible': not emprunte,
+                    })
+                ids = creer_medias_en_masse(type_media, lignes)
+                if type_media in TYPES_EMPRUNTABLES:
+                    for pk, ligne in zip(ids, lignes):
+                        (disponibles if ligne['disponible'] else empruntes).append((content_type_id, pk))
+        return empruntes, disponibles
+
+    def _jours(self, jours):
+        return self.aujourd_hui - timezone.timedelta(days=jours)
+
+    # Emprunts en cours : un par média emprunté, au plus LIMITE_EMPRUNTS_ACTIFS par membre,
+    # dont un sur cinq en retard. Emprunts rendus : sur trois ans, les membres et les médias
+    # les plus actifs revenant plus souvent ; 70 % rendus à temps, 25 % en retard, 5 % très en retard.
+    def _creer_emprunts(self, membres, actifs, medias, nb_rendus):
+        aleatoire = self.aleatoire
+        lignes = []
+        emprunteurs = [pk for pk in membres for _ in range(LIMITE_EMPRUNTS_ACTIFS)]
+        aleatoire.shuffle(emprunteurs)
+        for (content_type_id, media_id), membre_id in zip(actifs, emprunteurs):
+            anciennete = aleatoire.randint(0, DUREE_EMPRUNT_JOURS - 1) if aleatoire.random() < 0.8 \
+                else aleatoire.randint(DUREE_EMPRUNT_JOURS + 1, 60)
+            date_emprunt = self._jours(anciennete)
+            lignes.append((membre_id, content_type_id, media_id, date_emprunt,
+                           date_emprunt + timezone.timedelta(days=DUREE_EMPRUNT_JOURS), None))
+        self._inserer(lignes)
+
+        for debut in range(0, nb_rendus, self.taille_lot):
+            lignes = []
+            for _ in range(min(self.taille_lot, nb_rendus - debut)):
+                membre_id = membres[int(len(membres) * aleatoire.random() ** 2)]
+                content_type_id, media_id = medias[int(len(medias) * aleatoire.random() ** 1.5)]
+                anciennete = aleatoire.randint(1, 3 * 365)
+                tirage = aleatoire.random()
+                if tirage < 0.7:
+                    duree = aleatoire.randint(1, DUREE_EMPRUNT_JOURS)
+                elif tirage < 0.95:
+                    duree = aleatoire.randint(DUREE_EMPRUNT_JOURS + 1, 30)
+                else:
+                    duree = aleatoire.randint(31, 90)
+                date_emprunt = self._jours(anciennete)
+                lignes.append((membre_id, content_type_id, media_id, date_emprunt,
+                               date_emprunt + timezone.timedelta(days=DUREE_EMPRUNT_JOURS),
+                               min(date_emprunt + timezone.timedelta(days=duree), self.aujourd_hui)))
+            self._inserer(lignes)
+
+    def _inserer(self, lignes):
+        if lignes:
+            creer_emprunts_en_masse(lignes, self.taille_lot)
+
+    # Files d’attente de 1 à 5 membres sur des médias empruntés, et une file sur dix dont le
+    # premier attend un média rendu, mis de côté pour lui
+    def _creer_reservations(self, membres, disponibles, nombre):
+        if nombre <= 0:
+            return
+        aleatoire = self.aleatoire
+        actifs = list(Emprunt.objects.actifs().order_by('pk').values_list('media_id', 'membre_id'))
+        aleatoire.shuffle(actifs)
+        reservations, nb_files = [], 0
+        for media_id, emprunteur in actifs:
+            if len(reservations) >= nombre:
+                break
+            candidats = aleatoire.sample(membres, min(len(membres), aleatoire.randint(1, 5)))
+            file = [membre_id for membre_id in candidats if membre_id != emprunteur][:nombre - len(reservations)]
+            reservations.extend(Reservation(membre_id=membre_id, media_id=media_id, rang=rang)
+                                for rang, membre_id in enumerate(file, start=1))
+            nb_files += bool(file)
+
+        expire_le = self.aujourd_hui + timezone.timedelta(days=DUREE_RETENUE_JOURS)
+        nb_retenus = min(len(disponibles), nb_files // 10 or 1)
+        retenus = [media_id for _, media_id in aleatoire.sample(disponibles, nb_retenus)]
+        reservations.extend(Reservation(membre_id=aleatoire.choice(membres), media_id=media_id, rang=1,
+                                        statut=Reservation.RETENUE, expire_le=expire_le) for media_id in retenus)
+        with transaction.atomic():
+            Media.objects.filter(pk__in=retenus).update(disponible=False)
+            CatalogueMedia.objects.filter(media_id__in=retenus).exclude(type_media='JEU').update(disponible=False)
+            Reservation.objects.bulk_create(reservations, batch_size=5000)
+
+    # Compteurs dénormalisés recalculés en une requête, sur les seuls membres concernés
+    def _calculer_compteurs(self):
+        with transaction.atomic():
+            Membre.objects.filter(emprunt__date_retour__isnull=True).distinct().update(
+                nb_emprunts_actifs=nb_emprunts_actifs_calcule(),
+                prochaine_echeance=prochaine_echeance_calculee(),
+            )
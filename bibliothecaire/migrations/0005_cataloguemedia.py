@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+# Remplit le catalogue à partir des médias déjà présents en base
+def remplir_catalogue(apps, schema_editor):
+    CatalogueMedia = apps.get_model('bibliothecaire', 'CatalogueMedia')
+    sources = [
+        ('CD', 'CD', 'artiste'),
+        ('DVD', 'DVD', 'realisateur'),
+        ('LIVRE', 'Livre', 'auteur'),
+        ('JEU', 'JeuDePlateau', 'createur'),
+    ]
+    for type_media, nom_modele, champ_createur in sources:
+        modele = apps.get_model('bibliothecaire', nom_modele)
+        lignes = modele.objects.values_list('pk', 'name', champ_createur, 'disponible').iterator(chunk_size=2000)
+        CatalogueMedia.objects.bulk_create(
+            (CatalogueMedia(type_media=type_media, media_id=pk, name=name,
+                            createur=createur or '', disponible=disponible)
+             for pk, name, createur, disponible in lignes),
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0004_remove_emprunt_media_emprunt_content_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_media', models.CharField(choices=[('CD', 'CD'), ('DVD', 'DVD'), ('LIVRE', 'Livre'), ('JEU', 'Jeu de plateau')], max_length=5)),
+                ('media_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=100)),
+                ('createur', models.CharField(blank=True, max_length=100)),
+                ('disponible', models.BooleanField(default=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'id'], name='catalogue_nom_idx'), models.Index(fields=['createur', 'id'], name='catalogue_createur_idx'), models.Index(fields=['type_media', 'name', 'id'], name='catalogue_type_nom_idx'), models.Index(fields=['type_media', 'createur', 'id'], name='catalogue_type_createur_idx'), models.Index(fields=['type_media', 'disponible', 'name'], name='catalogue_disponible_idx')],
+                'constraints': [models.UniqueConstraint(fields=('type_media', 'media_id'), name='catalogue_type_media_unique')],
+            },
+        ),
+        migrations.RunPython(remplir_catalogue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+
+# Index plein texte FTS5 adossé à la table du catalogue (contenu externe) :
+# seuls les mots sont stockés, les triggers le tiennent à jour ligne par ligne.
+CREER_FTS = [
+    """
+    CREATE VIRTUAL TABLE bibliothecaire_catalogue_fts USING fts5(
+        name, createur, type_media,
+        content='bibliothecaire_cataloguemedia',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER bibliothecaire_catalogue_fts_ai AFTER INSERT ON bibliothecaire_cataloguemedia BEGIN
+        INSERT INTO bibliothecaire_catalogue_fts(rowid, name, createur, type_media)
+        VALUES (new.id, new.name, new.createur, new.type_media);
+    END
+    """,
+    """
+    CREATE TRIGGER bibliothecaire_catalogue_fts_ad AFTER DELETE ON bibliothecaire_cataloguemedia BEGIN
+        INSERT INTO bibliothecaire_catalogue_fts(bibliothecaire_catalogue_fts, rowid, name, createur, type_media)
+        VALUES ('delete', old.id, old.name, old.createur, old.type_media);
+    END
+    """,
+    # Les changements de disponibilité ne touchent pas l’index
+    """
+    CREATE TRIGGER bibliothecaire_catalogue_fts_au
+    AFTER UPDATE OF name, createur, type_media ON bibliothecaire_cataloguemedia BEGIN
+        INSERT INTO bibliothecaire_catalogue_fts(bibliothecaire_catalogue_fts, rowid, name, createur, type_media)
+        VALUES ('delete', old.id, old.name, old.createur, old.type_media);
+        INSERT INTO bibliothecaire_catalogue_fts(rowid, name, createur, type_media)
+        VALUES (new.id, new.name, new.createur, new.type_media);
+    END
+    """,
+    "INSERT INTO bibliothecaire_catalogue_fts(bibliothecaire_catalogue_fts) VALUES ('rebuild')",
+]
+
+SUPPRIMER_FTS = [
+    "DROP TRIGGER IF EXISTS bibliothecaire_catalogue_fts_ai",
+    "DROP TRIGGER IF EXISTS bibliothecaire_catalogue_fts_ad",
+    "DROP TRIGGER IF EXISTS bibliothecaire_catalogue_fts_au",
+    "DROP TABLE IF EXISTS bibliothecaire_catalogue_fts",
+]
+
+
+# FTS5 n’existe que sous SQLite : les autres moteurs se rabattent sur icontains
+def executer(requetes):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in requetes:
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0005_cataloguemedia'),
+    ]
+
+    operations = [
+        migrations.RunPython(executer(CREER_FTS), executer(SUPPRIMER_FTS)),
+    ]
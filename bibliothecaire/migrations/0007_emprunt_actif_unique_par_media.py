@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0006_catalogue_fts'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='emprunt',
+            constraint=models.UniqueConstraint(condition=models.Q(('date_retour__isnull', True)), fields=('content_type', 'object_id'), name='emprunt_actif_unique_par_media'),
+        ),
+    ]
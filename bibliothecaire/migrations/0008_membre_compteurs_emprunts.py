@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Initialise les compteurs à partir des emprunts en cours, en une seule requête
+def initialiser_compteurs(apps, schema_editor):
+    Membre = apps.get_model('bibliothecaire', 'Membre')
+    Emprunt = apps.get_model('bibliothecaire', 'Emprunt')
+    actifs = Emprunt.objects.filter(membre=OuterRef('pk'), date_retour__isnull=True).order_by()
+    Membre.objects.update(
+        nb_emprunts_actifs=Coalesce(Subquery(actifs.values('membre').annotate(n=Count('pk')).values('n')), 0),
+        prochaine_echeance=Subquery(actifs.order_by('date_retour_prevue').values('date_retour_prevue')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0007_emprunt_actif_unique_par_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membre',
+            name='nb_emprunts_actifs',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='membre',
+            name='prochaine_echeance',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(initialiser_compteurs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0008_membre_compteurs_emprunts'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['date_emprunt', 'id'], name='emprunt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('date_retour__isnull', True)), fields=['date_emprunt', 'id'], name='emprunt_actif_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(condition=models.Q(('date_retour__isnull', True)), fields=['membre', 'date_retour_prevue'], name='emprunt_actif_membre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['content_type', 'object_id'], name='emprunt_media_idx'),
+        ),
+    ]
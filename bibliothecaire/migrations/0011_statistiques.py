@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0010_emprunt_actif_echeance_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('type_media', models.CharField(choices=[('CD', 'CD'), ('DVD', 'DVD'), ('LIVRE', 'Livre')], max_length=5)),
+                ('emprunts', models.PositiveIntegerField(default=0)),
+                ('retours', models.PositiveIntegerField(default=0)),
+                ('retours_en_retard', models.PositiveIntegerField(default=0)),
+                ('jours_empruntes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('jour', 'type_media'), name='statistique_jour_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatistiqueMediaMois',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField()),
+                ('type_media', models.CharField(choices=[('CD', 'CD'), ('DVD', 'DVD'), ('LIVRE', 'Livre')], max_length=5)),
+                ('media_id', models.BigIntegerField()),
+                ('emprunts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mois', '-emprunts', 'type_media', 'media_id'], name='statistique_media_rang_idx')],
+                'constraints': [models.UniqueConstraint(fields=('mois', 'type_media', 'media_id'), name='statistique_media_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatistiqueMembreMois',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois', models.DateField()),
+                ('membre_id', models.BigIntegerField()),
+                ('emprunts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mois', '-emprunts', 'membre_id'], name='statistique_membre_rang_idx')],
+                'constraints': [models.UniqueConstraint(fields=('mois', 'membre_id'), name='statistique_membre_unique')],
+            },
+        ),
+    ]
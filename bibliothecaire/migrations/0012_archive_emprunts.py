@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Historique complet : emprunts de la table Emprunt, puis emprunts archivés, avec le même
+# id (archive_loans conserve l’id d’origine, et les ids d’Emprunt ne sont jamais réutilisés)
+CREER_VUE = '''
+    CREATE VIEW bibliothecaire_emprunt_historique AS
+    SELECT id, membre_id, content_type_id, object_id, date_emprunt, date_retour, date_retour_prevue,
+           FALSE AS archive
+    FROM bibliothecaire_emprunt
+    UNION ALL
+    SELECT id, membre_id, content_type_id, object_id, date_emprunt, date_retour, date_retour_prevue,
+           TRUE AS archive
+    FROM bibliothecaire_empruntarchive
+'''
+
+SUPPRIMER_VUE = 'DROP VIEW IF EXISTS bibliothecaire_emprunt_historique'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0011_statistiques'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmpruntArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('date_emprunt', models.DateField()),
+                ('date_retour', models.DateField()),
+                ('date_retour_prevue', models.DateField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('membre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date_emprunt', 'id'], name='archive_date_idx'), models.Index(fields=['content_type', 'object_id'], name='archive_media_idx')],
+            },
+        ),
+        migrations.RunSQL(CREER_VUE, SUPPRIMER_VUE),
+        migrations.CreateModel(
+            name='EmpruntHistorique',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('object_id', models.PositiveIntegerField(null=True)),
+                ('date_emprunt', models.DateField()),
+                ('date_retour', models.DateField(null=True)),
+                ('date_retour_prevue', models.DateField(null=True)),
+                ('archive', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'bibliothecaire_emprunt_historique',
+                'managed': False,
+            },
+        ),
+    ]
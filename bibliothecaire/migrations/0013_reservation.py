@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0012_archive_emprunts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rang', models.PositiveBigIntegerField()),
+                ('statut', models.CharField(choices=[('attente', 'En attente'), ('retenue', 'Mis de côté')], default='attente', max_length=7)),
+                ('date_reservation', models.DateField(auto_now_add=True)),
+                ('expire_le', models.DateField(blank=True, null=True)),
+                ('media', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.media')),
+                ('membre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-statut', 'expire_le', 'media', 'rang'], name='reservation_liste_idx'), models.Index(condition=models.Q(('statut', 'retenue')), fields=['expire_le', 'id'], name='reservation_expiration_idx')],
+                'constraints': [models.UniqueConstraint(fields=('media', 'rang'), name='reservation_rang_unique'), models.UniqueConstraint(fields=('membre', 'media'), name='reservation_unique_par_membre'), models.UniqueConstraint(condition=models.Q(('statut', 'retenue')), fields=('media',), name='reservation_retenue_unique_par_media')],
+            },
+        ),
+    ]
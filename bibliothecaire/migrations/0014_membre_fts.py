@@ -0,0 +1,68 @@
+from django.db import migrations
+
+
+# Index plein texte FTS5 des membres (prénom, nom, e-mail), adossé à la table des membres
+# (contenu externe) et tenu à jour par triggers, comme celui du catalogue (0006). Les
+# préfixes de 2 et 3 caractères sont indexés : la recherche se fait dès la saisie.
+CREER_FTS = [
+    """
+    CREATE VIRTUAL TABLE bibliothecaire_membre_fts USING fts5(
+        prenom, nom, email,
+        content='bibliothecaire_membre',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER bibliothecaire_membre_fts_ai AFTER INSERT ON bibliothecaire_membre BEGIN
+        INSERT INTO bibliothecaire_membre_fts(rowid, prenom, nom, email)
+        VALUES (new.id, new.prenom, new.nom, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER bibliothecaire_membre_fts_ad AFTER DELETE ON bibliothecaire_membre BEGIN
+        INSERT INTO bibliothecaire_membre_fts(bibliothecaire_membre_fts, rowid, prenom, nom, email)
+        VALUES ('delete', old.id, old.prenom, old.nom, old.email);
+    END
+    """,
+    # Les compteurs d’emprunts, modifiés à chaque emprunt et retour, ne touchent pas l’index
+    """
+    CREATE TRIGGER bibliothecaire_membre_fts_au
+    AFTER UPDATE OF prenom, nom, email ON bibliothecaire_membre BEGIN
+        INSERT INTO bibliothecaire_membre_fts(bibliothecaire_membre_fts, rowid, prenom, nom, email)
+        VALUES ('delete', old.id, old.prenom, old.nom, old.email);
+        INSERT INTO bibliothecaire_membre_fts(rowid, prenom, nom, email)
+        VALUES (new.id, new.prenom, new.nom, new.email);
+    END
+    """,
+    "INSERT INTO bibliothecaire_membre_fts(bibliothecaire_membre_fts) VALUES ('rebuild')",
+]
+
+SUPPRIMER_FTS = [
+    "DROP TRIGGER IF EXISTS bibliothecaire_membre_fts_ai",
+    "DROP TRIGGER IF EXISTS bibliothecaire_membre_fts_ad",
+    "DROP TRIGGER IF EXISTS bibliothecaire_membre_fts_au",
+    "DROP TABLE IF EXISTS bibliothecaire_membre_fts",
+]
+
+
+# FTS5 n’existe que sous SQLite : les autres moteurs se rabattent sur istartswith
+def executer(requetes):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in requetes:
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0013_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(executer(CREER_FTS), executer(SUPPRIMER_FTS)),
+    ]
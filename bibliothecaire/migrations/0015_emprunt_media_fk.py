@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Première étape du remplacement de la GenericForeignKey (content_type, object_id) des
+# emprunts par une vraie clé étrangère vers Media : colonne media_id, vide et sans index
+# (créé en 0017, une fois la colonne remplie par 0016).
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0014_membre_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emprunt',
+            name='media',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emprunts', to='bibliothecaire.media'),
+        ),
+        migrations.AddField(
+            model_name='empruntarchive',
+            name='media',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emprunts_archives', to='bibliothecaire.media'),
+        ),
+    ]
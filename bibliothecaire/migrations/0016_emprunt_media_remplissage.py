@@ -0,0 +1,64 @@
+from django.db import migrations, transaction
+
+
+# Emprunts traités par UPDATE (et par transaction) : la migration tient sur des millions
+# d’emprunts sans verrouiller la base d’un bloc
+TAILLE_LOT = 50000
+
+TABLES = ('bibliothecaire_emprunt', 'bibliothecaire_empruntarchive')
+
+# Types de contenu dont l’object_id est l’id d’une ligne de Media (héritage multi-table)
+MODELES_MEDIA = ('cd', 'dvd', 'livre')
+
+
+def _par_lots(schema_editor, table, sql, parametres):
+    connexion = schema_editor.connection
+    with connexion.cursor() as curseur:
+        curseur.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+        debut, fin = curseur.fetchone()
+    if debut is None:
+        return
+    for borne in range(debut, fin + 1, TAILLE_LOT):
+        with transaction.atomic(using=connexion.alias), connexion.cursor() as curseur:
+            curseur.execute(sql, [borne, borne + TAILLE_LOT, *parametres])
+
+
+# media_id = object_id pour les emprunts de CD, DVD et Livre dont le média existe encore ;
+# les emprunts orphelins (média supprimé depuis) restent sans média. Le « + » écarte
+# l’index (content_type, object_id) : chaque lot parcourt sa plage d’ids, rien de plus.
+def remplir_media(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    types = list(ContentType.objects.using(schema_editor.connection.alias)
+                 .filter(app_label='bibliothecaire', model__in=MODELES_MEDIA).values_list('id', flat=True))
+    if not types:
+        return  # Base neuve : aucun emprunt
+    marques = ', '.join(['%s'] * len(types))
+    for table in TABLES:
+        _par_lots(schema_editor, table, f'''
+            UPDATE {table} SET media_id = object_id
+            WHERE id >= %s AND id < %s AND media_id IS NULL
+              AND +content_type_id IN ({marques})
+              AND EXISTS (SELECT 1 FROM bibliothecaire_media m WHERE m.id = object_id)
+        ''', types)
+
+
+def vider_media(apps, schema_editor):
+    for table in TABLES:
+        _par_lots(schema_editor, table, f'''
+            UPDATE {table} SET object_id = COALESCE(object_id, media_id), media_id = NULL
+            WHERE id >= %s AND id < %s
+        ''', [])
+
+
+class Migration(migrations.Migration):
+    # Une transaction par lot plutôt qu’une seule pour toute la migration
+    atomic = False
+
+    dependencies = [
+        ('bibliothecaire', '0015_emprunt_media_fk'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(remplir_media, vider_media),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+# La vue d’historique (0012) lit object_id : elle est recréée sur media_id
+def vue(colonne_media):
+    return f'''
+    CREATE VIEW bibliothecaire_emprunt_historique AS
+    SELECT id, membre_id, content_type_id, {colonne_media}, date_emprunt, date_retour, date_retour_prevue,
+           FALSE AS archive
+    FROM bibliothecaire_emprunt
+    UNION ALL
+    SELECT id, membre_id, content_type_id, {colonne_media}, date_emprunt, date_retour, date_retour_prevue,
+           TRUE AS archive
+    FROM bibliothecaire_empruntarchive
+'''
+
+SUPPRIMER_VUE = 'DROP VIEW IF EXISTS bibliothecaire_emprunt_historique'
+
+
+# Fin du remplacement de la GenericForeignKey : la contrainte « un seul emprunt en cours
+# par média » et les index d’historique passent sur media_id, object_id disparaît.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0016_emprunt_media_remplissage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SUPPRIMER_VUE, vue('object_id')),
+        migrations.RemoveConstraint(
+            model_name='emprunt',
+            name='emprunt_actif_unique_par_media',
+        ),
+        migrations.RemoveIndex(
+            model_name='emprunt',
+            name='emprunt_media_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='empruntarchive',
+            name='archive_media_idx',
+        ),
+        migrations.RemoveField(
+            model_name='emprunt',
+            name='object_id',
+        ),
+        migrations.RemoveField(
+            model_name='empruntarchive',
+            name='object_id',
+        ),
+        migrations.RemoveField(
+            model_name='emprunthistorique',
+            name='object_id',
+        ),
+        migrations.AddIndex(
+            model_name='emprunt',
+            index=models.Index(fields=['media', 'date_emprunt'], name='emprunt_media_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='empruntarchive',
+            index=models.Index(fields=['media', 'date_emprunt'], name='archive_media_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emprunt',
+            constraint=models.UniqueConstraint(condition=models.Q(('date_retour__isnull', True)), fields=('media',), name='emprunt_actif_unique_par_media'),
+        ),
+        migrations.RunSQL(vue('media_id'), SUPPRIMER_VUE),
+    ]
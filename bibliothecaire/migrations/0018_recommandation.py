@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0017_emprunt_media_contraintes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommandation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rang', models.PositiveSmallIntegerField()),
+                ('communs', models.PositiveIntegerField()),
+                ('media', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bibliothecaire.media')),
+                ('voisin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='bibliothecaire.media')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('media', 'rang'), name='recommandation_rang_unique')],
+            },
+        ),
+    ]
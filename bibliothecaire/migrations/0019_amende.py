@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bibliothecaire', '0018_recommandation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amende',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emprunt_id', models.BigIntegerField()),
+                ('type_media', models.CharField(choices=[('CD', 'CD'), ('DVD', 'DVD'), ('LIVRE', 'Livre')], max_length=5)),
+                ('jours_de_retard', models.PositiveIntegerField()),
+                ('montant', models.PositiveIntegerField()),
+                ('definitive', models.BooleanField(default=False)),
+                ('calculee_le', models.DateField()),
+                ('membre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bibliothecaire.membre')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('emprunt_id',), name='amende_emprunt_unique')],
+            },
+        ),
+    ]
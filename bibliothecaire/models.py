@@ -1,26 +1,88 @@
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models.query import ModelIterable
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.contenttypes.fields import GenericForeignKey
 
 # 🔹 Modèle représentant un membre inscrit à la bibliothèque
 class Membre(models.Model):
     prenom = models.CharField(max_length=100)
     nom = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
+    # Compteurs dénormalisés, tenus à jour par services.emprunter / services.rentrer
+    # (et recalculables avec « manage.py reconcilier_compteurs »)
+    nb_emprunts_actifs = models.PositiveIntegerField(default=0)
+    prochaine_echeance = models.DateField(null=True, blank=True)  # Plus proche date de retour prévue
 
     def __str__(self):
         return f"{self.prenom} {self.nom}"  # Affichage lisible du membre dans l’admin ou les logs
 
+    def est_en_retard(self, aujourd_hui=None):
+        aujourd_hui = aujourd_hui or timezone.now().date()
+        return self.prochaine_echeance is not None and self.prochaine_echeance < aujourd_hui
+
+# Itération de MediaQuerySet.concrets() : chaque Media est remplacé par son instance concrète
+class MediaConcretIterable(ModelIterable):
+    def __iter__(self):
+        for media in super().__iter__():
+            yield media.concret()
+
+# 🔹 Requêtes sur les médias, tous types confondus
+class MediaQuerySet(models.QuerySet):
+    # Liens parent → enfant de l’héritage multi-table
+    SOUS_TYPES = ('cd', 'dvd', 'livre')
+
+    # Chemins select_related des sous-types d’un média lié : liens_concrets('media') pour
+    # joindre les tables enfants depuis un emprunt ou une réservation
+    @classmethod
+    def liens_concrets(cls, lien):
+        return tuple(f'{lien}__{sous_type}' for sous_type in cls.SOUS_TYPES)
+
+    def concrets(self):
+        # CD, DVD et Livre avec leurs champs propres (artiste, realisateur, auteur) en une
+        # seule requête : les tables enfants sont jointes en LEFT JOIN
+        if self.model is not Media:
+            return self
+        medias = self.select_related(*self.SOUS_TYPES)
+        medias._iterable_class = MediaConcretIterable
+        return medias
+
 # 🔹 Classe mère Media – base commune pour CD, DVD, Livre
 class Media(models.Model):
     name = models.CharField(max_length=100)
     disponible = models.BooleanField(default=True)
 
+    objects = MediaQuerySet.as_manager()
+
+    # Instance concrète (CD, DVD, Livre), lue dans les liens enfants déjà chargés par
+    # select_related (MediaQuerySet.concrets(), select_related('media__cd', …)) ; sans eux,
+    # une requête par type essayé. Le média lui-même s’il n’a pas de sous-type.
+    def concret(self):
+        if type(self) is not Media:
+            return self
+        for sous_type in MediaQuerySet.SOUS_TYPES:
+            try:
+                return getattr(self, sous_type)
+            except ObjectDoesNotExist:
+                continue
+        return self
+
+    # Artiste, réalisateur ou auteur, selon le type concret
+    @property
+    def createur(self):
+        concret = self.concret()
+        for type_media, modele in MODELES_MEDIA.items():
+            if type(concret) is modele:
+                return getattr(concret, CHAMPS_CREATEUR[type_media])
+        return ''
+
     def emprunter(self):
-        if self.disponible:
+        from .catalogue import changer_disponibilite, type_media_de
+
+        # UPDATE conditionnel : un seul appel concurrent peut passer le média à indisponible
+        if Media.objects.filter(pk=self.pk, disponible=True).update(disponible=False):
             self.disponible = False
-            self.save()
+            changer_disponibilite(type_media_de(self), self.pk, False)
             return True
         return False
 
@@ -39,29 +101,163 @@ class DVD(Media):
 class Livre(Media):
     auteur = models.CharField(max_length=100)  # Champ spécifique : auteur du livre
 
+# Durée standard d’un emprunt (au-delà, l’emprunt est en retard)
+DUREE_EMPRUNT_JOURS = 7
+
+# 🔹 Requêtes réutilisables sur les emprunts (actifs, rendus, en retard)
+class EmpruntQuerySet(models.QuerySet):
+    def actifs(self):
+        return self.filter(date_retour__isnull=True)
+
+    def rendus(self):
+        return self.filter(date_retour__isnull=False)
+
+    def en_retard(self, aujourd_hui=None):
+        # Même règle que dans creer_emprunt : emprunt actif depuis plus de 7 jours
+        aujourd_hui = aujourd_hui or timezone.now().date()
+        limite = aujourd_hui - timezone.timedelta(days=DUREE_EMPRUNT_JOURS)
+        return self.actifs().filter(date_emprunt__lt=limite)
+
+    def echeance_depassee(self, aujourd_hui=None):
+        # Emprunts en cours dont la date de retour prévue est passée
+        aujourd_hui = aujourd_hui or timezone.now().date()
+        return self.actifs().filter(date_retour_prevue__lt=aujourd_hui)
+
 # 🔹 Modèle représentant un emprunt d’un média par un membre
 class Emprunt(models.Model):
     membre = models.ForeignKey('Membre', on_delete=models.CASCADE)
     # Lien vers le membre emprunteur ; suppression en cascade si le membre est supprimé
 
+    media = models.ForeignKey('Media', on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='emprunts', db_index=False)
+    # Média emprunté (CD, DVD ou Livre, via leur table Media commune) ; l’emprunt reste dans
+    # l’historique, sans média, si celui-ci est supprimé. L’index est déclaré dans Meta.
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
-    object_id = models.PositiveIntegerField(null=True, blank=True)
-    media = GenericForeignKey('content_type', 'object_id')
-    # Ces trois champs permettent de lier dynamiquement l'emprunt à un objet de type CD, DVD ou Livre
+    # Type concret du média (CD, DVD, Livre) : évite de joindre les tables enfants pour le connaître
 
     date_emprunt = models.DateField(auto_now_add=True)
     date_retour = models.DateField(null=True, blank=True)
     date_retour_prevue = models.DateField(null=True, blank=True)
 
+    objects = EmpruntQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Un média ne peut avoir qu’un seul emprunt en cours (sert aussi d’index
+            # pour retrouver l’emprunt en cours d’un média)
+            models.UniqueConstraint(
+                fields=['media'],
+                condition=models.Q(date_retour__isnull=True),
+                name='emprunt_actif_unique_par_media',
+            ),
+        ]
+        indexes = [
+            # Liste des emprunts, triée et paginée sur (date_emprunt, id)
+            models.Index(fields=['date_emprunt', 'id'], name='emprunt_date_idx'),
+            # Emprunts en cours triés par date, et emprunts en retard (date_emprunt < ?)
+            models.Index(fields=['date_emprunt', 'id'], condition=models.Q(date_retour__isnull=True),
+                         name='emprunt_actif_date_idx'),
+            # Emprunts en cours dont l’échéance est dépassée (manage.py scan_overdue)
+            models.Index(fields=['date_retour_prevue', 'id'], condition=models.Q(date_retour__isnull=True),
+                         name='emprunt_actif_echeance_idx'),
+            # Emprunts en cours d’un membre, par échéance (compteurs du membre)
+            models.Index(fields=['membre', 'date_retour_prevue'], condition=models.Q(date_retour__isnull=True),
+                         name='emprunt_actif_membre_idx'),
+            # Historique des emprunts d’un média
+            models.Index(fields=['media', 'date_emprunt'], name='emprunt_media_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Définit automatiquement la date de retour prévue si non précisée
         if not self.date_retour_prevue:
-            self.date_retour_prevue = (self.date_emprunt or timezone.now().date()) + timezone.timedelta(days=7)
+            self.date_retour_prevue = (self.date_emprunt or timezone.now().date()) + timezone.timedelta(days=DUREE_EMPRUNT_JOURS)
         super().save(*args, **kwargs)
 
+# 🔹 Emprunts rendus archivés par « manage.py archive_loans » : mêmes colonnes et même id
+# que dans Emprunt, d’où ils ont été déplacés. Emprunt ne garde ainsi que les emprunts
+# en cours et les retours récents.
+class EmpruntArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)  # Id d’origine dans Emprunt
+    membre = models.ForeignKey('Membre', on_delete=models.CASCADE)
+    media = models.ForeignKey('Media', on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='emprunts_archives', db_index=False)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
+    date_emprunt = models.DateField()
+    date_retour = models.DateField()
+    date_retour_prevue = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_emprunt', 'id'], name='archive_date_idx'),
+            models.Index(fields=['media', 'date_emprunt'], name='archive_media_idx'),
+        ]
+
+# 🔹 Historique complet des emprunts : vue SQL (migration 0012) réunissant Emprunt et
+# EmpruntArchive, en lecture seule. Sert les lectures qui portent sur les emprunts rendus
+# (liste, exports, statistiques) ; les emprunts en cours se lisent dans Emprunt.
+class EmpruntHistorique(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    membre = models.ForeignKey('Membre', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    media = models.ForeignKey('Media', on_delete=models.DO_NOTHING, db_constraint=False,
+                              null=True, related_name='+')
+    content_type = models.ForeignKey(ContentType, on_delete=models.DO_NOTHING, db_constraint=False,
+                                     null=True, related_name='+')
+    date_emprunt = models.DateField()
+    date_retour = models.DateField(null=True)
+    date_retour_prevue = models.DateField(null=True)
+    archive = models.BooleanField()  # Ligne lue dans EmpruntArchive
+
+    objects = EmpruntQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = 'bibliothecaire_emprunt_historique'
+
+# Durée pendant laquelle un média rendu reste de côté pour le premier de sa file d’attente
+DUREE_RETENUE_JOURS = 3
+
+# 🔹 Réservation d’un média emprunté : une file d’attente par média, ordonnée par rang.
+# Au retour du média, la tête de file passe « mis de côté » : le média reste indisponible
+# pour les autres jusqu’à expire_le (services.rentrer, « manage.py expirer_reservations »).
+# Une réservation honorée, annulée ou expirée est supprimée.
+class Reservation(models.Model):
+    EN_ATTENTE = 'attente'
+    RETENUE = 'retenue'
+    STATUT_CHOICES = [
+        (EN_ATTENTE, 'En attente'),
+        (RETENUE, 'Mis de côté'),
+    ]
+
+    membre = models.ForeignKey('Membre', on_delete=models.CASCADE)
+    media = models.ForeignKey(Media, on_delete=models.CASCADE)
+    rang = models.PositiveBigIntegerField()  # Position dans la file du média, croissante
+    statut = models.CharField(max_length=7, choices=STATUT_CHOICES, default=EN_ATTENTE)
+    date_reservation = models.DateField(auto_now_add=True)
+    expire_le = models.DateField(null=True, blank=True)  # Dernier jour de la mise de côté
+
+    class Meta:
+        constraints = [
+            # Sert aussi d’index pour lire la tête ou la queue de la file d’un média
+            models.UniqueConstraint(fields=['media', 'rang'], name='reservation_rang_unique'),
+            models.UniqueConstraint(fields=['membre', 'media'], name='reservation_unique_par_membre'),
+            models.UniqueConstraint(fields=['media'], condition=models.Q(statut='retenue'),
+                                    name='reservation_retenue_unique_par_media'),
+        ]
+        indexes = [
+            # Liste des réservations : mises de côté par expiration, puis files par média
+            models.Index(fields=['-statut', 'expire_le', 'media', 'rang'], name='reservation_liste_idx'),
+            # Mises de côté expirées (manage.py expirer_reservations)
+            models.Index(fields=['expire_le', 'id'], condition=models.Q(statut='retenue'),
+                         name='reservation_expiration_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.membre} — {self.media}"
+
 # 🔹 Modèle spécifique pour les jeux de plateau (non empruntables)
 class JeuDePlateau(models.Model):
     name = models.CharField(max_length=100)
+    createur = models.CharField(max_length=100)  # Créateur / éditeur du jeu
     disponible = models.BooleanField(default=True)
 
     def emprunter(self):
@@ -69,3 +265,139 @@ class JeuDePlateau(models.Model):
 
     def __str__(self):
         return self.name  # Représentation textuelle du jeu
+
+
+# Correspondance entre code de type, modèle et champ « créateur » de chaque média
+MODELES_MEDIA = {
+    'CD': CD,
+    'DVD': DVD,
+    'LIVRE': Livre,
+    'JEU': JeuDePlateau,
+}
+CHAMPS_CREATEUR = {
+    'CD': 'artiste',
+    'DVD': 'realisateur',
+    'LIVRE': 'auteur',
+    'JEU': 'createur',
+}
+
+# 🔹 Catalogue dénormalisé : une ligne par média, tous types confondus.
+# Tenu à jour par les signaux (voir signals.py) et reconstructible avec
+# « manage.py reconstruire_catalogue ».
+class CatalogueMedia(models.Model):
+    TYPE_CHOICES = [
+        ('CD', 'CD'),
+        ('DVD', 'DVD'),
+        ('LIVRE', 'Livre'),
+        ('JEU', 'Jeu de plateau'),
+    ]
+
+    type_media = models.CharField(max_length=5, choices=TYPE_CHOICES)
+    media_id = models.BigIntegerField()  # Clé primaire du CD / DVD / Livre / JeuDePlateau
+    name = models.CharField(max_length=100)
+    createur = models.CharField(max_length=100, blank=True)  # Artiste, réalisateur, auteur ou créateur
+    disponible = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['type_media', 'media_id'], name='catalogue_type_media_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['name', 'id'], name='catalogue_nom_idx'),
+            models.Index(fields=['createur', 'id'], name='catalogue_createur_idx'),
+            models.Index(fields=['type_media', 'name', 'id'], name='catalogue_type_nom_idx'),
+            models.Index(fields=['type_media', 'createur', 'id'], name='catalogue_type_createur_idx'),
+            models.Index(fields=['type_media', 'disponible', 'name'], name='catalogue_disponible_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+# 🔹 Statistiques de circulation agrégées, tenues à jour à chaque emprunt et retour par
+# statistiques.compter_emprunt / compter_retour, et recalculables avec
+# « manage.py recalculer_statistiques ». Le tableau de bord ne lit que ces tables.
+TYPES_EMPRUNTABLES = [choix for choix in CatalogueMedia.TYPE_CHOICES if choix[0] != 'JEU']
+
+
+# Par jour et par type de média
+class StatistiqueJour(models.Model):
+    jour = models.DateField()
+    type_media = models.CharField(max_length=5, choices=TYPES_EMPRUNTABLES)
+    emprunts = models.PositiveIntegerField(default=0)  # Emprunts commencés ce jour
+    retours = models.PositiveIntegerField(default=0)  # Emprunts rendus ce jour
+    retours_en_retard = models.PositiveIntegerField(default=0)  # Rendus après la date prévue
+    jours_empruntes = models.PositiveIntegerField(default=0)  # Durée cumulée des emprunts rendus ce jour
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'type_media'], name='statistique_jour_unique'),
+        ]
+
+
+# Emprunts par média et par mois (classement des titres)
+class StatistiqueMediaMois(models.Model):
+    mois = models.DateField()  # Premier jour du mois
+    type_media = models.CharField(max_length=5, choices=TYPES_EMPRUNTABLES)
+    media_id = models.BigIntegerField()
+    emprunts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mois', 'type_media', 'media_id'], name='statistique_media_unique'),
+        ]
+        indexes = [
+            # Classement d’un mois lu dans l’ordre de l’index
+            models.Index(fields=['mois', '-emprunts', 'type_media', 'media_id'], name='statistique_media_rang_idx'),
+        ]
+
+
+# Emprunts par membre et par mois. Sans clé étrangère : l’historique d’un membre
+# supprimé reste compté.
+class StatistiqueMembreMois(models.Model):
+    mois = models.DateField()  # Premier jour du mois
+    membre_id = models.BigIntegerField()
+    emprunts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mois', 'membre_id'], name='statistique_membre_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['mois', '-emprunts', 'membre_id'], name='statistique_membre_rang_idx'),
+        ]
+
+
+# 🔹 Recommandations « ils ont aussi emprunté » : pour chaque média, les médias le plus
+# souvent empruntés par les mêmes membres, du rang 1 au rang NB_VOISINS (recommandations.py,
+# « manage.py reconstruire_recommandations » et « mettre_a_jour_recommandations »)
+class Recommandation(models.Model):
+    media = models.ForeignKey(Media, on_delete=models.CASCADE, related_name='+', db_index=False)
+    rang = models.PositiveSmallIntegerField()  # 1 : le plus souvent emprunté avec le média
+    voisin = models.ForeignKey(Media, on_delete=models.CASCADE, related_name='+')
+    communs = models.PositiveIntegerField()  # Membres ayant emprunté les deux médias
+
+    class Meta:
+        constraints = [
+            # Sert aussi d’index : les recommandations d’un média se lisent dans l’ordre
+            models.UniqueConstraint(fields=['media', 'rang'], name='recommandation_rang_unique'),
+        ]
+
+
+# 🔹 Amende de retard d’un emprunt, calculée par « manage.py compute_fines » (amendes.py)
+# selon le tarif du type de média. Tant que le média n’est pas rendu, l’amende est
+# provisoire et recalculée à chaque passage ; au retour, elle devient définitive.
+# Sans clé étrangère vers l’emprunt : il peut passer dans EmpruntArchive, avec le même id.
+class Amende(models.Model):
+    emprunt_id = models.BigIntegerField()  # Id de l’emprunt (Emprunt ou EmpruntArchive)
+    membre = models.ForeignKey('Membre', on_delete=models.CASCADE)
+    type_media = models.CharField(max_length=5, choices=TYPES_EMPRUNTABLES)
+    jours_de_retard = models.PositiveIntegerField()  # Jours après la date de retour prévue
+    montant = models.PositiveIntegerField()  # En centimes
+    definitive = models.BooleanField(default=False)  # Emprunt rendu : le montant ne change plus
+    calculee_le = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['emprunt_id'], name='amende_emprunt_unique'),
+        ]
@@ -0,0 +1,184 @@
+# Recommandations « ils ont aussi emprunté » : deux médias sont voisins quand des membres
+# les ont empruntés tous les deux. Les co-emprunts se calculent sur une matrice creuse
+# membres × médias (NumPy/SciPy) ; seuls les NB_VOISINS plus fréquents de chaque média
+# sont rangés dans la table Recommandation, que la fiche d’un média lit en une requête
+# sur l’index (media, rang).
+#  - reconstruire() : tout l’historique des emprunts, archives comprises
+#    (« manage.py reconstruire_recommandations ») ;
+#  - mettre_a_jour(depuis) : seulement les médias touchés par les emprunts commencés depuis
+#    une date (« manage.py mettre_a_jour_recommandations », chaque nuit). Un nouvel emprunt
+#    ne fait que croître des co-emprunts : les lignes des médias empruntés sont recalculées
+#    et leurs nouveaux compteurs reportés dans les listes de leurs voisins.
+from django.db import transaction
+
+from .chargement import inserer_lignes
+from .models import Emprunt, EmpruntHistorique, MediaQuerySet, Recommandation
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Dépendances optionnelles : seul le calcul les exige
+    np = sparse = None
+
+# Voisins gardés par média
+NB_VOISINS = 10
+
+# Membres en commun en dessous desquels deux médias ne sont pas voisins
+MIN_COMMUNS = 2
+
+# Médias dont les co-emprunts sont calculés ensemble : borne la mémoire du produit matriciel
+TAILLE_BLOC = 2000
+
+# Lignes lues et écrites par lot
+TAILLE_LOT = 10000
+
+CHAMPS = ('media', 'rang', 'voisin', 'communs')
+
+
+# Levée quand NumPy ou SciPy manque (message affichable)
+class RecommandationsIndisponibles(RuntimeError):
+    pass
+
+
+# Voisins d’un média, du plus au moins souvent emprunté avec lui : une requête sur
+# l’index (media, rang), médias voisins joints avec leur sous-type
+def voisins(media_id, limite=NB_VOISINS):
+    recommandations = Recommandation.objects.filter(media=media_id, rang__lte=limite)
+    return list(recommandations.select_related(*MediaQuerySet.liens_concrets('voisin')).order_by('rang'))
+
+
+# Recalcule toutes les recommandations depuis l’historique des emprunts. Le calcul se
+# fait hors transaction ; la table est remplacée d’un bloc. Renvoie le nombre de lignes.
+def reconstruire(taille_lot=TAILLE_LOT):
+    _verifier_dependances()
+    matrice, ids_medias, _ = _matrice(EmpruntHistorique.objects.filter(media__isnull=False))
+    lignes = list(_recommandations(matrice, ids_medias, np.arange(len(ids_medias))))
+    with transaction.atomic():
+        Recommandation.objects.all().delete()
+        return inserer_lignes(Recommandation, CHAMPS, _tuples(lignes), taille_lot)
+
+
+# Applique les emprunts commencés depuis une date : les listes des médias empruntés sont
+# recalculées, celles de leurs voisins reçoivent les nouveaux compteurs. Relancer sur la
+# même période ne change rien. Renvoie le nombre de médias dont la liste a été réécrite.
+def mettre_a_jour(depuis, taille_lot=TAILLE_LOT):
+    _verifier_dependances()
+    nouveaux = Emprunt.objects.filter(date_emprunt__gte=depuis, media__isnull=False)
+    # Historique complet des membres ayant emprunté ces médias : leurs co-emprunts sont exacts
+    emprunteurs = EmpruntHistorique.objects.filter(media__in=nouveaux.values('media')).values('membre')
+    matrice, ids_medias, ids_membres = _matrice(
+        EmpruntHistorique.objects.filter(membre__in=emprunteurs, media__isnull=False))
+    if not len(ids_medias):
+        return 0
+
+    empruntes = np.searchsorted(ids_medias, np.unique(list(nouveaux.values_list('media', flat=True))))
+    lignes = list(_recommandations(matrice, ids_medias, empruntes))
+
+    # Médias empruntés aussi par les membres des nouveaux emprunts : ceux dont un compteur
+    # a pu croître avec un média emprunté
+    membres_nouveaux = np.searchsorted(ids_membres, np.unique(list(nouveaux.values_list('membre', flat=True))))
+    touches = np.setdiff1d(np.unique(matrice[membres_nouveaux].indices), empruntes)
+    reports = _co_emprunts(matrice, empruntes, touches)
+    listes = _fusionner(_listes(ids_medias[touches]), ids_medias, reports)
+
+    lignes_voisins = [
+        (media_id, rang, voisin, communs)
+        for media_id, liste in listes.items()
+        for rang, (voisin, communs) in enumerate(liste, start=1)
+    ]
+    medias_reecrits = [*ids_medias[empruntes].tolist(), *listes]
+    with transaction.atomic():
+        for debut in range(0, len(medias_reecrits), 500):
+            Recommandation.objects.filter(media__in=medias_reecrits[debut:debut + 500]).delete()
+        inserer_lignes(Recommandation, CHAMPS, _tuples(lignes), taille_lot)
+        inserer_lignes(Recommandation, CHAMPS, lignes_voisins, taille_lot)
+    return len(medias_reecrits)
+
+
+def _verifier_dependances():
+    if np is None:
+        raise RecommandationsIndisponibles(
+            "Le calcul des recommandations demande NumPy et SciPy (pip install numpy scipy).")
+
+
+# Matrice creuse membres × médias (1 : le membre a emprunté le média au moins une fois)
+# d’un queryset d’emprunts, lu par lots ; avec les ids de ses colonnes et de ses lignes, triés
+def _matrice(emprunts):
+    blocs = [np.array(lot, dtype=np.int64).reshape(-1, 2)
+             for lot in _par_lots(emprunts.order_by().values_list('membre', 'media'))]
+    paires = np.concatenate(blocs) if blocs else np.empty((0, 2), dtype=np.int64)
+    ids_membres, lignes = np.unique(paires[:, 0], return_inverse=True)
+    ids_medias, colonnes = np.unique(paires[:, 1], return_inverse=True)
+    matrice = sparse.csr_matrix((np.ones(len(paires), dtype=np.int32), (lignes, colonnes)),
+                                shape=(len(ids_membres), len(ids_medias)))
+    matrice.data[:] = 1  # Emprunts répétés du même média par le même membre
+    return matrice, ids_medias, ids_membres
+
+
+def _par_lots(requete):
+    lot = []
+    for ligne in requete.iterator(chunk_size=TAILLE_LOT):
+        lot.append(ligne)
+        if len(lot) == TAILLE_LOT:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+# Co-emprunts (médias lignes × médias colonnes, indices de la matrice), par blocs de
+# lignes : tableaux (ligne, colonne, membres en commun), sans le média lui-même ni les
+# paires sous MIN_COMMUNS
+def _co_emprunts(matrice, lignes, colonnes=None):
+    transposee = matrice.T.tocsr()  # Médias × membres
+    cible = matrice if colonnes is None else matrice[:, colonnes]
+    for debut in range(0, len(lignes), TAILLE_BLOC):
+        bloc = lignes[debut:debut + TAILLE_BLOC]
+        produit = (transposee[bloc] @ cible).tocoo()
+        i = bloc[produit.row]
+        j = produit.col if colonnes is None else colonnes[produit.col]
+        garder = (produit.data >= MIN_COMMUNS) & (i != j)
+        yield i[garder], j[garder], produit.data[garder]
+
+
+# Les NB_VOISINS voisins de chaque média ligne, par bloc : tableaux (media, rang, voisin,
+# communs) en ids de médias. Ordre : plus de membres en commun, puis plus petit id.
+def _recommandations(matrice, ids_medias, lignes):
+    for i, j, communs in _co_emprunts(matrice, lignes):
+        ordre = np.lexsort((j, -communs, i))
+        i, j, communs = i[ordre], j[ordre], communs[ordre]
+        rangs = np.arange(len(i)) - np.searchsorted(i, i) + 1
+        garder = rangs <= NB_VOISINS
+        yield ids_medias[i[garder]], rangs[garder], ids_medias[j[garder]], communs[garder]
+
+
+def _tuples(blocs):
+    for colonnes in blocs:
+        yield from zip(*(colonne.tolist() for colonne in colonnes))
+
+
+# Listes enregistrées des médias donnés : {media_id: {voisin_id: communs}}
+def _listes(medias):
+    listes = {media_id: {} for media_id in medias.tolist()}
+    for debut in range(0, len(medias), 500):
+        recommandations = Recommandation.objects.filter(media__in=medias[debut:debut + 500].tolist())
+        for media_id, voisin, communs in recommandations.values_list('media', 'voisin', 'communs'):
+            listes[media_id][voisin] = communs
+    return listes
+
+
+# Reporte les co-emprunts recalculés (médias empruntés × médias touchés) dans les listes
+# des médias touchés ; ne renvoie que les listes modifiées, triées et tronquées
+def _fusionner(listes, ids_medias, reports):
+    modifiees = {}
+    for i, j, communs in reports:
+        for media_id, voisin, n in zip(ids_medias[j].tolist(), ids_medias[i].tolist(), communs.tolist()):
+            liste = modifiees.setdefault(media_id, dict(listes[media_id]))
+            liste[voisin] = n
+    resultat = {}
+    for media_id, liste in modifiees.items():
+        nouvelle = sorted(liste.items(), key=lambda voisin: (-voisin[1], voisin[0]))[:NB_VOISINS]
+        ancienne = sorted(listes[media_id].items(), key=lambda voisin: (-voisin[1], voisin[0]))
+        if nouvelle != ancienne:
+            resultat[media_id] = nouvelle
+    return resultat
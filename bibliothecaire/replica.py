@@ -0,0 +1,97 @@
+# Lecture sur réplique : les vues marquées @lecture_sur_replica (catalogue public, listes)
+# lisent les modèles de l’application dans la base settings.BASE_REPLICA, tenue à jour par
+# « manage.py repliquer_base ». Toutes les écritures vont à la base principale.
+#  - Après une écriture (POST...), la session lit la base principale pendant
+#    DELAI_LECTURE_APRES_ECRITURE secondes, pour voir ses propres modifications.
+#  - Une réplique absente ou en erreur est écartée pendant DELAI_VERIFICATION_REPLICA
+#    secondes : les lectures retombent sur la base principale.
+import os
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+# Applications dont les lectures peuvent partir sur la réplique. Les sessions et
+# l’authentification restent sur la base principale.
+APPS_REPLIQUEES = {'bibliothecaire'}
+
+CLE_SESSION_ECRITURE = 'replica:derniere_ecriture'
+
+DELAI_VERIFICATION_REPLICA = 5
+
+# Base de lecture de la requête en cours (None : base principale)
+_base_lecture = ContextVar('base_lecture', default=None)
+
+# État de la réplique mis en cache dans le processus : (disponible, vérifié jusqu’à)
+_etat_replica = {'disponible': False, 'jusqu_a': 0.0}
+
+
+# Marque une vue dont les lectures peuvent être servies par la réplique
+def lecture_sur_replica(vue):
+    vue.lecture_sur_replica = True
+    return vue
+
+
+# La réplique est-elle configurée, déjà copiée et joignable ? Une base SQLite absente
+# (jamais répliquée) ou en mémoire (tests) n’est jamais utilisée.
+def replica_disponible():
+    maintenant = time.monotonic()
+    if maintenant < _etat_replica['jusqu_a']:
+        return _etat_replica['disponible']
+
+    alias = getattr(settings, 'BASE_REPLICA', None)
+    disponible = False
+    if alias in settings.DATABASES:
+        connexion = connections[alias]
+        if connexion.vendor != 'sqlite' or os.path.isfile(connexion.settings_dict['NAME']):
+            try:
+                with connexion.cursor() as cursor:
+                    cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+                disponible = True
+            except DatabaseError:
+                connexion.close()
+    _etat_replica.update(disponible=disponible, jusqu_a=maintenant + DELAI_VERIFICATION_REPLICA)
+    return disponible
+
+
+class RouteurReplica:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in APPS_REPLIQUEES:
+            return _base_lecture.get()
+        return None
+
+    # Toujours la base principale, y compris pour un objet lu sur la réplique
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Mêmes données des deux côtés
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == getattr(settings, 'BASE_REPLICA', None):
+            return False  # La réplique reçoit le schéma par copie
+        return None
+
+
+# Choisit la base de lecture de chaque requête (après SessionMiddleware)
+class ReplicaMiddleware(MiddlewareMixin):
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            request.session[CLE_SESSION_ECRITURE] = time.time()
+        elif getattr(view_func, 'lecture_sur_replica', False) and self._peut_lire_replica(request):
+            _base_lecture.set(settings.BASE_REPLICA)
+        return None
+
+    def process_response(self, request, response):
+        _base_lecture.set(None)
+        return response
+
+    def _peut_lire_replica(self, request):
+        derniere_ecriture = request.session.get(CLE_SESSION_ECRITURE, 0)
+        if time.time() - derniere_ecriture < settings.DELAI_LECTURE_APRES_ECRITURE:
+            return False
+        return replica_disponible()
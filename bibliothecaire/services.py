@@ -0,0 +1,211 @@
+# Emprunt, retour et réservation de médias : chaque opération tient dans une seule
+# transaction et s’appuie sur des UPDATE conditionnels, pour rester correcte quand
+# plusieurs postes de prêt travaillent en même temps.
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from . import catalogue, statistiques
+from .models import Emprunt, Media, Membre, Reservation, DUREE_EMPRUNT_JOURS, DUREE_RETENUE_JOURS
+
+# Nombre maximal d’emprunts en cours par membre
+LIMITE_EMPRUNTS_ACTIFS = 3
+
+
+# Levée quand une règle métier refuse l’emprunt ou le retour (message affichable)
+class EmpruntRefuse(Exception):
+    pass
+
+
+# Levée quand une réservation est refusée (message affichable)
+class ReservationRefusee(Exception):
+    pass
+
+
+# Enregistre l’emprunt d’un média par un membre et renvoie l’Emprunt créé
+def emprunter(membre, media):
+    # Les jeux de plateau ne dérivent pas de Media : ils ne s’empruntent pas
+    if not isinstance(media, Media):
+        raise EmpruntRefuse("Impossible d'emprunter un jeu de plateau.")
+
+    aujourd_hui = timezone.now().date()
+    date_retour_prevue = aujourd_hui + timezone.timedelta(days=DUREE_EMPRUNT_JOURS)
+    try:
+        with transaction.atomic():
+            # Réserve le média : un seul poste peut passer disponible de True à False.
+            # C’est aussi la première écriture, qui sérialise la suite de la transaction.
+            if not Media.objects.filter(pk=media.pk, disponible=True).update(disponible=False):
+                # Média mis de côté pour ce membre : l’emprunt honore sa réservation
+                retenue = Reservation.objects.filter(media=media.pk, membre=membre, statut=Reservation.RETENUE)
+                if not retenue.delete()[0]:
+                    raise EmpruntRefuse("Ce média n'est pas disponible.")
+
+            # Règles « 3 emprunts au plus » et « aucun retard » vérifiées sur les compteurs
+            # du membre, dans le même UPDATE qui les incrémente
+            echeance = Value(date_retour_prevue, output_field=DateField())
+            eligible = Membre.objects.filter(
+                Q(prochaine_echeance__isnull=True) | Q(prochaine_echeance__gte=aujourd_hui),
+                pk=membre.pk,
+                nb_emprunts_actifs__lt=LIMITE_EMPRUNTS_ACTIFS,
+            )
+            if not eligible.update(
+                nb_emprunts_actifs=F('nb_emprunts_actifs') + 1,
+                prochaine_echeance=Least(Coalesce('prochaine_echeance', echeance), echeance),
+            ):
+                membre.refresh_from_db(fields=['nb_emprunts_actifs', 'prochaine_echeance'])
+                if membre.nb_emprunts_actifs >= LIMITE_EMPRUNTS_ACTIFS:
+                    raise EmpruntRefuse("Ce membre a déjà 3 emprunts en cours.")
+                raise EmpruntRefuse("Ce membre a un emprunt en retard, il ne peut pas emprunter.")
+
+            emprunt = Emprunt.objects.create(
+                membre=membre,
+                media_id=media.pk,
+                content_type=ContentType.objects.get_for_model(media),
+                date_retour_prevue=date_retour_prevue,
+            )
+            catalogue.changer_disponibilite(catalogue.type_media_de(media), media.pk, False)
+            statistiques.compter_emprunt(emprunt, catalogue.type_media_de(media))
+    except IntegrityError:
+        # Contrainte « un seul emprunt actif par média » (incohérence avec disponible)
+        raise EmpruntRefuse("Ce média est déjà emprunté.")
+
+    media.disponible = False
+    return emprunt
+
+
+# Enregistre le retour d’un emprunt et remet le média à disposition
+def rentrer(emprunt, date_retour=None):
+    date_retour = date_retour or timezone.now().date()
+    with transaction.atomic():
+        # Un seul retour possible, même en cas de double soumission
+        if not Emprunt.objects.filter(pk=emprunt.pk, date_retour__isnull=True).update(date_retour=date_retour):
+            raise EmpruntRefuse("Cet emprunt a déjà été rentré.")
+        Membre.objects.filter(pk=emprunt.membre_id).update(
+            nb_emprunts_actifs=Greatest(F('nb_emprunts_actifs') - 1, 0),
+            prochaine_echeance=prochaine_echeance_calculee(),
+        )
+        type_media = catalogue.type_media_du_contenu(emprunt.content_type_id)
+        # Emprunt d’un média supprimé depuis : rien à remettre en circulation, mais le
+        # retour compte dans les statistiques, comme dans statistiques.recalculer
+        if emprunt.media_id is not None:
+            _remettre_en_circulation(emprunt.media_id, type_media)
+        if type_media is not None:
+            statistiques.compter_retour(emprunt, type_media, date_retour)
+    emprunt.date_retour = date_retour
+    return emprunt
+
+
+# Média qui n’est plus emprunté ni mis de côté : mis de côté pour le premier de sa file
+# d’attente s’il y en a un, disponible sinon
+def _remettre_en_circulation(media_id, type_media=None, aujourd_hui=None):
+    if _mettre_de_cote(media_id, aujourd_hui or timezone.now().date()):
+        return
+    if Media.objects.filter(pk=media_id).update(disponible=True):
+        catalogue.changer_disponibilite(type_media, media_id, True)
+
+
+# Met le média de côté pour la tête de sa file, en une requête : la tête est lue dans
+# l’index (media, rang), quelle que soit la longueur de la file. False si la file est vide.
+def _mettre_de_cote(media_id, aujourd_hui):
+    tete = Reservation.objects.filter(media=media_id, statut=Reservation.EN_ATTENTE).order_by('rang').values('pk')[:1]
+    return bool(Reservation.objects.filter(pk=Subquery(tete)).update(
+        statut=Reservation.RETENUE,
+        expire_le=aujourd_hui + timezone.timedelta(days=DUREE_RETENUE_JOURS),
+    ))
+
+
+# Inscrit un membre à la fin de la file d’attente d’un média emprunté
+def reserver(membre, media):
+    if not isinstance(media, Media):
+        raise ReservationRefusee("Impossible de réserver un jeu de plateau.")
+    # Deux réservations simultanées peuvent lire la même fin de file : les contraintes
+    # uniques refusent la seconde, qui recommence avec la file à jour
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                if Media.objects.filter(pk=media.pk, disponible=True).exists():
+                    raise ReservationRefusee("Ce média est disponible : il peut être emprunté directement.")
+                emprunt_en_cours = Emprunt.objects.actifs().filter(membre=membre, media=media.pk)
+                if emprunt_en_cours.exists():
+                    raise ReservationRefusee("Ce membre a déjà ce média en cours d'emprunt.")
+                file = Reservation.objects.filter(media=media.pk)
+                if file.filter(membre=membre).exists():
+                    raise ReservationRefusee("Ce membre a déjà réservé ce média.")
+                dernier = file.order_by('-rang').values_list('rang', flat=True).first()
+                return Reservation.objects.create(membre=membre, media_id=media.pk, rang=(dernier or 0) + 1)
+        except IntegrityError:
+            continue
+    raise ReservationRefusee("La file d'attente de ce média est très sollicitée, réessayer.")
+
+
+# Annule une réservation ; un média mis de côté passe au suivant de la file
+def annuler_reservation(reservation):
+    with transaction.atomic():
+        if Reservation.objects.filter(pk=reservation.pk, statut=Reservation.RETENUE).delete()[0]:
+            _remettre_en_circulation(reservation.media_id)
+        else:
+            Reservation.objects.filter(pk=reservation.pk).delete()
+
+
+# Supprime les mises de côté expirées, par lots, et passe chaque média au suivant de sa
+# file ou le rend disponible. Renvoie le nombre de réservations expirées.
+def expirer_reservations(aujourd_hui=None, taille_lot=500):
+    aujourd_hui = aujourd_hui or timezone.now().date()
+    total = 0
+    while True:
+        with transaction.atomic():
+            expirees = list(
+                Reservation.objects.filter(statut=Reservation.RETENUE, expire_le__lt=aujourd_hui)
+                .order_by('expire_le', 'id').values_list('pk', 'media_id')[:taille_lot]
+            )
+            if not expirees:
+                return total
+            Reservation.objects.filter(pk__in=[pk for pk, _ in expirees]).delete()
+            for _, media_id in expirees:
+                _remettre_en_circulation(media_id, aujourd_hui=aujourd_hui)
+        total += len(expirees)
+
+
+# Expressions recalculant les compteurs d’un membre depuis ses emprunts en cours
+def _emprunts_actifs_du_membre():
+    return Emprunt.objects.filter(membre=OuterRef('pk')).actifs().order_by()
+
+
+def nb_emprunts_actifs_calcule():
+    return Coalesce(Subquery(
+        _emprunts_actifs_du_membre().values('membre').annotate(n=Count('pk')).values('n')
+    ), 0)
+
+
+def prochaine_echeance_calculee():
+    return Subquery(
+        _emprunts_actifs_du_membre().order_by('date_retour_prevue').values('date_retour_prevue')[:1]
+    )
+
+
+# Corrige les compteurs des membres qui ont dérivé, par tranches d’id.
+# Renvoie le nombre de membres corrigés (rien n’est écrit si corriger=False).
+def reconcilier_compteurs(taille_lot=5000, corriger=True):
+    corriges = 0
+    dernier_id = 0
+    while True:
+        tranche = list(
+            Membre.objects.filter(pk__gt=dernier_id).order_by('pk')
+            .annotate(nb_calcule=nb_emprunts_actifs_calcule(), echeance_calculee=prochaine_echeance_calculee())
+            .only('pk', 'nb_emprunts_actifs', 'prochaine_echeance')[:taille_lot]
+        )
+        if not tranche:
+            return corriges
+        dernier_id = tranche[-1].pk
+
+        derives = []
+        for membre in tranche:
+            if (membre.nb_emprunts_actifs, membre.prochaine_echeance) != (membre.nb_calcule, membre.echeance_calculee):
+                membre.nb_emprunts_actifs = membre.nb_calcule
+                membre.prochaine_echeance = membre.echeance_calculee
+                derives.append(membre)
+        if corriger and derives:
+            Membre.objects.bulk_update(derives, ['nb_emprunts_actifs', 'prochaine_echeance'])
+        corriges += len(derives)
@@ -0,0 +1,66 @@
+# Synchronisation du catalogue dénormalisé et des versions de disponibilité
+# sur les sauvegardes / suppressions de médias, et remise en circulation des
+# médias mis de côté pour un membre supprimé
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import catalogue, disponibilite, index_disponibilite, services
+from .models import Media, CatalogueMedia, Membre, Reservation, MODELES_MEDIA
+
+
+# Sauvegarde d’un CD, DVD, Livre ou jeu de plateau : mise à jour de sa ligne
+def media_enregistre(sender, instance, raw=False, **kwargs):
+    if raw:
+        return  # Chargement de fixtures : le catalogue sera reconstruit
+    type_media = catalogue.type_media_de(sender)
+    catalogue.synchroniser(type_media, instance)
+    disponibilite.invalider(type_media)
+    index_disponibilite.marquer(type_media, [instance.pk], instance.disponible)
+
+
+# Suppression d’un CD, DVD, Livre ou jeu de plateau : suppression de sa ligne
+def media_supprime(sender, instance, **kwargs):
+    type_media = catalogue.type_media_de(sender)
+    catalogue.retirer(type_media, instance.pk)
+    disponibilite.invalider(type_media)
+    index_disponibilite.marquer(type_media, [instance.pk], False)
+
+
+for modele in MODELES_MEDIA.values():
+    post_save.connect(media_enregistre, sender=modele, dispatch_uid=f'catalogue_save_{modele.__name__}')
+    post_delete.connect(media_supprime, sender=modele, dispatch_uid=f'catalogue_delete_{modele.__name__}')
+
+
+# Sauvegarde directe d’un Media (sans passer par la sous-classe) : le type n’est pas
+# connu, on met à jour la ligne CD / DVD / Livre correspondant à cet id
+@receiver(post_save, sender=Media, dispatch_uid='catalogue_save_media')
+def media_parent_enregistre(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    catalogue.marquer_media_parent(instance.pk, instance.disponible)
+    CatalogueMedia.objects.filter(media_id=instance.pk).exclude(type_media='JEU').update(
+        name=instance.name,
+        disponible=instance.disponible,
+    )
+    disponibilite.invalider('CD', 'DVD', 'LIVRE')
+
+
+@receiver(post_delete, sender=Media, dispatch_uid='catalogue_delete_media')
+def media_parent_supprime(sender, instance, **kwargs):
+    for type_media in ('CD', 'DVD', 'LIVRE'):
+        index_disponibilite.marquer(type_media, [instance.pk], False)
+    CatalogueMedia.objects.filter(media_id=instance.pk).exclude(type_media='JEU').delete()
+    disponibilite.invalider('CD', 'DVD', 'LIVRE')
+
+
+# Suppression d’un membre : ses réservations partent en cascade, et plus rien ne
+# remettrait en circulation les médias mis de côté pour lui. Ils passent au suivant de
+# leur file ou redeviennent disponibles, dans la transaction de la suppression.
+@receiver(pre_delete, sender=Membre, dispatch_uid='reservations_membre_supprime')
+def membre_supprime(sender, instance, **kwargs):
+    retenues = list(Reservation.objects.filter(membre=instance, statut=Reservation.RETENUE)
+                    .values_list('pk', 'media_id'))
+    if retenues:
+        Reservation.objects.filter(pk__in=[pk for pk, _ in retenues]).delete()
+        for _, media_id in retenues:
+            services._remettre_en_circulation(media_id)
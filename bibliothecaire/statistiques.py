@@ -0,0 +1,245 @@
+# Statistiques de circulation : tables agrégées par jour (et par mois pour les classements),
+# incrémentées dans la transaction de chaque emprunt et retour (services.py) et
+# recalculables depuis l’historique des emprunts, archives comprises
+# (« manage.py recalculer_statistiques »).
+# Le tableau de bord ne lit que ces tables, quelle que soit la période demandée.
+from collections import defaultdict
+from datetime import date
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .chargement import inserer_selection
+from .models import (CatalogueMedia, EmpruntHistorique, Membre, MODELES_MEDIA, StatistiqueJour,
+                     StatistiqueMediaMois, StatistiqueMembreMois)
+
+# Nombre de titres et de membres des classements
+TAILLE_CLASSEMENT = 10
+
+COMPTEURS_JOUR = ('emprunts', 'retours', 'retours_en_retard', 'jours_empruntes')
+
+# Période maximale du tableau de bord (une entrée par jour dans « par_jour »)
+LIMITE_PERIODE_JOURS = 3660
+
+
+# Levée pour une période de tableau de bord invalide (message affichable)
+class PeriodeInvalide(ValueError):
+    pass
+
+
+def _mois(jour):
+    return jour.replace(day=1)
+
+
+# Ajoute des quantités aux compteurs d’une ligne agrégée, créée au besoin : une seule
+# requête INSERT ... ON CONFLICT DO UPDATE (SQLite, PostgreSQL). Ailleurs, UPDATE puis
+# création ; une création concurrente de la même ligne retombe sur l’UPDATE.
+def _incrementer(modele, cles, **quantites):
+    quantites = {champ.name: quantites.get(champ.name, 0) for champ in modele._meta.concrete_fields
+                 if not champ.primary_key and champ.name not in cles}
+    if connection.features.supports_update_conflicts_with_target:
+        table = connection.ops.quote_name(modele._meta.db_table)
+        colonnes = [connection.ops.quote_name(modele._meta.get_field(champ).column) for champ in [*cles, *quantites]]
+        cibles = colonnes[:len(cles)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(colonnes)}) VALUES ({", ".join(["%s"] * len(colonnes))}) '
+                f'ON CONFLICT ({", ".join(cibles)}) DO UPDATE SET '
+                + ', '.join(f'{colonne} = {table}.{colonne} + excluded.{colonne}' for colonne in colonnes[len(cles):]),
+                [*cles.values(), *quantites.values()],
+            )
+        return
+
+    increments = {champ: F(champ) + quantite for champ, quantite in quantites.items()}
+    if modele.objects.filter(**cles).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            modele.objects.create(**cles, **quantites)
+    except IntegrityError:
+        modele.objects.filter(**cles).update(**increments)
+
+
+# Emprunt enregistré (dans la transaction de services.emprunter)
+def compter_emprunt(emprunt, type_media):
+    jour = emprunt.date_emprunt
+    _incrementer(StatistiqueJour, {'jour': jour, 'type_media': type_media}, emprunts=1)
+    _incrementer(StatistiqueMediaMois, {'mois': _mois(jour), 'type_media': type_media, 'media_id': emprunt.media_id},
+                 emprunts=1)
+    _incrementer(StatistiqueMembreMois, {'mois': _mois(jour), 'membre_id': emprunt.membre_id}, emprunts=1)
+
+
+# Retour enregistré (dans la transaction de services.rentrer)
+def compter_retour(emprunt, type_media, date_retour):
+    en_retard = emprunt.date_retour_prevue is not None and date_retour > emprunt.date_retour_prevue
+    _incrementer(StatistiqueJour, {'jour': date_retour, 'type_media': type_media},
+                 retours=1, retours_en_retard=int(en_retard),
+                 jours_empruntes=max((date_retour - emprunt.date_emprunt).days, 0))
+
+
+def _types_par_content_type():
+    return {ContentType.objects.get_for_model(modele).id: type_media for type_media, modele in MODELES_MEDIA.items()}
+
+
+def _periode(champ, du, au):
+    filtres = {}
+    if du:
+        filtres[f'{champ}__gte'] = du
+    if au:
+        filtres[f'{champ}__lte'] = au
+    return filtres
+
+
+# Recalcule les tables agrégées depuis les emprunts, sur une période (tout l’historique
+# par défaut). Les classements mensuels sont recalculés par mois entiers.
+def recalculer(du=None, au=None, taille_lot=5000):
+    types = _types_par_content_type()
+    mois_du, mois_au = du and _mois(du), au and _mois(au)
+    au_fin_mois = au and (_mois(au) + timezone.timedelta(days=31)).replace(day=1) - timezone.timedelta(days=1)
+
+    with transaction.atomic():
+        StatistiqueJour.objects.filter(**_periode('jour', du, au)).delete()
+        StatistiqueJour.objects.bulk_create(_lignes_jour(types, du, au), batch_size=taille_lot)
+
+        emprunts = EmpruntHistorique.objects.filter(**_periode('date_emprunt', mois_du, au_fin_mois)) \
+            .annotate(mois=TruncMonth('date_emprunt')).order_by()
+        StatistiqueMediaMois.objects.filter(**_periode('mois', mois_du, mois_au)).delete()
+        type_media = Case(*[When(content_type_id=content_type_id, then=Value(type_media))
+                            for content_type_id, type_media in types.items()], output_field=CharField())
+        inserer_selection(StatistiqueMediaMois, ('mois', 'type_media', 'media_id', 'emprunts'),
+                          emprunts.filter(content_type__in=types, media__isnull=False).annotate(type_media=type_media)
+                          .values_list('mois', 'type_media', 'media').annotate(n=Count('pk')))
+        StatistiqueMembreMois.objects.filter(**_periode('mois', mois_du, mois_au)).delete()
+        inserer_selection(StatistiqueMembreMois, ('mois', 'membre_id', 'emprunts'),
+                          emprunts.values_list('mois', 'membre').annotate(n=Count('pk')))
+
+
+# Lignes par jour et par type : emprunts commencés, puis retours. Les retours sont
+# regroupés aussi par date d’emprunt, ce qui donne leur durée sans calcul de date en SQL.
+def _lignes_jour(types, du, au):
+    compteurs = defaultdict(lambda: dict.fromkeys(COMPTEURS_JOUR, 0))
+    emprunts = EmpruntHistorique.objects.filter(**_periode('date_emprunt', du, au)).order_by()
+    for ligne in emprunts.values('date_emprunt', 'content_type').annotate(n=Count('pk')):
+        if ligne['content_type'] in types:
+            compteurs[ligne['date_emprunt'], types[ligne['content_type']]]['emprunts'] += ligne['n']
+
+    retours = EmpruntHistorique.objects.rendus().filter(**_periode('date_retour', du, au)).order_by()
+    for ligne in retours.values('date_retour', 'content_type', 'date_emprunt').annotate(
+            n=Count('pk'), en_retard=Count('pk', filter=Q(date_retour__gt=F('date_retour_prevue')))):
+        if ligne['content_type'] not in types:
+            continue
+        compteur = compteurs[ligne['date_retour'], types[ligne['content_type']]]
+        compteur['retours'] += ligne['n']
+        compteur['retours_en_retard'] += ligne['en_retard']
+        compteur['jours_empruntes'] += max((ligne['date_retour'] - ligne['date_emprunt']).days, 0) * ligne['n']
+
+    return [StatistiqueJour(jour=jour, type_media=type_media, **valeurs)
+            for (jour, type_media), valeurs in sorted(compteurs.items())]
+
+
+# Période du tableau de bord lue dans les paramètres GET « du » et « au » (AAAA-MM-JJ) ;
+# par défaut, le mois en cours
+def lire_periode(params):
+    aujourd_hui = timezone.localdate()
+    try:
+        du = date.fromisoformat(params['du']) if params.get('du') else _mois(aujourd_hui)
+        au = date.fromisoformat(params['au']) if params.get('au') else aujourd_hui
+    except ValueError:
+        raise PeriodeInvalide("Dates attendues au format AAAA-MM-JJ.")
+    if du > au:
+        raise PeriodeInvalide("La date de début doit précéder la date de fin.")
+    if (au - du).days >= LIMITE_PERIODE_JOURS:
+        raise PeriodeInvalide(f"Période limitée à {LIMITE_PERIODE_JOURS} jours.")
+    return du, au
+
+
+# Durée moyenne et taux de retard d’une ligne de compteurs (None sans retour)
+def _ratios(compteurs):
+    retours = compteurs['retours']
+    return {
+        **compteurs,
+        'duree_moyenne': round(compteurs['jours_empruntes'] / retours, 1) if retours else None,
+        'taux_retard': round(compteurs['retours_en_retard'] / retours, 3) if retours else None,
+    }
+
+
+# Indicateurs de la période [du, au] : totaux, par type, par jour et classements (les
+# classements portent sur les mois entiers couvrant la période)
+def tableau_de_bord(du, au):
+    jours = StatistiqueJour.objects.filter(jour__range=(du, au))
+    sommes = {f'{champ}_total': Sum(champ) for champ in COMPTEURS_JOUR}
+
+    par_type = []
+    totaux = dict.fromkeys(COMPTEURS_JOUR, 0)
+    for ligne in jours.values('type_media').annotate(**sommes).order_by('type_media'):
+        compteurs = {champ: ligne[f'{champ}_total'] for champ in COMPTEURS_JOUR}
+        par_type.append(_ratios({'type_media': ligne['type_media'], **compteurs}))
+        for champ in COMPTEURS_JOUR:
+            totaux[champ] += compteurs[champ]
+
+    # Une entrée par jour de la période, jours sans activité compris
+    activite = {ligne['jour']: ligne for ligne in
+                jours.values('jour').annotate(emprunts_total=Sum('emprunts'), retours_total=Sum('retours'))}
+    par_jour = []
+    for decalage in range((au - du).days + 1):
+        jour = du + timezone.timedelta(days=decalage)
+        ligne = activite.get(jour, {})
+        par_jour.append({'jour': jour, 'emprunts': ligne.get('emprunts_total', 0),
+                         'retours': ligne.get('retours_total', 0)})
+
+    return {
+        'du': du,
+        'au': au,
+        'classements_du': _mois(du),
+        'classements_au': _mois(au),
+        'totaux': _ratios(totaux),
+        'par_type': par_type,
+        'par_jour': par_jour,
+        'top_titres': _top_titres(_mois(du), _mois(au)),
+        'top_membres': _top_membres(_mois(du), _mois(au)),
+    }
+
+
+# Classement d’une table mensuelle. Sur un seul mois, les lignes sont déjà uniques :
+# elles sont lues dans l’ordre de l’index (mois, -emprunts), sans regroupement.
+def _classement(modele, cles, mois_du, mois_au):
+    lignes = modele.objects.filter(mois__range=(mois_du, mois_au))
+    if mois_du == mois_au:
+        lignes = lignes.order_by('-emprunts', *cles).values(*cles, total=F('emprunts'))
+    else:
+        lignes = lignes.values(*cles).annotate(total=Sum('emprunts')).order_by('-total', *cles)
+    return list(lignes[:TAILLE_CLASSEMENT])
+
+
+def _top_titres(mois_du, mois_au):
+    classement = _classement(StatistiqueMediaMois, ('type_media', 'media_id'), mois_du, mois_au)
+    if not classement:
+        return []
+    filtre = Q()
+    for ligne in classement:
+        filtre |= Q(type_media=ligne['type_media'], media_id=ligne['media_id'])
+    noms = {(c.type_media, c.media_id): c for c in CatalogueMedia.objects.filter(filtre)}
+    titres = []
+    for ligne in classement:
+        entree = noms.get((ligne['type_media'], ligne['media_id']))
+        titres.append({
+            'type_media': ligne['type_media'],
+            'media_id': ligne['media_id'],
+            'name': entree.name if entree else None,  # Média supprimé depuis
+            'createur': entree.createur if entree else None,
+            'emprunts': ligne['total'],
+        })
+    return titres
+
+
+def _top_membres(mois_du, mois_au):
+    classement = _classement(StatistiqueMembreMois, ('membre_id',), mois_du, mois_au)
+    membres = Membre.objects.in_bulk([ligne['membre_id'] for ligne in classement]) if classement else {}
+    return [{
+        'membre_id': ligne['membre_id'],
+        'membre': str(membres[ligne['membre_id']]) if ligne['membre_id'] in membres else None,
+        'emprunts': ligne['total'],
+    } for ligne in classement]
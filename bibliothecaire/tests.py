@@ -34,17 +34,17 @@ class EmpruntModelTest(TestCase):
         emprunt = Emprunt.objects.create(
             membre=self.membre,
             content_type=self.content_type,
-            object_id=self.livre.id,
+            media=self.livre,
             date_emprunt=timezone.now().date()
         )
         expected_date = emprunt.date_emprunt + timezone.timedelta(days=7)
         self.assertEqual(emprunt.date_retour_prevue, expected_date)
 
-    def test_emprunt_media_incorrect(self):
-        emprunt = Emprunt(membre=self.membre)
-        emprunt.content_type = ContentType.objects.get_for_model(JeuDePlateau)
-        emprunt.object_id = 9999  # Id qui n'existe pas
-        # L'accès au media doit être None (aucun objet correspondant)
+    def test_emprunt_media_supprime(self):
+        emprunt = Emprunt.objects.create(membre=self.membre, media=self.livre, content_type=self.content_type)
+        self.livre.delete()
+        # L’emprunt reste dans l’historique, sans média
+        emprunt.refresh_from_db()
         self.assertIsNone(emprunt.media)
 
 #Test Forms
@@ -74,7 +74,7 @@ class EmpruntFormTest(TestCase):
         self.assertTrue(form.is_valid())
         emprunt = form.save()
         self.assertEqual(emprunt.membre, self.membre)
-        self.assertEqual(emprunt.media, self.cd)
+        self.assertEqual((emprunt.media_id, emprunt.content_type.model), (self.cd.pk, 'cd'))
 
     def test_form_valid_dvd(self):
         form_data = {
@@ -85,7 +85,7 @@ class EmpruntFormTest(TestCase):
         form = EmpruntForm(data=form_data)
         self.assertTrue(form.is_valid())
         emprunt = form.save()
-        self.assertEqual(emprunt.media, self.dvd)
+        self.assertEqual((emprunt.media_id, emprunt.content_type.model), (self.dvd.pk, 'dvd'))
 
     def test_form_valid_livre(self):
         form_data = {
@@ -96,7 +96,7 @@ class EmpruntFormTest(TestCase):
         form = EmpruntForm(data=form_data)
         self.assertTrue(form.is_valid())
         emprunt = form.save()
-        self.assertEqual(emprunt.media, self.livre)
+        self.assertEqual((emprunt.media_id, emprunt.content_type.model), (self.livre.pk, 'livre'))
 
     def test_form_invalid_media_for_type(self):
         # Essayer de sélectionner un DVD avec type_media CD (invalide)
@@ -150,6 +150,7 @@ class MembreViewTests(TestCase):
 class MediaViewTests(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.cd = CD.objects.create(name="CD Test", disponible=True, artiste="Artiste Test")
 
@@ -208,3 +209,1511 @@ class EmpruntViewTests(TestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, 200)
         self.assertIn("Impossible d&#x27;emprunter un jeu de plateau.", response.content.decode('utf-8'))
+
+class ListeEmpruntsViewTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.membre = Membre.objects.create(prenom="Lina", nom="Petit", email="lina@example.com")
+        ct_cd = ContentType.objects.get_for_model(CD)
+        ct_dvd = ContentType.objects.get_for_model(DVD)
+        for i in range(4):
+            cd = CD.objects.create(name=f"CD {i}", artiste="Artiste", disponible=False)
+            Emprunt.objects.create(membre=self.membre, content_type=ct_cd, media=cd)
+        dvd = DVD.objects.create(name="DVD rendu", realisateur="Réalisateur", disponible=True)
+        self.rendu = Emprunt.objects.create(membre=self.membre, content_type=ct_dvd, media=dvd,
+                                            date_retour=timezone.now().date())
+        # Un emprunt ancien, donc en retard
+        self.ancien = Emprunt.objects.filter(media=cd).first()
+        Emprunt.objects.filter(pk=self.ancien.pk).update(
+            date_emprunt=timezone.now().date() - timezone.timedelta(days=30))
+
+    def test_nombre_de_requetes_fixe(self):
+        url = reverse('bibliothecaire:liste_emprunts')
+        # 1 requête pour la page, membres et médias joints
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, "CD 0")
+        self.assertContains(response, "DVD rendu")
+
+    def test_filtres(self):
+        url = reverse('bibliothecaire:liste_emprunts')
+        response = self.client.get(url, {'statut': 'rendus'})
+        self.assertEqual([e.pk for e in response.context['emprunts']], [self.rendu.pk])
+        response = self.client.get(url, {'statut': 'retard'})
+        self.assertEqual([e.pk for e in response.context['emprunts']], [self.ancien.pk])
+        response = self.client.get(url, {'statut': 'actifs'})
+        self.assertEqual(len(response.context['emprunts']), 4)
+
+    def test_pagination_par_curseur(self):
+        from bibliothecaire import views
+        url = reverse('bibliothecaire:liste_emprunts')
+        ancienne_taille = views.TAILLE_PAGE_EMPRUNTS
+        views.TAILLE_PAGE_EMPRUNTS = 2
+        try:
+            vus = []
+            params = {}
+            while True:
+                response = self.client.get(url, params)
+                vus += [e.pk for e in response.context['emprunts']]
+                if not response.context['curseur_suivant']:
+                    break
+                params = {'apres': response.context['curseur_suivant']}
+        finally:
+            views.TAILLE_PAGE_EMPRUNTS = ancienne_taille
+        self.assertEqual(sorted(vus), sorted(Emprunt.objects.values_list('pk', flat=True)))
+        self.assertEqual(vus[-1], self.ancien.pk)
+
+#Test catalogue
+from django.core.cache import cache
+from bibliothecaire.models import CatalogueMedia
+from bibliothecaire import catalogue
+
+class CatalogueMediaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cd = CD.objects.create(name="Kind of Blue", artiste="Miles Davis", disponible=True)
+        self.jeu = JeuDePlateau.objects.create(name="Catan", createur="Klaus Teuber", disponible=True)
+
+    def test_synchronisation_par_signaux(self):
+        entree = CatalogueMedia.objects.get(type_media='CD', media_id=self.cd.id)
+        self.assertEqual(entree.createur, "Miles Davis")
+        self.assertTrue(entree.disponible)
+
+        self.cd.emprunter()
+        entree.refresh_from_db()
+        self.assertFalse(entree.disponible)
+
+        self.cd.delete()
+        self.assertFalse(CatalogueMedia.objects.filter(type_media='CD', media_id=self.cd.id).exists())
+
+    def test_reconstruire(self):
+        CatalogueMedia.objects.all().delete()
+        self.assertEqual(catalogue.reconstruire(), 2)
+        self.assertTrue(CatalogueMedia.objects.filter(type_media='JEU', media_id=self.jeu.id).exists())
+
+    def test_medias_disponibles_une_requete(self):
+        CD.objects.create(name="A Love Supreme", artiste="John Coltrane", disponible=False)
+        url = reverse('bibliothecaire:medias_disponibles')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'type_media': 'CD'})
+        self.assertEqual(response.json(), [{'id': self.cd.id, 'name': "Kind of Blue"}])
+
+class RechercheMediaTests(TestCase):
+
+    def setUp(self):
+        self.cd = CD.objects.create(name="Abbey Road", artiste="The Beatles", disponible=True)
+        self.livre = Livre.objects.create(name="Les Misérables", auteur="Victor Hugo", disponible=True)
+        self.jeu = JeuDePlateau.objects.create(name="Les Aventuriers du Rail", createur="Alan R. Moon")
+
+    def test_recherche_prefixe_et_accents(self):
+        self.assertEqual([m.media_id for m in catalogue.rechercher("beat")], [self.cd.id])
+        self.assertEqual([m.media_id for m in catalogue.rechercher("miserab")], [self.livre.id])
+
+    def test_recherche_filtre_par_type(self):
+        self.assertEqual(len(catalogue.rechercher("les")), 2)
+        resultats = catalogue.rechercher("les", type_media='JEU')
+        self.assertEqual([(m.type_media, m.media_id) for m in resultats], [('JEU', self.jeu.id)])
+
+    def test_index_suit_les_modifications(self):
+        self.cd.name = "Let It Be"
+        self.cd.save()
+        self.assertEqual(catalogue.rechercher("abbey"), [])
+        self.assertEqual([m.media_id for m in catalogue.rechercher("let it")], [self.cd.id])
+        self.livre.delete()
+        self.assertEqual(catalogue.rechercher("hugo"), [])
+
+    def test_recherche_media_json(self):
+        response = self.client.get(reverse('bibliothecaire:recherche_media'), {'q': 'hugo'})
+        self.assertEqual(response.json(), [{
+            'type': 'LIVRE', 'id': self.livre.id, 'name': "Les Misérables",
+            'createur': "Victor Hugo", 'disponible': True,
+        }])
+        # Les caractères spéciaux de la syntaxe FTS5 sont ignorés
+        response = self.client.get(reverse('bibliothecaire:recherche_media'), {'q': '"NEAR(* OR'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_limite_bornee(self):
+        for i in range(25):
+            CD.objects.create(name=f"Hugo Live {i}", artiste="X")
+        url = reverse('bibliothecaire:recherche_media')
+        for limite, attendu in [('-1', 1), ('0', 1), ('3', 3), ('500', 26), ('abc', 20), ('', 20)]:
+            with self.subTest(limite=limite):
+                response = self.client.get(url, {'q': 'hugo', 'limite': limite})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), attendu)
+        self.assertEqual(len(catalogue.rechercher('hugo', limite=-1)), 1)
+
+
+class MediasDisponiblesCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cd = CD.objects.create(name="Blue Train", artiste="John Coltrane", disponible=True)
+        self.url = reverse('bibliothecaire:medias_disponibles')
+
+    def test_cache_et_etag(self):
+        response = self.client.get(self.url, {'type_media': 'CD'})
+        etag = response['ETag']
+
+        # Même version : servi depuis le cache, puis 304 sans aucune requête SQL
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'type_media': 'CD'})
+        self.assertEqual(response.json(), [{'id': self.cd.id, 'name': "Blue Train"}])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'type_media': 'CD'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_emprunt_invalide_la_version(self):
+        etag = self.client.get(self.url, {'type_media': 'CD'})['ETag']
+        etag_dvd = self.client.get(self.url, {'type_media': 'DVD'})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cd.emprunter()
+
+        response = self.client.get(self.url, {'type_media': 'CD'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        # Les autres types ne sont pas invalidés
+        response = self.client.get(self.url, {'type_media': 'DVD'}, HTTP_IF_NONE_MATCH=etag_dvd)
+        self.assertEqual(response.status_code, 304)
+
+
+#Test services
+from bibliothecaire.services import emprunter, rentrer, EmpruntRefuse, reconcilier_compteurs
+from bibliothecaire.forms import RetourForm
+
+class ServiceEmpruntTests(TestCase):
+
+    def setUp(self):
+        self.membre = Membre.objects.create(prenom="Zoé", nom="Leroy", email="zoe@example.com")
+        self.autre = Membre.objects.create(prenom="Hugo", nom="Blanc", email="hugo@example.com")
+        self.cds = [CD.objects.create(name=f"CD {i}", artiste="Artiste", disponible=True) for i in range(4)]
+
+    def test_emprunter_puis_rentrer(self):
+        emprunt = emprunter(self.membre, self.cds[0])
+        self.cds[0].refresh_from_db()
+        self.assertFalse(self.cds[0].disponible)
+        self.assertFalse(CatalogueMedia.objects.get(type_media='CD', media_id=self.cds[0].id).disponible)
+
+        rentrer(emprunt)
+        self.cds[0].refresh_from_db()
+        self.assertTrue(self.cds[0].disponible)
+        self.assertTrue(CatalogueMedia.objects.get(type_media='CD', media_id=self.cds[0].id).disponible)
+        with self.assertRaisesMessage(EmpruntRefuse, "déjà été rentré"):
+            rentrer(emprunt)
+
+    def test_media_deja_emprunte(self):
+        # Deuxième poste travaillant sur une instance périmée du même CD
+        copie = CD.objects.get(pk=self.cds[0].pk)
+        emprunter(self.membre, self.cds[0])
+        with self.assertRaisesMessage(EmpruntRefuse, "n'est pas disponible"):
+            emprunter(self.autre, copie)
+        self.assertEqual(Emprunt.objects.count(), 1)
+
+    def test_limite_de_trois_emprunts(self):
+        for cd in self.cds[:3]:
+            emprunter(self.membre, cd)
+        with self.assertRaisesMessage(EmpruntRefuse, "déjà 3 emprunts"):
+            emprunter(self.membre, self.cds[3])
+        # La transaction est annulée : le média reste disponible
+        self.cds[3].refresh_from_db()
+        self.assertTrue(self.cds[3].disponible)
+
+    def test_membre_en_retard(self):
+        emprunt = emprunter(self.membre, self.cds[0])
+        il_y_a_10_jours = timezone.now().date() - timezone.timedelta(days=10)
+        Emprunt.objects.filter(pk=emprunt.pk).update(
+            date_emprunt=il_y_a_10_jours, date_retour_prevue=il_y_a_10_jours + timezone.timedelta(days=7))
+        # Les dates ont été modifiées sans passer par le service : compteurs à recalculer
+        self.assertEqual(reconcilier_compteurs(), 1)
+        with self.assertRaisesMessage(EmpruntRefuse, "en retard"):
+            emprunter(self.membre, self.cds[1])
+
+    def test_compteurs_du_membre(self):
+        premier = emprunter(self.membre, self.cds[0])
+        second = emprunter(self.membre, self.cds[1])
+        Emprunt.objects.filter(pk=premier.pk).update(date_retour_prevue=timezone.now().date())
+        Membre.objects.filter(pk=self.membre.pk).update(prochaine_echeance=timezone.now().date())
+        self.membre.refresh_from_db()
+        self.assertEqual(self.membre.nb_emprunts_actifs, 2)
+
+        rentrer(premier)
+        self.membre.refresh_from_db()
+        self.assertEqual(self.membre.nb_emprunts_actifs, 1)
+        self.assertEqual(self.membre.prochaine_echeance, Emprunt.objects.get(pk=second.pk).date_retour_prevue)
+
+        rentrer(second)
+        self.membre.refresh_from_db()
+        self.assertEqual((self.membre.nb_emprunts_actifs, self.membre.prochaine_echeance), (0, None))
+        self.assertEqual(reconcilier_compteurs(), 0)
+
+    def test_un_seul_emprunt_actif_par_media(self):
+        emprunter(self.membre, self.cds[0])
+        # Média remis disponible à tort : la contrainte en base refuse le second emprunt
+        CD.objects.filter(pk=self.cds[0].pk).update(disponible=True)
+        with self.assertRaisesMessage(EmpruntRefuse, "déjà emprunté"):
+            emprunter(self.autre, self.cds[0])
+
+    def test_rentrer_emprunt_view(self):
+        emprunt = emprunter(self.membre, self.cds[0])
+        url = reverse('bibliothecaire:rentrer_emprunt', args=[emprunt.id])
+        response = self.client.post(url, {'date_retour': timezone.now().date().isoformat()})
+        self.assertRedirects(response, reverse('bibliothecaire:liste_emprunts'))
+        self.cds[0].refresh_from_db()
+        self.assertTrue(self.cds[0].disponible)
+        response = self.client.get(url)
+        self.assertContains(response, "Cet emprunt a déjà été rentré.")
+
+    def test_date_de_retour_bornee(self):
+        emprunt = emprunter(self.membre, self.cds[0])
+        aujourd_hui = timezone.localdate()
+        Emprunt.objects.filter(pk=emprunt.pk).update(date_emprunt=aujourd_hui - timezone.timedelta(days=5))
+        emprunt.refresh_from_db()
+        for decalage, valide in [(-6, False), (-5, True), (0, True), (1, False)]:
+            with self.subTest(decalage=decalage):
+                form = RetourForm({'date_retour': aujourd_hui + timezone.timedelta(days=decalage)}, emprunt=emprunt)
+                self.assertEqual(form.is_valid(), valide)
+
+        # La vue réaffiche le formulaire sans enregistrer le retour
+        url = reverse('bibliothecaire:rentrer_emprunt', args=[emprunt.id])
+        response = self.client.post(url, {'date_retour': (aujourd_hui + timezone.timedelta(days=1)).isoformat()})
+        self.assertContains(response, "ne peut être dans le futur")
+        emprunt.refresh_from_db()
+        self.assertIsNone(emprunt.date_retour)
+
+    def test_liste_membres_une_requete(self):
+        emprunter(self.membre, self.cds[0])
+        Membre.objects.filter(pk=self.membre.pk).update(
+            prochaine_echeance=timezone.now().date() - timezone.timedelta(days=1))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('bibliothecaire:liste_membres'))
+        self.assertContains(response, "(en retard)", count=1)
+
+
+#Test plans de requêtes
+import re
+import unittest
+from django.db import connection
+from bibliothecaire.views import emprunts_filtres
+from bibliothecaire.services import prochaine_echeance_calculee, nb_emprunts_actifs_calcule
+from bibliothecaire.catalogue import page_catalogue
+
+# Les requêtes fréquentes doivent passer par un index, jamais par un parcours complet
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN propre à SQLite")
+class PlanRequetesTests(TestCase):
+
+    CURSEUR = (timezone.now().date(), 1000)
+
+    def assertPlanIndexe(self, queryset, recherche_sur=None):
+        plan = queryset.explain()
+        # « SCAN table » sans « USING ... INDEX » = lecture complète de la table
+        self.assertIsNone(re.search(r'SCAN \w+$', plan, re.MULTILINE), plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)  # Tri sans index
+        if recherche_sur:
+            # Accès direct par l’index (recherche), pas un parcours de l’index entier
+            self.assertIn(f'SEARCH {recherche_sur} USING', plan)
+
+    def test_liste_emprunts(self):
+        for statut in ('', 'actifs', 'rendus', 'retard'):
+            with self.subTest(statut=statut):
+                self.assertPlanIndexe(emprunts_filtres(statut)[:51])
+                self.assertPlanIndexe(emprunts_filtres(statut, self.CURSEUR)[:51],
+                                      recherche_sur='bibliothecaire_emprunt')
+
+    def test_emprunts_en_retard(self):
+        self.assertPlanIndexe(Emprunt.objects.en_retard(), recherche_sur='bibliothecaire_emprunt')
+
+    def test_scan_des_echeances_depassees(self):
+        self.assertPlanIndexe(Emprunt.objects.echeance_depassee().order_by('date_retour_prevue', 'id'),
+                              recherche_sur='bibliothecaire_emprunt')
+
+    def test_emprunt_en_cours_d_un_media(self):
+        self.assertPlanIndexe(Emprunt.objects.actifs().filter(media=1),
+                              recherche_sur='bibliothecaire_emprunt')
+
+    def test_compteurs_du_membre(self):
+        membres = Membre.objects.filter(pk=1).annotate(
+            echeance=prochaine_echeance_calculee(), nb=nb_emprunts_actifs_calcule())
+        self.assertPlanIndexe(membres, recherche_sur='U0')
+
+    def test_catalogue(self):
+        self.assertPlanIndexe(
+            CatalogueMedia.objects.filter(type_media='CD', disponible=True).order_by('name'),
+            recherche_sur='bibliothecaire_cataloguemedia')
+        for params in ({}, {'tri': 'createur'}, {'type': 'LIVRE'}, {'type': 'DVD', 'tri': 'createur'}):
+            with self.subTest(params=params):
+                self.assertPlanIndexe(page_catalogue(params)['page'].paginator.object_list[:50])
+
+
+#Test commandes
+import io
+import json
+from django.core import mail
+from django.core.management import call_command
+
+class ScanOverdueTests(TestCase):
+
+    def setUp(self):
+        self.membre = Membre.objects.create(prenom="Eva", nom="Roux", email="eva@example.com")
+        aujourd_hui = timezone.now().date()
+        self.en_retard = []
+        for i, (modele, champ) in enumerate([(CD, 'artiste'), (DVD, 'realisateur'), (Livre, 'auteur')]):
+            media = modele.objects.create(name=f"Média {i}", disponible=False, **{champ: "X"})
+            self.en_retard.append(Emprunt.objects.create(
+                membre=self.membre, content_type=ContentType.objects.get_for_model(modele), media=media,
+                date_retour_prevue=aujourd_hui - timezone.timedelta(days=i + 1)))
+        # Emprunt dans les temps : absent du rapport
+        cd = CD.objects.create(name="À l'heure", artiste="Y", disponible=False)
+        Emprunt.objects.create(membre=self.membre, content_type=ContentType.objects.get_for_model(CD),
+                               media=cd)
+
+    def test_rapport_jsonl_et_rappels(self):
+        sortie = io.StringIO()
+        ContentType.objects.get_for_model(CD)  # Cache des ContentType rempli
+        # 1 requête par lot (membres et médias joints), quelle que soit la taille
+        with self.assertNumQueries(1):
+            call_command('scan_overdue', format='jsonl', envoyer_rappels=True, stdout=sortie, stderr=io.StringIO())
+        lignes = [json.loads(ligne) for ligne in sortie.getvalue().splitlines()]
+        self.assertEqual([l['emprunt_id'] for l in lignes], [e.id for e in reversed(self.en_retard)])
+        self.assertEqual([l['type_media'] for l in lignes], ['LIVRE', 'DVD', 'CD'])
+        self.assertEqual(lignes[0]['jours_de_retard'], 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ["eva@example.com"])
+
+    def test_rapport_csv_par_petits_lots(self):
+        sortie = io.StringIO()
+        call_command('scan_overdue', taille_lot=2, stdout=sortie, stderr=io.StringIO())
+        lignes = sortie.getvalue().splitlines()
+        self.assertEqual(lignes[0].split(','), ['emprunt_id', 'membre_id', 'membre', 'email', 'type_media',
+                                                'media_id', 'media', 'date_emprunt', 'date_retour_prevue',
+                                                'jours_de_retard'])
+        self.assertEqual(len(lignes), 4)
+
+class ImportMediaTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dossier.cleanup)
+        CD.objects.create(name="Déjà là", artiste="Groupe", disponible=True)
+
+    def ecrire(self, nom, contenu):
+        import os
+        chemin = os.path.join(self.dossier.name, nom)
+        with open(chemin, 'w', encoding='utf-8') as fichier:
+            fichier.write(contenu)
+        return chemin
+
+    def importer(self, *args, **options):
+        sortie = io.StringIO()
+        call_command('import_media', *args, stdout=sortie, stderr=io.StringIO(), **options)
+        return sortie.getvalue()
+
+    def test_import_csv(self):
+        chemin = self.ecrire('catalogue.csv', (
+            "type,name,createur,disponible\n"
+            "CD,Déjà là,Groupe,1\n"
+            "cd,Nouveau,Groupe,0\n"
+            "DVD,Film,Réalisatrice,\n"
+            "LIVRE,Roman,Autrice,oui\n"
+            "LIVRE,Roman,Autrice,oui\n"
+            "JEU,Jeu,Éditeur,1\n"
+            "VINYLE,Disque,Artiste,1\n"
+        ))
+        self.assertIn("4 média(s) importé(s), 2 doublon(s), 1 ligne(s) invalide(s)", self.importer(chemin))
+        nouveau = CD.objects.get(name="Nouveau")
+        self.assertEqual((nouveau.artiste, nouveau.disponible), ("Groupe", False))
+        self.assertEqual(DVD.objects.get().realisateur, "Réalisatrice")
+        self.assertEqual(Livre.objects.count(), 1)
+        self.assertEqual(JeuDePlateau.objects.get().createur, "Éditeur")
+        self.assertEqual(CatalogueMedia.objects.count(), 5)
+        self.assertEqual([m.name for m in catalogue.rechercher("realisatrice")], ["Film"])
+
+    def test_dry_run_jsonl(self):
+        chemin = self.ecrire('catalogue.jsonl', (
+            '{"type": "LIVRE", "name": "Roman", "createur": "Autrice"}\n'
+            '{"type": "LIVRE", "name": "Roman", "createur": "Autrice"}\n'
+        ))
+        self.assertIn("1 média(s) à importer, 1 doublon(s)", self.importer(chemin, dry_run=True))
+        self.assertFalse(Livre.objects.exists())
+
+    def test_jsonl_mal_forme(self):
+        chemin = self.ecrire('catalogue.jsonl', (
+            '{"type": "LIVRE", "name": "Roman", "createur": "Autrice"}\n'
+            '{"type": "LIVRE", "name": "Tronqué"\n'
+            '{"type": "DVD", "name": "Film", "createur": "R"}\n'
+        ))
+        sortie, erreurs = io.StringIO(), io.StringIO()
+        call_command('import_media', chemin, stdout=sortie, stderr=erreurs)
+        self.assertIn("2 média(s) importé(s), 0 doublon(s), 1 ligne(s) invalide(s)", sortie.getvalue())
+        self.assertIn("Ligne 2 ignorée : JSON invalide", erreurs.getvalue())
+        self.assertEqual(CatalogueMedia.objects.filter(name__in=["Roman", "Film"]).count(), 2)
+
+    def test_reprise(self):
+        chemin = self.ecrire('catalogue.jsonl', ''.join(
+            f'{{"type": "DVD", "name": "Film {i}", "createur": "R"}}\n' for i in range(5)))
+        # Les 3 premières lignes ont déjà été importées lors d’un passage interrompu
+        self.ecrire('catalogue.jsonl.progression', '{"lignes": 3}')
+        self.importer(chemin, reprendre=True, taille_lot=2)
+        self.assertEqual(sorted(DVD.objects.values_list('name', flat=True)), ["Film 3", "Film 4"])
+        import os
+        self.assertFalse(os.path.exists(chemin + '.progression'))
+
+import gzip
+import os
+import tempfile
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+class ExportsTests(TestCase):
+
+    def setUp(self):
+        self.membre = Membre.objects.create(prenom="Lou", nom="Petit", email="lou@example.com")
+        aujourd_hui = timezone.now().date()
+        self.emprunts = []
+        for i, (modele, champ) in enumerate([(CD, 'artiste'), (DVD, 'realisateur'), (Livre, 'auteur')]):
+            media = modele.objects.create(name=f"Titre {i}", disponible=False, **{champ: "Z"})
+            self.emprunts.append(Emprunt.objects.create(
+                membre=self.membre, content_type=ContentType.objects.get_for_model(modele), media=media,
+                date_emprunt=aujourd_hui - timezone.timedelta(days=10 * i)))
+        self.emprunts[2].date_retour = aujourd_hui
+        self.emprunts[2].save()
+
+    def _contenu(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content)
+
+    def test_export_csv_des_emprunts_en_flux(self):
+        response = self.client.get(reverse('bibliothecaire:exporter', args=['emprunts']))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('emprunts.csv', response['Content-Disposition'])
+        lignes = self._contenu(response).decode().splitlines()
+        self.assertEqual(lignes[0].split(',')[:3], ['id', 'membre_id', 'membre'])
+        self.assertEqual(len(lignes), 4)
+        self.assertIn(',DVD,', lignes[2])
+
+    def test_filtres_statut_et_dates(self):
+        aujourd_hui = timezone.now().date()
+        response = self.client.get(reverse('bibliothecaire:exporter', args=['emprunts']), {
+            'format': 'jsonl', 'statut': 'actifs',
+            'du': (aujourd_hui - timezone.timedelta(days=15)).isoformat(),
+        })
+        lignes = [json.loads(ligne) for ligne in self._contenu(response).decode().splitlines()]
+        self.assertEqual([l['id'] for l in lignes], [self.emprunts[0].id, self.emprunts[1].id])
+        self.assertEqual(lignes[0]['date_retour'], None)
+
+    def test_filtre_invalide_refuse_avant_le_flux(self):
+        response = self.client.get(reverse('bibliothecaire:exporter', args=['emprunts']), {'du': 'hier'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('bibliothecaire:exporter', args=['inconnu']))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_export_asynchrone_sous_asgi(self):
+        url = reverse('bibliothecaire:exporter', args=['emprunts'])
+        response = await self.async_client.get(url)
+        self.assertTrue(response.is_async)
+        contenu = b''.join([morceau async for morceau in response.streaming_content])
+        attendu = await sync_to_async(lambda: self._contenu(self.client.get(url)))()
+        self.assertEqual(contenu, attendu)
+
+    def test_export_gzip_des_medias(self):
+        response = self.client.get(reverse('bibliothecaire:exporter', args=['medias']),
+                                   {'gzip': '1', 'type': 'CD'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lignes = gzip.decompress(self._contenu(response)).decode().splitlines()
+        self.assertEqual(lignes, ['type_media,media_id,name,createur,disponible',
+                                  f'CD,{self.emprunts[0].media_id},Titre 0,Z,False'])
+
+    def test_commande_exporter_membres(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'membres.jsonl.gz')
+            call_command('exporter', 'membres', format='jsonl', gzip=True, sortie=chemin)
+            with gzip.open(chemin, 'rt', encoding='utf-8') as fichier:
+                lignes = [json.loads(ligne) for ligne in fichier]
+        self.assertEqual(lignes[0]['email'], "lou@example.com")
+        self.assertEqual(lignes[0]['nb_emprunts_actifs'], 0)
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Pragmas propres à SQLite")
+class ProfilConnexionSQLiteTests(TestCase):
+
+    def _pragma(self, nom):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {nom}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_appliques_a_la_connexion(self):
+        self.assertEqual(self._pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self._pragma('busy_timeout'), 5000)
+        self.assertEqual(self._pragma('foreign_keys'), 1)
+        self.assertEqual(self._pragma('cache_size'), -64000)
+
+from asgiref.sync import iscoroutinefunction
+from bibliothecaire import views as vues_bibliothecaire
+from membre import views as vues_membre
+
+class VuesAsynchronesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(catalogue.TAILLE_PAGE_CATALOGUE + 5):
+            CD.objects.create(name=f"Album {i:03d}", artiste="Quartet", disponible=True)
+
+    def test_vues_catalogue_natives_async(self):
+        self.assertTrue(iscoroutinefunction(vues_bibliothecaire.liste_media))
+        self.assertTrue(iscoroutinefunction(vues_bibliothecaire.medias_disponibles))
+        self.assertTrue(iscoroutinefunction(vues_membre.liste_media))
+
+    async def test_page_hors_bornes_relit_la_derniere(self):
+        response = await self.async_client.get(reverse('membre:liste_media'), {'page': 99})
+        page = response.context['page']
+        self.assertEqual(page.number, 2)
+        self.assertEqual(page.paginator.count, catalogue.TAILLE_PAGE_CATALOGUE + 5)
+        self.assertEqual([m.name for m in response.context['medias']][0], f"Album {catalogue.TAILLE_PAGE_CATALOGUE:03d}")
+
+    async def test_medias_disponibles_etag_en_async(self):
+        url = reverse('bibliothecaire:medias_disponibles')
+        response = await self.async_client.get(url, {'type_media': 'CD'})
+        self.assertEqual(len(response.json()), catalogue.TAILLE_PAGE_CATALOGUE + 5)
+        response = await self.async_client.get(url, {'type_media': 'CD'}, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+import sqlite3
+from unittest import mock
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase
+from bibliothecaire import replica
+from bibliothecaire.replica import RouteurReplica, ReplicaMiddleware, CLE_SESSION_ECRITURE
+
+class ReplicaTests(TestCase):
+
+    def setUp(self):
+        self.middleware = ReplicaMiddleware(lambda request: HttpResponse())
+
+    def _requete(self, methode='get'):
+        request = getattr(RequestFactory(), methode)('/')
+        SessionMiddleware(lambda request: HttpResponse()).process_request(request)
+        return request
+
+    def test_routeur(self):
+        routeur = RouteurReplica()
+        self.assertIsNone(routeur.db_for_read(CatalogueMedia))
+        jeton = replica._base_lecture.set('replica')
+        try:
+            self.assertEqual(routeur.db_for_read(CatalogueMedia), 'replica')
+            self.assertIsNone(routeur.db_for_read(Session))  # Sessions toujours sur la base principale
+        finally:
+            replica._base_lecture.reset(jeton)
+        self.assertEqual(routeur.db_for_write(CatalogueMedia), 'default')
+        self.assertFalse(routeur.allow_migrate('replica', 'bibliothecaire'))
+
+    @mock.patch('bibliothecaire.replica.replica_disponible', return_value=True)
+    def test_lecture_sur_replica_sauf_apres_une_ecriture(self, _):
+        request = self._requete()
+        self.middleware.process_view(request, vues_membre.liste_media, (), {})
+        self.assertEqual(replica._base_lecture.get(), 'replica')
+        self.middleware.process_response(request, HttpResponse())
+        self.assertIsNone(replica._base_lecture.get())
+
+        # Vue non marquée : base principale
+        self.middleware.process_view(self._requete(), vues_bibliothecaire.creer_emprunt, (), {})
+        self.assertIsNone(replica._base_lecture.get())
+
+        # La session qui vient d’écrire relit la base principale
+        ecriture = self._requete('post')
+        self.middleware.process_view(ecriture, vues_bibliothecaire.creer_emprunt, (), {})
+        lecture = self._requete()
+        lecture.session[CLE_SESSION_ECRITURE] = ecriture.session[CLE_SESSION_ECRITURE]
+        self.middleware.process_view(lecture, vues_bibliothecaire.liste_emprunts, (), {})
+        self.assertIsNone(replica._base_lecture.get())
+
+    def test_replica_absente_repli_sur_la_base_principale(self):
+        replica._etat_replica['jusqu_a'] = 0
+        self.assertFalse(replica.replica_disponible())
+        response = self.client.get(reverse('membre:liste_media'))
+        self.assertEqual(response.status_code, 200)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Réplication par copie propre à SQLite")
+class RepliquerBaseTests(TransactionTestCase):
+
+    def test_copie_de_la_base(self):
+        Membre.objects.create(prenom="Noé", nom="Vidal", email="noe@example.com")
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'replica.sqlite3')
+            call_command('repliquer_base', vers=chemin, stdout=io.StringIO())
+            base = sqlite3.connect(chemin)
+            try:
+                emails = base.execute('SELECT email FROM bibliothecaire_membre').fetchall()
+            finally:
+                base.close()
+        self.assertEqual(emails, [("noe@example.com",)])
+
+from bibliothecaire.instrumentation import BudgetRequetesMixin, budgets_requetes
+
+class BudgetRequetesTests(BudgetRequetesMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.membres = [Membre.objects.create(prenom=f"P{i}", nom="N", email=f"p{i}@example.com") for i in range(4)]
+        for i, membre in enumerate(self.membres[:3]):
+            emprunter(membre, CD.objects.create(name=f"CD {i}", artiste="A", disponible=True))
+            emprunter(membre, DVD.objects.create(name=f"DVD {i}", realisateur="R", disponible=True))
+            emprunter(membre, Livre.objects.create(name=f"Livre {i}", auteur="B", disponible=True))
+        self.emprunt = Emprunt.objects.first()
+
+    def test_vues_en_lecture_dans_leur_budget(self):
+        for nom, args, params in [
+            ('bibliothecaire:liste_membres', [], {}),
+            ('bibliothecaire:modifier_membre', [self.membres[0].id], {}),
+            ('bibliothecaire:liste_media', [], {}),
+            ('bibliothecaire:medias_disponibles', [], {'type_media': 'CD'}),
+            ('bibliothecaire:recherche_media', [], {'q': 'cd'}),
+            ('bibliothecaire:creer_emprunt', [], {}),
+            ('bibliothecaire:rentrer_emprunt', [self.emprunt.id], {}),
+            ('bibliothecaire:liste_emprunts', [], {}),
+        ]:
+            with self.subTest(vue=nom):
+                self.assertBudgetRequetes(self.client.get(reverse(nom, args=args), params))
+
+    def test_ecritures_dans_leur_budget(self):
+        response = self.client.post(reverse('bibliothecaire:creer_emprunt'), {
+            'membre': self.membres[3].id, 'type_media': 'CD',
+            'media': CD.objects.create(name="Libre", artiste="A", disponible=True).id,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertBudgetRequetes(response)
+        response = self.client.post(reverse('bibliothecaire:rentrer_emprunt', args=[self.emprunt.id]),
+                                    {'date_retour': timezone.localdate().isoformat()})
+        self.assertBudgetRequetes(response)
+        # Une requête par table en cascade : une nouvelle table liée au membre doit figurer au budget
+        response = self.client.post(reverse('bibliothecaire:supprimer_membre', args=[self.membres[0].id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertBudgetRequetes(response)
+
+    def test_entete_et_depassement(self):
+        response = self.client.get(reverse('bibliothecaire:liste_emprunts'))
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn(f'desc="{response.mesures.requetes} requetes"', response['Server-Timing'])
+
+        with mock.patch.dict(budgets_requetes(None), {'bibliothecaire:liste_emprunts': 0}):
+            with self.assertLogs('bibliothecaire.instrumentation', 'WARNING'):
+                response = self.client.get(reverse('bibliothecaire:liste_emprunts'))
+        with self.assertRaises(AssertionError):
+            self.assertBudgetRequetes(response)
+
+from django.core.management.base import CommandError
+from django.test import override_settings
+from bibliothecaire.models import Reservation
+
+class SeedBenchmarkTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        call_command('seed_benchmark', membres=30, medias=200, emprunts=500, taille_lot=64,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_volumes_et_coherence(self):
+        self.assertEqual(Membre.objects.count(), 30)
+        self.assertEqual(CatalogueMedia.objects.count(), 200)
+        self.assertEqual(CatalogueMedia.objects.filter(type_media='JEU').count(), 20)
+        self.assertEqual(Emprunt.objects.count(), 500)
+        actifs = Emprunt.objects.actifs()
+        self.assertTrue(actifs.exists())
+        self.assertTrue(Emprunt.objects.echeance_depassee().exists() or actifs.count() < 10)
+        # Un média indisponible par emprunt en cours ou mise de côté, compteurs des membres exacts
+        retenues = Reservation.objects.filter(statut=Reservation.RETENUE)
+        self.assertTrue(retenues.exists())
+        self.assertTrue(Reservation.objects.filter(statut=Reservation.EN_ATTENTE).exists())
+        self.assertEqual(CatalogueMedia.objects.filter(disponible=False).count(), actifs.count() + retenues.count())
+        self.assertEqual(reconcilier_compteurs(corriger=False), 0)
+        self.assertLessEqual(max(Membre.objects.values_list('nb_emprunts_actifs', flat=True)), 3)
+
+    def test_refuse_une_base_non_vide(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark', membres=1, medias=1, emprunts=0, stdout=io.StringIO())
+
+    @override_settings(DEBUG=True)
+    def test_benchmark_de_toutes_les_vues(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'resultats.json')
+            erreurs = io.StringIO()
+            call_command('benchmark_vues', iterations=2, echauffement=0, sortie=chemin,
+                         stdout=io.StringIO(), stderr=erreurs)
+            with open(chemin, encoding='utf-8') as fichier:
+                rapport = json.load(fichier)
+            # Comparaison avec la mesure précédente
+            sortie = io.StringIO()
+            call_command('benchmark_vues', iterations=1, echauffement=0, filtre='accueil',
+                         comparer=chemin, stdout=sortie, stderr=io.StringIO())
+        self.assertNotIn("Aucun scénario", erreurs.getvalue())
+        self.assertEqual(rapport['base']['emprunts'], 500)
+        for nom, resultat in rapport['resultats'].items():
+            with self.subTest(vue=nom):
+                self.assertEqual(resultat['statut'], 200)
+                self.assertGreater(resultat['p95_ms'], 0)
+        self.assertIn('p50 x', sortie.getvalue())
+
+from django.http import QueryDict
+from bibliothecaire.cache_pages import cle_cache_catalogue
+from bibliothecaire.models import Media
+
+class CachePagesCatalogueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cd = CD.objects.create(name="Kind of Blue", artiste="Miles Davis", disponible=True)
+        self.jeu = JeuDePlateau.objects.create(name="Carcassonne", createur="Wrede", disponible=True)
+
+    # Les signaux n’incrémentent les versions qu’à la validation de la transaction
+    def _modifier(self, media, **valeurs):
+        with self.captureOnCommitCallbacks(execute=True):
+            for champ, valeur in valeurs.items():
+                setattr(media, champ, valeur)
+            media.save()
+
+    def test_fragment_bibliothecaire_sans_jeton_csrf(self):
+        url = reverse('bibliothecaire:liste_media')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Kind of Blue")
+        self.assertContains(response, 'csrfmiddlewaretoken', count=1)
+        self.assertContains(response, f'formaction="{reverse("bibliothecaire:supprimer_media", args=["CD", self.cd.id])}"')
+        fragment = cache.get(cle_cache_catalogue('bibliothecaire', QueryDict()))
+        self.assertIn("Kind of Blue", fragment)
+        self.assertNotIn('csrfmiddlewaretoken', fragment)
+
+        self._modifier(self.cd, name="Sketches of Spain")
+        self.assertContains(self.client.get(url), "Sketches of Spain")
+
+    def test_suppression_depuis_la_liste_en_cache(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(reverse('bibliothecaire:liste_media'))
+        jeton = response.context['csrf_token']
+        response = client.post(reverse('bibliothecaire:supprimer_media', args=['CD', self.cd.id]),
+                               {'csrfmiddlewaretoken': str(jeton)})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CD.objects.filter(pk=self.cd.pk).exists())
+
+    def test_page_membre_invalidee_par_type(self):
+        url = reverse('membre:liste_media')
+        self.client.get(url)
+        self.client.get(url, {'type': 'CD'})
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), "Carcassonne")
+
+        # Un jeu modifié : la page « tous types » est recalculée, la page des CD reste en cache
+        self._modifier(self.jeu, name="Catan")
+        with self.assertNumQueries(0):
+            self.client.get(url, {'type': 'CD'})
+        self.assertContains(self.client.get(url), "Catan")
+
+        # Un Media modifié directement (sans sa sous-classe) invalide CD, DVD et livres
+        self._modifier(Media.objects.get(pk=self.cd.pk), disponible=False)
+        self.assertContains(self.client.get(url, {'type': 'CD'}), "(emprunté)")
+
+import struct
+
+from bibliothecaire import index_disponibilite
+
+class IndexDisponibiliteTests(TestCase):
+
+    def setUp(self):
+        index_disponibilite.reinitialiser()
+        self.addCleanup(index_disponibilite.reinitialiser)
+        self.membre = Membre.objects.create(prenom="Lou", nom="Reed", email="lou@example.com")
+        self.cds = [CD.objects.create(name=f"CD {i}", artiste="A", disponible=i % 3 != 0) for i in range(10)]
+
+    def _disponibles(self):
+        return [cd.pk for cd in self.cds if cd.disponible]
+
+    def test_lectures_sans_requete(self):
+        self.assertEqual(index_disponibilite.ids_disponibles('CD'), self._disponibles())  # Construit l’index
+        with self.assertNumQueries(0):
+            self.assertEqual(index_disponibilite.ids_disponibles('CD'), self._disponibles())
+            self.assertEqual(index_disponibilite.nb_disponibles('CD'), 6)
+            self.assertTrue(index_disponibilite.est_disponible('CD', self.cds[1].pk))
+            self.assertFalse(index_disponibilite.est_disponible('CD', self.cds[0].pk))
+            self.assertFalse(index_disponibilite.est_disponible('CD', 10 ** 9))
+        self.assertEqual(index_disponibilite.ids_disponibles('DVD'), [])
+
+    def test_emprunt_retour_et_ajout_mis_a_jour(self):
+        index_disponibilite.ids_disponibles('CD')
+        with self.captureOnCommitCallbacks(execute=True):
+            emprunt = emprunter(self.membre, self.cds[1])
+        self.assertFalse(index_disponibilite.est_disponible('CD', self.cds[1].pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            rentrer(emprunt)
+        self.assertTrue(index_disponibilite.est_disponible('CD', self.cds[1].pk))
+
+        supprime = self.cds[2].pk
+        with self.captureOnCommitCallbacks(execute=True):
+            nouveau = CD.objects.create(name="Nouveau", artiste="B", disponible=True)
+            self.cds[2].delete()
+        self.assertTrue(index_disponibilite.est_disponible('CD', nouveau.pk))
+        self.assertFalse(index_disponibilite.est_disponible('CD', supprime))
+
+        # Media modifié sans sa sous-classe : le type est retrouvé dans le catalogue
+        with self.captureOnCommitCallbacks(execute=True):
+            Media.objects.filter(pk=nouveau.pk).first().emprunter()
+        self.assertFalse(index_disponibilite.est_disponible('CD', nouveau.pk))
+
+    def test_fichier_partage_entre_processus(self):
+        with tempfile.TemporaryDirectory() as dossier, self.settings(INDEX_DISPONIBILITE_DIR=dossier):
+            index_disponibilite.reinitialiser()
+            self.assertEqual(index_disponibilite.reconstruire('CD'), {'CD': 6})
+            chemin = os.path.join(dossier, 'CD.bits')
+            # Projection du même fichier par un autre worker
+            autre = index_disponibilite._Tableau(index_disponibilite._projeter(chemin))
+            position = index_disponibilite.TAILLE_ENTETE + (self.cds[0].pk >> 3)
+
+            index_disponibilite._marquer('CD', [self.cds[0].pk], True)
+            self.assertTrue(autre.carte[position] >> (self.cds[0].pk & 7) & 1)
+
+            # Un id hors capacité agrandit le fichier : l’autre worker le reprojette
+            loin = index_disponibilite.PAS_CAPACITE * 2 + 5
+            index_disponibilite._marquer('CD', [loin], True)
+            self.assertTrue(autre.remplace)
+            index_disponibilite.reinitialiser()
+            with self.assertNumQueries(0):
+                self.assertTrue(index_disponibilite.est_disponible('CD', loin))
+                self.assertTrue(index_disponibilite.est_disponible('CD', self.cds[0].pk))
+            autre.carte.close()
+            index_disponibilite.reinitialiser()
+
+    def test_projection_remplacee_fermee(self):
+        with tempfile.TemporaryDirectory() as dossier, self.settings(INDEX_DISPONIBILITE_DIR=dossier):
+            index_disponibilite.reinitialiser()
+            index_disponibilite.reconstruire('CD')
+            ancien = index_disponibilite._lire('CD')
+            index_disponibilite.reconstruire('CD')
+            self.assertTrue(ancien.carte.closed)
+
+            # Fichier remplacé par un autre worker : reprojeté, l’ancienne projection fermée
+            ancien = index_disponibilite._lire('CD')
+            struct.pack_into('<Q', ancien.carte, index_disponibilite.POSITION_REMPLACE, 1)
+            self.assertEqual(index_disponibilite.nb_disponibles('CD'), 6)
+            self.assertTrue(ancien.carte.closed)
+
+            # Un lecteur qui tenait l’ancien tableau relit le nouveau
+            with mock.patch.object(index_disponibilite, '_lire', side_effect=[ancien, index_disponibilite._lire('CD')]):
+                self.assertTrue(index_disponibilite.est_disponible('CD', self.cds[1].pk))
+
+            actuel = index_disponibilite._lire('CD')
+            index_disponibilite.reinitialiser()
+            self.assertTrue(actuel.carte.closed)
+
+    def test_vues_et_commande(self):
+        sortie = io.StringIO()
+        call_command('reconstruire_index_disponibilite', 'CD', stdout=sortie)
+        self.assertIn("CD : 6 médias disponibles", sortie.getvalue())
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('bibliothecaire:ids_disponibles', args=['CD']))
+        self.assertEqual(response.json()['ids'], self._disponibles())
+        response = self.client.get(reverse('bibliothecaire:media_disponible', args=['CD', self.cds[0].pk]))
+        self.assertFalse(response.json()['disponible'])
+        self.assertEqual(self.client.get(reverse('bibliothecaire:ids_disponibles', args=['XX'])).status_code, 404)
+        with self.assertRaises(CommandError):
+            call_command('reconstruire_index_disponibilite', 'XX', stdout=io.StringIO())
+
+from bibliothecaire import statistiques
+from bibliothecaire.models import StatistiqueJour, StatistiqueMediaMois, StatistiqueMembreMois
+
+class StatistiquesTests(BudgetRequetesMixin, TestCase):
+
+    def setUp(self):
+        self.aujourd_hui = timezone.localdate()
+        self.membres = [Membre.objects.create(prenom=f"P{i}", nom="N", email=f"s{i}@example.com") for i in range(3)]
+        self.cd = CD.objects.create(name="Blue Train", artiste="Coltrane", disponible=True)
+        self.livre = Livre.objects.create(name="Nadja", auteur="Breton", disponible=True)
+        # Deux emprunts du CD (dont un rendu en retard), un du livre encore en cours
+        premier = emprunter(self.membres[0], self.cd)
+        rentrer(premier, self.aujourd_hui + timezone.timedelta(days=10))
+        emprunter(self.membres[1], self.cd)
+        emprunter(self.membres[1], self.livre)
+
+    def _tables(self):
+        return (
+            sorted(StatistiqueJour.objects.values_list('jour', 'type_media', 'emprunts', 'retours',
+                                                       'retours_en_retard', 'jours_empruntes')),
+            sorted(StatistiqueMediaMois.objects.values_list('mois', 'type_media', 'media_id', 'emprunts')),
+            sorted(StatistiqueMembreMois.objects.values_list('mois', 'membre_id', 'emprunts')),
+        )
+
+    def test_increments_egaux_au_recalcul(self):
+        increments = self._tables()
+        self.assertIn((self.aujourd_hui, 'CD', 2, 0, 0, 0), increments[0])
+        self.assertIn((self.aujourd_hui + timezone.timedelta(days=10), 'CD', 0, 1, 1, 10), increments[0])
+        statistiques.recalculer()
+        self.assertEqual(self._tables(), increments)
+
+        # Recalcul limité à une période : le reste n’est pas touché
+        StatistiqueJour.objects.filter(jour=self.aujourd_hui).update(emprunts=99)
+        call_command('recalculer_statistiques', du=(self.aujourd_hui + timezone.timedelta(days=1)).isoformat(),
+                     stdout=io.StringIO())
+        self.assertEqual(StatistiqueJour.objects.get(jour=self.aujourd_hui, type_media='CD').emprunts, 99)
+        call_command('recalculer_statistiques', stdout=io.StringIO())
+        self.assertEqual(self._tables(), increments)
+
+    def test_retour_d_un_media_supprime(self):
+        emprunt = Emprunt.objects.get(media=self.livre.pk)
+        self.livre.delete()
+        emprunt.refresh_from_db()
+        self.assertIsNone(emprunt.media_id)
+        rentrer(emprunt, self.aujourd_hui + timezone.timedelta(days=3))
+        jours = self._tables()[0]
+        self.assertIn((self.aujourd_hui + timezone.timedelta(days=3), 'LIVRE', 0, 1, 0, 3), jours)
+        statistiques.recalculer()
+        self.assertEqual(self._tables()[0], jours)
+
+    def test_tableau_de_bord(self):
+        donnees = statistiques.tableau_de_bord(self.aujourd_hui - timezone.timedelta(days=40),
+                                               self.aujourd_hui + timezone.timedelta(days=10))
+        self.assertEqual(donnees['totaux']['emprunts'], 3)
+        self.assertEqual(donnees['totaux']['taux_retard'], 1.0)
+        self.assertEqual(donnees['totaux']['duree_moyenne'], 10.0)
+        self.assertEqual([t['type_media'] for t in donnees['par_type']], ['CD', 'LIVRE'])
+        self.assertEqual(len(donnees['par_jour']), 51)
+        self.assertEqual(donnees['top_titres'][0]['name'], "Blue Train")
+        self.assertEqual(donnees['top_membres'][0], {'membre_id': self.membres[1].id, 'membre': "P1 N", 'emprunts': 2})
+
+        # Sur un seul mois, même classement lu sans regroupement
+        mois = statistiques.tableau_de_bord(self.aujourd_hui, self.aujourd_hui)
+        self.assertEqual(mois['top_titres'], donnees['top_titres'])
+        self.assertEqual(mois['top_membres'], donnees['top_membres'])
+
+    def test_vues(self):
+        response = self.client.get(reverse('bibliothecaire:statistiques'))
+        self.assertContains(response, "Blue Train")
+        self.assertBudgetRequetes(response)
+        response = self.client.get(reverse('bibliothecaire:statistiques_json'),
+                                   {'du': self.aujourd_hui.isoformat(), 'au': self.aujourd_hui.isoformat()})
+        self.assertBudgetRequetes(response)
+        self.assertEqual(response.json()['totaux']['emprunts'], 3)
+        self.assertEqual(self.client.get(reverse('bibliothecaire:statistiques'), {'du': 'hier'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('bibliothecaire:statistiques_json'),
+                                         {'du': '2024-02-01', 'au': '2024-01-01'}).status_code, 400)
+
+
+from bibliothecaire.models import EmpruntArchive, EmpruntHistorique
+
+class ArchiveEmpruntsTests(TestCase):
+
+    def setUp(self):
+        self.aujourd_hui = timezone.localdate()
+        self.membre = Membre.objects.create(prenom="Ada", nom="Roux", email="ada@example.com")
+        type_cd = ContentType.objects.get_for_model(CD)
+        self.emprunts = {}
+        # Rendus il y a 100 et 60 jours, rendu il y a 5 jours, en cours depuis 200 jours
+        for nom, emprunt_il_y_a, retour_il_y_a in [('ancien', 110, 100), ('moyen', 70, 60),
+                                                   ('recent', 12, 5), ('en_cours', 200, None)]:
+            cd = CD.objects.create(name=f"CD {nom}", artiste="X", disponible=retour_il_y_a is not None)
+            emprunt = self.emprunts[nom] = Emprunt.objects.create(
+                membre=self.membre, content_type=type_cd, media=cd,
+                date_retour=retour_il_y_a and self.aujourd_hui - timezone.timedelta(days=retour_il_y_a))
+            # date_emprunt est en auto_now_add : fixée après coup
+            emprunt.date_emprunt = self.aujourd_hui - timezone.timedelta(days=emprunt_il_y_a)
+            Emprunt.objects.filter(pk=emprunt.pk).update(date_emprunt=emprunt.date_emprunt)
+
+    def _archiver(self, **options):
+        sortie = io.StringIO()
+        call_command('archive_loans', stdout=sortie, stderr=io.StringIO(), **options)
+        return sortie.getvalue()
+
+    def test_archive_les_emprunts_rendus_anciens_par_lots(self):
+        self.assertIn("2 emprunt(s)", self._archiver(older_than=30, taille_lot=1))
+        archives = {e.pk: e for e in EmpruntArchive.objects.all()}
+        self.assertEqual(set(archives), {self.emprunts['ancien'].pk, self.emprunts['moyen'].pk})
+        ancien = archives[self.emprunts['ancien'].pk]
+        self.assertEqual((ancien.membre_id, ancien.media_id, ancien.date_emprunt, ancien.date_retour),
+                         (self.membre.pk, self.emprunts['ancien'].media_id,
+                          self.aujourd_hui - timezone.timedelta(days=110),
+                          self.aujourd_hui - timezone.timedelta(days=100)))
+        self.assertEqual(set(Emprunt.objects.values_list('pk', flat=True)),
+                         {self.emprunts['recent'].pk, self.emprunts['en_cours'].pk})
+        # Rien de plus à archiver
+        self.assertIn("0 emprunt(s)", self._archiver(older_than=30))
+
+    def test_options_invalides(self):
+        with self.assertRaises(CommandError):
+            self._archiver(older_than=-1)
+        with self.assertRaises(CommandError):
+            self._archiver(older_than=30, taille_lot=0)
+
+    def test_historique_lit_les_deux_tables(self):
+        self._archiver(older_than=30)
+        self.assertEqual(EmpruntHistorique.objects.count(), 4)
+        self.assertEqual(set(EmpruntHistorique.objects.filter(archive=True).values_list('pk', flat=True)),
+                         {self.emprunts['ancien'].pk, self.emprunts['moyen'].pk})
+        self.assertEqual(EmpruntHistorique.objects.rendus().count(), 3)
+
+        response = self.client.get(reverse('bibliothecaire:liste_emprunts'), {'statut': 'rendus'})
+        self.assertContains(response, "CD ancien")
+        self.assertContains(response, "CD recent")
+        response = self.client.get(reverse('bibliothecaire:liste_emprunts'), {'statut': 'actifs'})
+        self.assertNotContains(response, "CD ancien")
+        self.assertContains(response, "CD en_cours")
+
+        contenu = b''.join(self.client.get(reverse('bibliothecaire:exporter', args=['emprunts'])).streaming_content)
+        self.assertEqual(len(contenu.decode().splitlines()), 5)
+
+    def test_statistiques_inchangees_apres_archivage(self):
+        statistiques.recalculer()
+        avant = list(StatistiqueJour.objects.order_by('jour').values_list('jour', 'emprunts', 'retours'))
+        self._archiver(older_than=30)
+        statistiques.recalculer()
+        self.assertEqual(list(StatistiqueJour.objects.order_by('jour').values_list('jour', 'emprunts', 'retours')),
+                         avant)
+
+    def test_suppression_du_membre(self):
+        self._archiver(older_than=30)
+        self.membre.delete()
+        self.assertFalse(EmpruntArchive.objects.exists())
+        self.assertFalse(EmpruntHistorique.objects.exists())
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from bibliothecaire.services import reserver, annuler_reservation, expirer_reservations, ReservationRefusee
+
+class ReservationsTests(BudgetRequetesMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.aujourd_hui = timezone.localdate()
+        self.membres = [Membre.objects.create(prenom=f"R{i}", nom="N", email=f"r{i}@example.com") for i in range(4)]
+        self.cd = CD.objects.create(name="Kind of Blue", artiste="Davis", disponible=True)
+        self.emprunt = emprunter(self.membres[0], self.cd)
+
+    def _catalogue_disponible(self):
+        return CatalogueMedia.objects.get(type_media='CD', media_id=self.cd.pk).disponible
+
+    def test_file_d_attente_et_refus(self):
+        premiere = reserver(self.membres[1], self.cd)
+        seconde = reserver(self.membres[2], self.cd)
+        self.assertEqual((premiere.rang, seconde.rang), (1, 2))
+        for membre, media, message in [
+            (self.membres[1], self.cd, "déjà réservé"),
+            (self.membres[0], self.cd, "en cours d'emprunt"),
+            (self.membres[1], CD.objects.create(name="Libre", artiste="A", disponible=True), "disponible"),
+            (self.membres[1], JeuDePlateau.objects.create(name="Go", createur="X"), "jeu de plateau"),
+        ]:
+            with self.subTest(message=message), self.assertRaisesMessage(ReservationRefusee, message):
+                reserver(membre, media)
+
+    def test_retour_met_de_cote_pour_la_tete_de_file(self):
+        reserver(self.membres[1], self.cd)
+        reserver(self.membres[2], self.cd)
+        with self.captureOnCommitCallbacks(execute=True):
+            rentrer(self.emprunt)
+        self.cd.refresh_from_db()
+        self.assertFalse(self.cd.disponible)
+        self.assertFalse(self._catalogue_disponible())
+        tete = Reservation.objects.get(membre=self.membres[1])
+        self.assertEqual((tete.statut, tete.expire_le),
+                         (Reservation.RETENUE, self.aujourd_hui + timezone.timedelta(days=3)))
+        self.assertEqual(Reservation.objects.get(membre=self.membres[2]).statut, Reservation.EN_ATTENTE)
+
+        # Seul le membre servi peut l’emprunter ; sa réservation est alors honorée
+        with self.assertRaisesMessage(EmpruntRefuse, "pas disponible"):
+            emprunter(self.membres[3], self.cd)
+        emprunt = emprunter(self.membres[1], self.cd)
+        self.assertFalse(Reservation.objects.filter(membre=self.membres[1]).exists())
+
+        # Au retour suivant, le suivant de la file est servi
+        rentrer(emprunt)
+        self.assertEqual(Reservation.objects.get(membre=self.membres[2]).statut, Reservation.RETENUE)
+
+    def test_retour_en_temps_constant(self):
+        # Même nombre de requêtes quelle que soit la longueur de la file
+        autre = emprunter(self.membres[1], CD.objects.create(name="Court", artiste="A", disponible=True))
+        reserver(self.membres[2], autre.media)
+        for i in range(30):
+            reserver(Membre.objects.create(prenom=f"F{i}", nom="N", email=f"f{i}@example.com"), self.cd)
+        with CaptureQueriesContext(connection) as file_courte:
+            rentrer(autre)
+        with CaptureQueriesContext(connection) as file_longue:
+            rentrer(self.emprunt)
+        self.assertEqual(len(file_longue), len(file_courte))
+
+    def test_expiration_par_lots(self):
+        reserver(self.membres[1], self.cd)
+        reserver(self.membres[2], self.cd)
+        rentrer(self.emprunt)
+        expiration = self.aujourd_hui + timezone.timedelta(days=4)
+        sortie = io.StringIO()
+        call_command('expirer_reservations', date=expiration, taille_lot=1, stdout=sortie)
+        self.assertIn("1 réservation(s)", sortie.getvalue())
+        suivante = Reservation.objects.get()
+        self.assertEqual((suivante.membre, suivante.statut, suivante.expire_le),
+                         (self.membres[2], Reservation.RETENUE, expiration + timezone.timedelta(days=3)))
+
+        # File vide : le média redevient disponible
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expirer_reservations(expiration + timezone.timedelta(days=10)), 1)
+        self.cd.refresh_from_db()
+        self.assertTrue(self.cd.disponible)
+        self.assertTrue(self._catalogue_disponible())
+
+    def test_annulation(self):
+        premiere = reserver(self.membres[1], self.cd)
+        reserver(self.membres[2], self.cd)
+        rentrer(self.emprunt)
+        annuler_reservation(Reservation.objects.get(pk=premiere.pk))
+        self.assertEqual(Reservation.objects.get().statut, Reservation.RETENUE)
+        annuler_reservation(Reservation.objects.get())
+        self.cd.refresh_from_db()
+        self.assertTrue(self.cd.disponible)
+
+    def test_suppression_d_un_membre_servi(self):
+        reserver(self.membres[1], self.cd)
+        reserver(self.membres[2], self.cd)
+        rentrer(self.emprunt)
+        # Le média mis de côté passe au suivant de la file
+        response = self.client.post(reverse('bibliothecaire:supprimer_membre', args=[self.membres[1].pk]))
+        self.assertRedirects(response, reverse('bibliothecaire:liste_membres'))
+        self.assertBudgetRequetes(response)
+        suivante = Reservation.objects.get()
+        self.assertEqual((suivante.membre, suivante.statut), (self.membres[2], Reservation.RETENUE))
+
+        # File vide : le média redevient disponible
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bibliothecaire:supprimer_membre', args=[self.membres[2].pk]))
+        self.assertBudgetRequetes(response)
+        self.assertFalse(Reservation.objects.exists())
+        self.cd.refresh_from_db()
+        self.assertTrue(self.cd.disponible)
+        self.assertTrue(self._catalogue_disponible())
+
+    def test_vues(self):
+        url = reverse('bibliothecaire:reserver_media', args=['CD', self.cd.pk])
+        self.assertBudgetRequetes(self.client.get(url))
+        response = self.client.post(url, {'membre': self.membres[1].pk})
+        self.assertRedirects(response, reverse('bibliothecaire:liste_reservations'))
+        self.assertBudgetRequetes(response)
+        self.assertContains(self.client.post(url, {'membre': self.membres[1].pk}), "déjà réservé")
+        self.assertEqual(self.client.get(reverse('bibliothecaire:reserver_media', args=['JEU', 1])).status_code, 404)
+
+        response = self.client.get(reverse('bibliothecaire:liste_reservations'))
+        self.assertContains(response, "Kind of Blue")
+        self.assertBudgetRequetes(response)
+
+        rentrer(self.emprunt)
+        reservation = Reservation.objects.get()
+        url = reverse('bibliothecaire:preter_reservation', args=[reservation.pk])
+        self.assertBudgetRequetes(self.client.get(url))
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('bibliothecaire:liste_emprunts'))
+        self.assertBudgetRequetes(response)
+        self.assertTrue(Emprunt.objects.actifs().filter(membre=self.membres[1], media=self.cd.pk).exists())
+
+        reservation = reserver(self.membres[2], self.cd)
+        url = reverse('bibliothecaire:supprimer_reservation', args=[reservation.pk])
+        self.assertBudgetRequetes(self.client.get(url))
+        self.assertBudgetRequetes(self.client.post(url))
+        self.assertFalse(Reservation.objects.exists())
+
+
+from bibliothecaire.annuaire import rechercher_membres
+from bibliothecaire.forms import EmpruntForm
+
+class RechercheMembresTests(TestCase):
+
+    def setUp(self):
+        self.jean = Membre.objects.create(prenom="Jean", nom="Dupont", email="jean.dupont@example.com")
+        self.helene = Membre.objects.create(prenom="Hélène", nom="Durand", email="hd@exemple.fr")
+        self.autre = Membre.objects.create(prenom="Paul", nom="Martin", email="paul@example.com")
+
+    def test_prefixes_accents_et_email(self):
+        self.assertEqual([m.id for m in rechercher_membres("dup")], [self.jean.id])
+        self.assertEqual([m.id for m in rechercher_membres("helene")], [self.helene.id])
+        self.assertEqual([m.id for m in rechercher_membres("jean.dup")], [self.jean.id])
+        self.assertEqual({m.id for m in rechercher_membres("du")}, {self.jean.id, self.helene.id})
+        self.assertEqual(len(rechercher_membres("du", limite=1)), 1)
+        self.assertEqual(rechercher_membres("  "), [])
+
+    def test_index_suit_les_modifications(self):
+        self.jean.nom = "Lefebvre"
+        self.jean.email = "jean.lefebvre@example.com"
+        self.jean.save()
+        self.assertEqual(rechercher_membres("dupont"), [])
+        self.assertEqual([m.id for m in rechercher_membres("lefeb")], [self.jean.id])
+        self.jean.delete()
+        self.assertEqual(rechercher_membres("lefeb"), [])
+
+    def test_recherche_membres_json(self):
+        response = self.client.get(reverse('bibliothecaire:recherche_membres'), {'q': 'mart'})
+        self.assertEqual(response.json(), [{'id': self.autre.id, 'nom': "Paul Martin", 'email': "paul@example.com"}])
+        response = self.client.get(reverse('bibliothecaire:recherche_membres'), {'q': '"NEAR(* OR'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_limite_bornee(self):
+        for i in range(25):
+            Membre.objects.create(prenom=f"Marc{i}", nom="Marais", email=f"marc{i}@example.com")
+        url = reverse('bibliothecaire:recherche_membres')
+        for limite, attendu in [('-1', 1), ('0', 1), ('3', 3), ('500', 26), ('abc', 20), ('', 20)]:
+            with self.subTest(limite=limite):
+                response = self.client.get(url, {'q': 'mar', 'limite': limite})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), attendu)
+        self.assertEqual(len(rechercher_membres('mar', limite=-1)), 1)
+
+    def test_formulaire_sans_liste_des_membres(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('bibliothecaire:creer_emprunt'))
+        self.assertNotContains(response, "Martin")
+        self.assertContains(response, 'type="number" name="membre"')
+
+        # L’id saisi est validé par une lecture sur la clé primaire
+        cd = CD.objects.create(name="Libre", artiste="A", disponible=True)
+        form = EmpruntForm({'membre': self.autre.id, 'type_media': 'CD', 'media': cd.id})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['membre'], self.autre)
+        form = EmpruntForm({'membre': 999999, 'type_media': 'CD', 'media': cd.id})
+        self.assertFalse(form.is_valid())
+        self.assertIn('membre', form.errors)
+
+from importlib import import_module
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+class RemplissageMediaEmpruntsTests(TransactionTestCase):
+    AVANT = [('bibliothecaire', '0015_emprunt_media_fk')]
+
+    def _migrer(self, cible):
+        executor = MigrationExecutor(connection)
+        executor.migrate(cible)
+        return executor.loader.project_state(cible).apps
+
+    def _migrer_jusqu_au_bout(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('bibliothecaire'))
+
+    def tearDown(self):
+        self._migrer_jusqu_au_bout()
+
+    def test_media_rempli_depuis_content_type_et_object_id_par_lots(self):
+        apps = self._migrer(self.AVANT)
+        types = {ct.model: ct.pk for ct in apps.get_model('contenttypes', 'ContentType').objects.all()}
+        membre = apps.get_model('bibliothecaire', 'Membre').objects.create(prenom="Eli", nom="Roy", email="eli@x.fr")
+        cd = apps.get_model('bibliothecaire', 'CD').objects.create(name="CD", artiste="A", disponible=False)
+        HistEmprunt = apps.get_model('bibliothecaire', 'Emprunt')
+        lie, orphelin, sans_type = [
+            HistEmprunt.objects.create(membre=membre, content_type_id=types[modele], object_id=object_id)
+            for modele, object_id in [('cd', cd.pk), ('cd', cd.pk + 1000), ('jeudeplateau', cd.pk)]]
+        HistEmprunt.objects.filter(pk=lie.pk).update(date_retour=timezone.now().date())
+        apps.get_model('bibliothecaire', 'EmpruntArchive').objects.create(
+            id=lie.pk + 1000, membre=membre, content_type_id=types['cd'], object_id=cd.pk,
+            date_emprunt=timezone.now().date(), date_retour=timezone.now().date())
+
+        # Un emprunt par lot
+        remplissage = import_module('bibliothecaire.migrations.0016_emprunt_media_remplissage')
+        with mock.patch.object(remplissage, 'TAILLE_LOT', 1):
+            self._migrer_jusqu_au_bout()
+
+        self.assertEqual(dict(Emprunt.objects.values_list('pk', 'media')),
+                         {lie.pk: cd.pk, orphelin.pk: None, sans_type.pk: None})
+        self.assertEqual(list(EmpruntArchive.objects.values_list('media', flat=True)), [cd.pk])
+        self.assertEqual(EmpruntHistorique.objects.filter(media=cd.pk).count(), 2)
+
+from bibliothecaire.models import MediaQuerySet
+
+class MediaPolymorpheTests(TestCase):
+
+    def setUp(self):
+        self.cd = CD.objects.create(name="Abbey Road", artiste="The Beatles")
+        self.dvd = DVD.objects.create(name="Brazil", realisateur="Gilliam", disponible=False)
+        self.livre = Livre.objects.create(name="Candide", auteur="Voltaire")
+
+    def test_sous_types_en_une_requete(self):
+        with self.assertNumQueries(1):
+            medias = list(Media.objects.concrets().order_by('name'))
+            self.assertEqual([type(media) for media in medias], [CD, DVD, Livre])
+            self.assertEqual([(m.pk, m.name, m.disponible, m.createur) for m in medias],
+                             [(self.cd.pk, "Abbey Road", True, "The Beatles"),
+                              (self.dvd.pk, "Brazil", False, "Gilliam"),
+                              (self.livre.pk, "Candide", True, "Voltaire")])
+        # Filtres, tris et tranches restent ceux d’un QuerySet
+        page = Media.objects.concrets().filter(disponible=True).order_by('-name')[:1]
+        self.assertEqual([(type(m), m.auteur) for m in page], [(Livre, "Voltaire")])
+
+    def test_media_lie_joint_avec_son_sous_type(self):
+        membre = Membre.objects.create(prenom="Noé", nom="Bas", email="noe@example.com")
+        for media in (self.cd, self.livre):
+            Emprunt.objects.create(membre=membre, media=media, content_type=ContentType.objects.get_for_model(media))
+        with self.assertNumQueries(1):
+            emprunts = Emprunt.objects.select_related(*MediaQuerySet.liens_concrets('media')).order_by('id')
+            self.assertEqual([(type(e.media.concret()), e.media.createur) for e in emprunts],
+                             [(CD, "The Beatles"), (Livre, "Voltaire")])
+
+    def test_liste_des_emprunts_avec_createurs(self):
+        membre = Membre.objects.create(prenom="Noé", nom="Bas", email="noe@example.com")
+        Emprunt.objects.create(membre=membre, media=self.dvd, content_type=ContentType.objects.get_for_model(DVD))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('bibliothecaire:liste_emprunts'))
+        self.assertContains(response, "<td>Gilliam</td>", html=True)
+
+import random
+from unittest import skipIf
+from bibliothecaire import recommandations
+from bibliothecaire.chargement import creer_emprunts_en_masse
+from bibliothecaire.models import Recommandation
+
+@skipIf(recommandations.np is None, "NumPy et SciPy requis")
+class RecommandationsTests(TestCase):
+
+    def setUp(self):
+        self.aujourd_hui = timezone.now().date()
+        self.membres = [Membre.objects.create(prenom=f"M{i}", nom="Test", email=f"m{i}@example.com")
+                        for i in range(4)]
+        self.medias = [CD.objects.create(name=f"CD {i}", artiste=f"Artiste {i}") for i in range(5)]
+        self.type_cd = ContentType.objects.get_for_model(CD).pk
+
+    def _emprunts(self, paires, il_y_a=30):
+        jour = self.aujourd_hui - timezone.timedelta(days=il_y_a)
+        creer_emprunts_en_masse([(self.membres[m].pk, self.type_cd, self.medias[c].pk, jour, jour, jour)
+                                 for m, c in paires])
+
+    def _voisins(self, media):
+        return [(r.voisin.name, r.communs) for r in recommandations.voisins(self.medias[media].pk)]
+
+    def test_reconstruction(self):
+        # CD 0 et CD 1 empruntés ensemble par trois membres, CD 0 et CD 2 par deux,
+        # CD 0 et CD 3 par un seul (sous le seuil) ; emprunts répétés comptés une fois
+        self._emprunts([(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (2, 1),
+                        (3, 0), (3, 3)])
+        self.assertEqual(recommandations.reconstruire(), 6)
+        self.assertEqual(self._voisins(0), [("CD 1", 3), ("CD 2", 2)])
+        self.assertEqual(self._voisins(2), [("CD 0", 2), ("CD 1", 2)])
+        self.assertEqual(self._voisins(3), [])
+        # Une requête, voisins joints avec leur sous-type
+        with self.assertNumQueries(1):
+            self.assertEqual([r.voisin.createur for r in recommandations.voisins(self.medias[0].pk)],
+                             ["Artiste 1", "Artiste 2"])
+
+    def test_mise_a_jour_egale_a_la_reconstruction(self):
+        aleatoire = random.Random(7)
+        self.membres += [Membre.objects.create(prenom=f"M{i}", nom="Test", email=f"m{i}@example.com")
+                         for i in range(4, 30)]
+        self.medias += [CD.objects.create(name=f"CD {i}", artiste="X") for i in range(5, 25)]
+        tirer = lambda n: [(aleatoire.randrange(30), int(aleatoire.random() ** 2 * 25)) for _ in range(n)]
+        self._emprunts(tirer(300))
+        recommandations.reconstruire()
+        self._emprunts(tirer(40), il_y_a=0)
+
+        recommandations.mettre_a_jour(self.aujourd_hui)
+        mise_a_jour = sorted(Recommandation.objects.values_list('media', 'rang', 'voisin', 'communs'))
+        recommandations.reconstruire()
+        self.assertEqual(mise_a_jour, sorted(Recommandation.objects.values_list('media', 'rang', 'voisin', 'communs')))
+        # Relancée sur la même période, la mise à jour ne change rien
+        recommandations.mettre_a_jour(self.aujourd_hui)
+        self.assertEqual(mise_a_jour, sorted(Recommandation.objects.values_list('media', 'rang', 'voisin', 'communs')))
+
+    def test_commandes(self):
+        self._emprunts([(0, 0), (0, 1), (1, 0), (1, 1)])
+        sortie = io.StringIO()
+        call_command('reconstruire_recommandations', stdout=sortie)
+        self.assertIn("2 recommandation(s)", sortie.getvalue())
+        self._emprunts([(2, 0), (2, 1)], il_y_a=0)
+        call_command('mettre_a_jour_recommandations', stdout=sortie)
+        self.assertEqual(self._voisins(0), [("CD 1", 3)])
+        with self.assertRaises(CommandError), mock.patch.object(recommandations, 'np', None):
+            call_command('reconstruire_recommandations', stdout=sortie)
+
+
+from django.test import override_settings
+from bibliothecaire import amendes
+from bibliothecaire.models import Amende
+
+class AmendesTests(TestCase):
+
+    def setUp(self):
+        self.aujourd_hui = timezone.now().date()
+        self.membre = Membre.objects.create(prenom="Ada", nom="Roux", email="ada@example.com")
+        self.emprunts = {}
+        # Nom : (modèle, échéance il y a N jours, rendu il y a N jours)
+        for nom, (modele, echeance, retour) in {
+            'cd_en_cours': (CD, 10, None),      # 10 jours de retard, 2 de grâce : 8 × 20 c
+            'dvd_en_cours': (DVD, 30, None),    # 29 × 50 c, plafonné à 10 €
+            'livre_en_cours': (Livre, 2, None), # Dans la grâce (3 jours)
+            'cd_rendu': (CD, 6, 1),             # Rendu avec 5 jours de retard : 3 × 20 c
+            'cd_a_l_heure': (CD, 6, 7),
+        }.items():
+            champs = {'artiste': "X"} if modele is CD else {'realisateur': "X"} if modele is DVD else {'auteur': "X"}
+            media = modele.objects.create(name=nom, disponible=retour is not None, **champs)
+            self.emprunts[nom] = Emprunt.objects.create(
+                membre=self.membre, media=media, content_type=ContentType.objects.get_for_model(modele),
+                date_retour_prevue=self._jour(-echeance), date_retour=retour and self._jour(-retour))
+
+    def _jour(self, decalage):
+        return self.aujourd_hui + timezone.timedelta(days=decalage)
+
+    def _amendes(self):
+        return {emprunt_id: (jours, montant, definitive) for emprunt_id, jours, montant, definitive
+                in Amende.objects.values_list('emprunt_id', 'jours_de_retard', 'montant', 'definitive')}
+
+    def test_calcul_et_idempotence(self):
+        attendu = {
+            self.emprunts['cd_en_cours'].pk: (10, 160, False),
+            self.emprunts['dvd_en_cours'].pk: (30, 1000, False),
+            self.emprunts['cd_rendu'].pk: (5, 60, True),
+        }
+        self.assertEqual(amendes.calculer(self.aujourd_hui, taille_tranche=2), (2, 1))
+        self.assertEqual(self._amendes(), attendu)
+        self.assertEqual(Amende.objects.get(emprunt_id=self.emprunts['dvd_en_cours'].pk).type_media, 'DVD')
+        # Relancé le même jour : provisoires réécrites à l’identique, définitive gardée
+        self.assertEqual(amendes.calculer(self.aujourd_hui), (2, 0))
+        self.assertEqual(self._amendes(), attendu)
+
+    def test_amende_provisoire_puis_definitive(self):
+        amendes.calculer(self.aujourd_hui)
+        cd = self.emprunts['cd_en_cours']
+        Emprunt.objects.filter(pk=cd.pk).update(date_retour=self._jour(1))
+        # Le lendemain, le CD rendu a son montant définitif ; le livre atteint la fin de sa grâce
+        self.assertEqual(amendes.calculer(self._jour(1)), (1, 1))
+        self.assertEqual(self._amendes()[cd.pk], (11, 180, True))
+        self.assertNotIn(self.emprunts['livre_en_cours'].pk, self._amendes())
+        # Le montant définitif ne bouge plus, même archivé ou recalculé plus tard
+        call_command('archive_loans', older_than=0, stdout=io.StringIO())
+        self.assertEqual(amendes.calculer(self._jour(5), depuis=self._jour(-30)), (2, 0))
+        self.assertEqual(self._amendes()[cd.pk], (11, 180, True))
+        self.assertEqual(self._amendes()[self.emprunts['livre_en_cours'].pk], (7, 40, False))
+
+    def test_retour_antidate(self):
+        # CD en retard de 3 jours (1 après la grâce) ; les deux CD en cours ont une amende provisoire
+        cd = CD.objects.create(name="cd_juste_en_retard", artiste="X", disponible=False)
+        juste = Emprunt.objects.create(membre=self.membre, media=cd, content_type=ContentType.objects.get_for_model(CD),
+                                       date_retour_prevue=self._jour(-3))
+        self.assertEqual(amendes.calculer(self.aujourd_hui), (3, 1))
+        self.assertEqual(self._amendes()[juste.pk], (3, 20, False))
+        # Deux jours plus tard, retours saisis avec une date antérieure au dernier calcul :
+        # l’un encore en retard (amende définitive), l’autre dans la grâce (amende supprimée)
+        en_cours = self.emprunts['cd_en_cours']
+        Emprunt.objects.filter(pk=en_cours.pk).update(date_retour=self._jour(-1))
+        Emprunt.objects.filter(pk=juste.pk).update(date_retour=self._jour(-2))
+        self.assertEqual(amendes.calculer(self._jour(2)), (2, 1))
+        amendes_ = self._amendes()
+        self.assertEqual(amendes_[en_cours.pk], (9, 140, True))
+        self.assertNotIn(juste.pk, amendes_)
+        # Provisoires restantes : le DVD, et le livre sorti de sa grâce
+        self.assertEqual(set(Amende.objects.filter(definitive=False).values_list('emprunt_id', flat=True)),
+                         {self.emprunts['dvd_en_cours'].pk, self.emprunts['livre_en_cours'].pk})
+        self.assertEqual(amendes.calculer(self._jour(2)), (2, 0))
+        self.assertEqual(self._amendes(), amendes_)
+
+    @override_settings(TARIFS_RETARD={'LIVRE': {'tarif_jour': 100, 'grace': 0, 'plafond': None}})
+    def test_tarifs_configurables(self):
+        self.assertEqual(amendes.calculer(self.aujourd_hui), (1, 0))
+        self.assertEqual(self._amendes(), {self.emprunts['livre_en_cours'].pk: (2, 200, False)})
+
+    def test_commande(self):
+        sortie = io.StringIO()
+        call_command('compute_fines', date=self.aujourd_hui, stdout=sortie)
+        self.assertIn("2 amende(s) provisoire(s) et 1 amende(s) définitive(s)", sortie.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('compute_fines', taille_tranche=0, stdout=sortie)
+        with self.assertRaises(CommandError):
+            call_command('compute_fines', date=self.aujourd_hui, depuis=self._jour(1), stdout=sortie)
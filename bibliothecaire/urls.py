@@ -1,27 +1,59 @@
 from django.urls import path
 from . import views
+from .instrumentation import budget
 
 app_name = 'bibliothecaire'
 
+# Chaque vue déclare son budget de requêtes SQL (bibliothecaire/instrumentation.py) :
+# il ne dépend pas du nombre de lignes affichées, un dépassement signale un N+1.
 urlpatterns = [
     # MembreEmprunteur
-    path('membres/', views.liste_membres, name='liste_membres'),
-    path('membres/creer/', views.creer_membre, name='creer_membre'),
-    path('membres/modifier/<int:id>/', views.modifier_membre, name='modifier_membre'),
-    path('membres/supprimer/<int:id>/', views.supprimer_membre, name='supprimer_membre'),
+    budget(path('membres/', views.liste_membres, name='liste_membres'), requetes=1),
+    budget(path('membres/recherche/', views.recherche_membres, name='recherche_membres'), requetes=1),
+    budget(path('membres/creer/', views.creer_membre, name='creer_membre'), requetes=2),
+    budget(path('membres/modifier/<int:id>/', views.modifier_membre, name='modifier_membre'), requetes=3),
+    # Suppression : une requête par table en cascade (emprunts, emprunts archivés, réservations, amendes),
+    # une pour lire les médias mis de côté pour le membre et, s’il y en a un, sa remise en circulation
+    budget(path('membres/supprimer/<int:id>/', views.supprimer_membre, name='supprimer_membre'), requetes=12),
 
     # Media
-    path('media/', views.liste_media, name='liste_media'),
-    path('media/supprimer/<str:type_media>/<int:media_id>/', views.supprimer_media, name='supprimer_media'),
-    path('media/ajouter/', views.ajouter_media, name='ajouter_media'),
-    path('medias-disponibles/', views.medias_disponibles, name='medias_disponibles'),
+    budget(path('media/', views.liste_media, name='liste_media'), requetes=3),  # Comptage, page (relue si hors bornes)
+    # Dont une requête par table liée : réservations et recommandations (du média, et celles
+    # où il est voisin) supprimées, emprunts et emprunts archivés gardés sans média
+    budget(path('media/supprimer/<str:type_media>/<int:media_id>/', views.supprimer_media, name='supprimer_media'),
+           requetes=10),
+    budget(path('media/ajouter/', views.ajouter_media, name='ajouter_media'), requetes=8),
+    budget(path('medias-disponibles/', views.medias_disponibles, name='medias_disponibles'), requetes=1),
+    budget(path('media/recherche/', views.recherche_media, name='recherche_media'), requetes=1),
+    # Index de disponibilité en mémoire partagée ; construit depuis la base au premier
+    # appel seulement (« manage.py reconstruire_index_disponibilite » au démarrage)
+    budget(path('disponibilite/<str:type_media>/', views.disponibilite_media, name='ids_disponibles'), requetes=0),
+    budget(path('disponibilite/<str:type_media>/<int:media_id>/', views.disponibilite_media, name='media_disponible'),
+           requetes=0),
 
     # Emprunt
-    path('emprunts/creer/', views.creer_emprunt, name='creer_emprunt'),
-    path('emprunts/rentrer/<int:id>/', views.rentrer_emprunt, name='rentrer_emprunt'),
-    path('emprunts/liste', views.liste_emprunts, name='liste_emprunts'),
+    # Dont une requête par table de statistiques mise à jour (3 à l’emprunt, 1 au retour)
+    # et, au retour, une pour mettre le média de côté pour la tête de sa file d’attente
+    budget(path('emprunts/creer/', views.creer_emprunt, name='creer_emprunt'), requetes=12),
+    budget(path('emprunts/rentrer/<int:id>/', views.rentrer_emprunt, name='rentrer_emprunt'), requetes=9),
+    # Membres et médias joints : une seule requête pour la page
+    budget(path('emprunts/liste', views.liste_emprunts, name='liste_emprunts'), requetes=1),
 
+    # Réservations
+    budget(path('reservations/', views.liste_reservations, name='liste_reservations'), requetes=1),
+    budget(path('reservations/reserver/<str:type_media>/<int:media_id>/', views.reserver_media,
+                name='reserver_media'), requetes=9),
+    budget(path('reservations/preter/<int:id>/', views.preter_reservation, name='preter_reservation'), requetes=13),
+    budget(path('reservations/supprimer/<int:id>/', views.supprimer_reservation, name='supprimer_reservation'),
+           requetes=8),
 
-    path('', views.accueil, name='accueil'),
-]
+    # Statistiques : totaux par type, activité par jour, titres, noms des titres, membres, noms des membres
+    budget(path('statistiques/', views.tableau_statistiques, name='statistiques'), requetes=6),
+    budget(path('statistiques.json', views.statistiques_json, name='statistiques_json'), requetes=6),
+
+    # Exports (requêtes exécutées pendant l’envoi en flux, hors mesure)
+    path('exports/<str:quoi>/', views.exporter_donnees, name='exporter'),
 
+
+    budget(path('', views.accueil, name='accueil'), requetes=0),
+]
@@ -1,12 +1,27 @@
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Membre, Emprunt, CD, DVD, Livre, JeuDePlateau, Media
-from .forms import MembreForm, EmpruntForm, MediaSelectorForm
-from django.db import transaction
-from django.utils import timezone
-from django.http import JsonResponse
+from .models import (Membre, Emprunt, EmpruntHistorique, CD, DVD, Livre, JeuDePlateau, Media, MediaQuerySet,
+                     CatalogueMedia, Reservation, MODELES_MEDIA)
+from .forms import MembreForm, EmpruntForm, MediaSelectorForm, RetourForm, ReservationForm
+from .services import emprunter, rentrer, reserver, annuler_reservation, EmpruntRefuse, ReservationRefusee
+from .catalogue import rechercher, LIMITE_RECHERCHE
+from .annuaire import rechercher_membres, LIMITE_RECHERCHE_MEMBRES
+from .cache_pages import acontexte_fragment_catalogue
+from .exports import en_flux_async, exporter, FiltreInvalide
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from datetime import date
+from . import disponibilite, index_disponibilite, statistiques
+from .replica import lecture_sur_replica
 
 
 # Liste tous les membres inscrits
+@lecture_sur_replica
 def liste_membres(request):
     membres = Membre.objects.all()  # Requête brute, sans filtre ni pagination
     return render(request, 'bibliothecaire/membre/liste.html', {
@@ -15,6 +30,19 @@ def liste_membres(request):
     })
 
 
+# Recherche de membres pour les formulaires d’emprunt et de réservation : les premiers
+# résultats en JSON, lus dans l’index plein texte (q et limite optionnels)
+@lecture_sur_replica
+def recherche_membres(request):
+    limite = _lire_limite(request, LIMITE_RECHERCHE_MEMBRES)
+
+    data = [
+        {'id': membre.id, 'nom': str(membre), 'email': membre.email}
+        for membre in rechercher_membres(request.GET.get('q', ''), limite=limite)
+    ]
+    return JsonResponse(data, safe=False)
+
+
 # Création d’un membre via formulaire
 def creer_membre(request):
     if request.method == 'POST':
@@ -49,19 +77,14 @@ def supprimer_membre(request, id):
     return render(request, 'bibliothecaire/membre/confirmer_delete.html', {'membre': membre})
 
 
-# Liste des médias par type
-def liste_media(request):
-    cds = CD.objects.all()
-    dvds = DVD.objects.all()
-    livres = Livre.objects.all()
-    jeux = JeuDePlateau.objects.all()
-
-    return render(request, 'bibliothecaire/media/liste.html', {
-        'cds': cds,
-        'dvds': dvds,
-        'livres': livres,
-        'jeux': jeux,
-    })
+# Liste des médias, tous types confondus, lue dans le catalogue dénormalisé.
+# Vue asynchrone : sous ASGI, elle ne passe plus par l’adaptateur sync_to_async.
+# Le tableau est un fragment mis en cache par version du catalogue ; les formulaires
+# de suppression (jeton CSRF propre à chaque session) restent hors du fragment.
+@lecture_sur_replica
+async def liste_media(request):
+    contexte = await acontexte_fragment_catalogue('bibliothecaire', 'bibliothecaire/media/tableau.html', request.GET)
+    return render(request, 'bibliothecaire/media/liste.html', contexte)
 
 
 # Ajout d’un média polymorphe via un formulaire générique
@@ -90,22 +113,94 @@ def ajouter_media(request):
     return render(request, 'bibliothecaire/media/ajouter.html', {'form': form})
 
 
-# Retourne en JSON la liste des médias disponibles d’un type donné (pour AJAX)
-def medias_disponibles(request):
+# Durée de conservation en cache des listes de médias disponibles (secondes)
+DUREE_CACHE_DISPONIBLES = 60 * 60
+
+
+# Retourne en JSON la liste des médias disponibles d’un type donné (pour AJAX).
+# L’ETag est le type et sa version de disponibilité : si le navigateur a déjà la version
+# courante (If-None-Match), la vue répond 304 sans toucher la base ; sinon la liste est
+# servie depuis le cache de cette version.
+# Pas de lecture sur réplique : une liste relue avant réplication serait mise en cache
+# sous la nouvelle version de disponibilité.
+# Vue asynchrone : le cache (aget, aset) et la base (ORM asynchrone) sont lus hors de la
+# boucle d’événements. L’ETag est traité ici et non par @condition, qui appelle sa
+# fonction d’ETag de façon synchrone.
+async def medias_disponibles(request):
     type_media = request.GET.get('type_media')
+    if type_media not in MODELES_MEDIA:
+        return JsonResponse([], safe=False)
+
+    version = await disponibilite.aversion(type_media)
+    etag = quote_etag(f"{type_media}-{version}")
+    if request.method in ('GET', 'HEAD'):
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+    cle = f"medias_disponibles:{type_media}:{version}"
+    contenu = await cache.aget(cle)
+    if contenu is None:
+        # Une seule requête indexée sur le catalogue (type_media, disponible, name)
+        medias = (
+            CatalogueMedia.objects
+            .filter(type_media=type_media, disponible=True)
+            .order_by('name')
+            .values_list('media_id', 'name')
+        )
+        # async for plutôt qu’aiterator() : sous Django 5.2, aiterator() sur values_list
+        # exécute la requête dans la boucle d’événements et lève SynchronousOnlyOperation
+        data = [{'id': media_id, 'name': name} async for media_id, name in medias]
+        contenu = json.dumps(data)
+        await cache.aset(cle, contenu, DUREE_CACHE_DISPONIBLES)
+
+    response = HttpResponse(contenu, content_type='application/json')
+    response['Cache-Control'] = 'no-cache'  # Le navigateur revalide toujours via l’ETag
+    if request.method in ('GET', 'HEAD'):
+        response['ETag'] = etag
+    return response
+
+
+# Disponibilité lue dans l’index partagé (index_disponibilite), sans requête SQL :
+# ids des médias disponibles d’un type, ou disponibilité d’un seul média
+def disponibilite_media(request, type_media, media_id=None):
+    if type_media not in MODELES_MEDIA:
+        raise Http404("Type de média inconnu.")
+    if media_id is None:
+        return JsonResponse({'type_media': type_media, 'ids': index_disponibilite.ids_disponibles(type_media)})
+    return JsonResponse({
+        'type_media': type_media,
+        'id': media_id,
+        'disponible': index_disponibilite.est_disponible(type_media, media_id),
+    })
 
-    if type_media == 'CD':
-        medias = CD.objects.filter(disponible=True)
-    elif type_media == 'DVD':
-        medias = DVD.objects.filter(disponible=True)
-    elif type_media == 'LIVRE':
-        medias = Livre.objects.filter(disponible=True)
-    elif type_media == 'JEU':
-        medias = JeuDePlateau.objects.filter(disponible=True)
-    else:
-        medias = []
 
-    data = [{'id': media.id, 'name': media.name} for media in medias]
+# Paramètre GET « limite » d’une recherche, borné entre 1 et 100 ; valeur par défaut si
+# absent ou invalide (un LIMIT négatif renverrait toutes les lignes sous SQLite)
+def _lire_limite(request, defaut):
+    try:
+        limite = int(request.GET.get('limite', defaut))
+    except ValueError:
+        return defaut
+    return max(1, min(limite, 100))
+
+
+# Recherche plein texte dans le catalogue, renvoyée en JSON (q, type et limite optionnels)
+@lecture_sur_replica
+def recherche_media(request):
+    limite = _lire_limite(request, LIMITE_RECHERCHE)
+
+    medias = rechercher(request.GET.get('q', ''), request.GET.get('type', ''), limite=limite)
+    data = [
+        {
+            'type': media.type_media,
+            'id': media.media_id,
+            'name': media.name,
+            'createur': media.createur,
+            'disponible': media.disponible,
+        }
+        for media in medias
+    ]
     return JsonResponse(data, safe=False)
 
 
@@ -130,85 +225,209 @@ def supprimer_media(request, type_media, media_id):
     return render(request, 'bibliothecaire/media/confirmer_delete.html', {'media': media, 'type_media': type_media})
 
 
-# Création d’un emprunt avec règles métier multiples et validation
+# Création d’un emprunt : les règles métier et l’écriture sont dans services.emprunter
 def creer_emprunt(request):
     if request.method == 'POST':
         form = EmpruntForm(request.POST)
         if form.is_valid():
-            emprunt = form.save(commit=False)
-            membre = emprunt.membre
-            media = emprunt.media
-
-            # Interdiction d’emprunter un jeu de plateau
-            if isinstance(media, JeuDePlateau):
-                form.add_error(None, "Impossible d'emprunter un jeu de plateau.")
-                return render(request, 'bibliothecaire/emprunt/creer.html', {'form': form})
-
-            # Limite à 3 emprunts actifs
-            emprunts_actifs = Emprunt.objects.filter(membre=membre, date_retour__isnull=True).count()
-            if emprunts_actifs >= 3:
-                form.add_error(None, "Ce membre a déjà 3 emprunts en cours.")
-                return render(request, 'bibliothecaire/emprunt/creer.html', {'form': form})
-
-            # Vérifie si le membre a un emprunt en retard (>7 jours)
-            retards = Emprunt.objects.filter(
-                membre=membre,
-                date_retour__isnull=True,
-                date_emprunt__lt=timezone.now().date() - timezone.timedelta(days=7)
-            )
-            if retards.exists():
-                form.add_error(None, "Ce membre a un emprunt en retard, il ne peut pas emprunter.")
-                return render(request, 'bibliothecaire/emprunt/creer.html', {'form': form})
-
-            # Passage du média en indisponible si disponible
-            if media.disponible:
-                media.disponible = False
-                media.save()
-
-                emprunt.date_emprunt = timezone.now().date()
-                emprunt.save()
-                return redirect('bibliothecaire:liste_emprunts')
+            try:
+                emprunter(form.cleaned_data['membre'], form.cleaned_data['media'])
+            except EmpruntRefuse as refus:
+                form.add_error(None, str(refus))
             else:
-                form.add_error(None, "Ce média n'est pas disponible.")
+                return redirect('bibliothecaire:liste_emprunts')
     else:
         form = EmpruntForm()
     return render(request, 'bibliothecaire/emprunt/creer.html', {'form': form})
 
 
-# Liste de tous les emprunts (manque pagination)
+# Nombre d’emprunts affichés par page
+TAILLE_PAGE_EMPRUNTS = 50
+
+
+# Décode un curseur de pagination "AAAA-MM-JJ_id" (None si absent ou invalide)
+def _lire_curseur(valeur):
+    try:
+        date_str, pk = valeur.split('_')
+        return date.fromisoformat(date_str), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+# Emprunts d’une page de la liste : filtre par statut (actifs, rendus, retard) et
+# reprise strictement après le curseur, sans OFFSET, donc le coût d’une page ne
+# dépend pas de la taille de la table
+def emprunts_filtres(statut='', curseur=None):
+    # Emprunts en cours et en retard : table Emprunt seule. Rendus et tous : historique
+    # complet, emprunts archivés compris
+    modele = Emprunt if statut in ('actifs', 'retard') else EmpruntHistorique
+    emprunts = modele.objects.select_related('membre', *MediaQuerySet.liens_concrets('media'))
+
+    if statut == 'actifs':
+        emprunts = emprunts.actifs()
+    elif statut == 'rendus':
+        emprunts = emprunts.rendus()
+    elif statut == 'retard':
+        emprunts = emprunts.en_retard()
+
+    if curseur:
+        date_curseur, id_curseur = curseur
+        # Le filtre date_emprunt <= curseur, redondant, permet à SQLite de démarrer
+        # directement dans l’index au lieu de le parcourir depuis le début
+        emprunts = emprunts.filter(date_emprunt__lte=date_curseur).filter(
+            Q(date_emprunt__lt=date_curseur) | Q(date_emprunt=date_curseur, id__lt=id_curseur)
+        )
+    return emprunts.order_by('-date_emprunt', '-id')
+
+
+# Liste des emprunts, paginée par curseur sur (date_emprunt, id)
+@lecture_sur_replica
 def liste_emprunts(request):
-    emprunts = Emprunt.objects.all()
-    return render(request, 'bibliothecaire/emprunt/liste.html', {'emprunts': emprunts})
+    statut = request.GET.get('statut', '')
+    if statut not in ('actifs', 'rendus', 'retard'):
+        statut = ''
+    emprunts = emprunts_filtres(statut, _lire_curseur(request.GET.get('apres')))
+
+    # Une ligne de plus que la page pour savoir s’il existe une page suivante
+    page = list(emprunts[:TAILLE_PAGE_EMPRUNTS + 1])
+    curseur_suivant = None
+    if len(page) > TAILLE_PAGE_EMPRUNTS:
+        page = page[:TAILLE_PAGE_EMPRUNTS]
+        dernier = page[-1]
+        curseur_suivant = f"{dernier.date_emprunt.isoformat()}_{dernier.id}"
+
+    return render(request, 'bibliothecaire/emprunt/liste.html', {
+        'emprunts': page,
+        'statut': statut,
+        'curseur_suivant': curseur_suivant,
+    })
 
 
 # Enregistrement du retour d’un emprunt
 def rentrer_emprunt(request, id):
-    emprunt = get_object_or_404(Emprunt, id=id)
+    emprunt = get_object_or_404(Emprunt.objects.select_related('membre', 'media'), id=id)
 
     if emprunt.date_retour:
         # Empêche la saisie multiple de retour
         return render(request, 'bibliothecaire/emprunt/erreur.html', {'message': 'Cet emprunt a déjà été rentré.'})
 
     if request.method == 'POST':
-        form = EmpruntForm(request.POST, instance=emprunt)
+        form = RetourForm(request.POST, emprunt=emprunt)
         if form.is_valid():
-            with transaction.atomic():  # Assure atomicité des opérations
-                emprunt = form.save(commit=False)
+            try:
+                rentrer(emprunt, form.cleaned_data['date_retour'])
+            except EmpruntRefuse as refus:
+                # Retour enregistré entre-temps depuis un autre poste
+                return render(request, 'bibliothecaire/emprunt/erreur.html', {'message': str(refus)})
+            return redirect('bibliothecaire:liste_emprunts')
+    else:
+        form = RetourForm(emprunt=emprunt)
+
+    return render(request, 'bibliothecaire/emprunt/rentrer.html', {'form': form, 'emprunt': emprunt})
 
-                if not emprunt.date_retour:
-                    form.add_error('date_retour', "La date de retour doit être renseignée.")
-                    return render(request, 'bibliothecaire/emprunt/rentrer.html', {'form': form})
 
-                # Remise à disposition du média lié
-                emprunt.media.disponible = True
-                emprunt.media.save()
-                emprunt.save()
+# Réservation d’un média emprunté : le membre prend place à la fin de sa file d’attente
+def reserver_media(request, type_media, media_id):
+    modele = MODELES_MEDIA.get(type_media)
+    if modele is None or not issubclass(modele, Media):
+        raise Http404("Type de média inconnu ou non empruntable.")
+    media = get_object_or_404(modele, pk=media_id)
 
-            return redirect('liste_emprunts')
+    if request.method == 'POST':
+        form = ReservationForm(request.POST)
+        if form.is_valid():
+            try:
+                reserver(form.cleaned_data['membre'], media)
+            except ReservationRefusee as refus:
+                form.add_error(None, str(refus))
+            else:
+                return redirect('bibliothecaire:liste_reservations')
     else:
-        form = EmpruntForm(instance=emprunt)
+        form = ReservationForm()
+    return render(request, 'bibliothecaire/reservation/creer.html', {'form': form, 'media': media})
+
+
+# Nombre de réservations affichées
+TAILLE_LISTE_RESERVATIONS = 50
+
+
+# Réservations : médias mis de côté, par date d’expiration, puis files d’attente par média
+@lecture_sur_replica
+def liste_reservations(request):
+    reservations = Reservation.objects.select_related('membre', *MediaQuerySet.liens_concrets('media')).order_by(
+        '-statut', 'expire_le', 'media_id', 'rang')
+    return render(request, 'bibliothecaire/reservation/liste.html', {
+        'reservations': reservations[:TAILLE_LISTE_RESERVATIONS],
+        'taille_liste': TAILLE_LISTE_RESERVATIONS,
+    })
+
+
+# Prêt d’un média mis de côté au membre qui l’a réservé
+def preter_reservation(request, id):
+    reservation = get_object_or_404(
+        Reservation.objects.select_related('membre', *MediaQuerySet.liens_concrets('media')),
+        id=id, statut=Reservation.RETENUE)
+    if request.method == 'POST':
+        try:
+            emprunter(reservation.membre, reservation.media.concret())
+        except EmpruntRefuse as refus:
+            return render(request, 'bibliothecaire/emprunt/erreur.html', {'message': str(refus)})
+        return redirect('bibliothecaire:liste_emprunts')
+    return render(request, 'bibliothecaire/reservation/confirmer.html', {
+        'reservation': reservation, 'action': "Prêter", 'question': "Prêter ce média mis de côté",
+    })
+
+
+# Annulation d’une réservation ; un média mis de côté passe au suivant de la file
+def supprimer_reservation(request, id):
+    reservation = get_object_or_404(Reservation.objects.select_related('membre', 'media'), id=id)
+    if request.method == 'POST':
+        annuler_reservation(reservation)
+        return redirect('bibliothecaire:liste_reservations')
+    return render(request, 'bibliothecaire/reservation/confirmer.html', {
+        'reservation': reservation, 'action': "Annuler la réservation", 'question': "Annuler cette réservation",
+    })
+
 
-    return render(request, 'bibliothecaire/emprunt/rentrer.html', {'form': form})
+# Export en flux des emprunts, membres ou médias (CSV ou JSONL, gzip optionnel).
+# Filtres GET : du, au (dates d’emprunt), statut, type ; format ; gzip=1
+def exporter_donnees(request, quoi):
+    try:
+        morceaux, nom, type_mime = exporter(
+            quoi,
+            request.GET.get('format', 'csv'),
+            request.GET,
+            compresser=request.GET.get('gzip') == '1',
+        )
+    except FiltreInvalide as erreur:
+        return HttpResponseBadRequest(str(erreur))
+
+    # Les lignes sont lues et envoyées lot par lot pendant la réponse ; sous ASGI, par un
+    # itérateur asynchrone, qu’il ne met pas en mémoire avant l’envoi
+    if isinstance(request, ASGIRequest):
+        morceaux = en_flux_async(morceaux)
+    response = StreamingHttpResponse(morceaux, content_type=type_mime)
+    response['Content-Disposition'] = f'attachment; filename="{nom}"'
+    return response
+
+
+# Tableau de bord de la circulation (période « du » / « au », mois en cours par défaut),
+# lu dans les tables de statistiques agrégées uniquement
+def tableau_statistiques(request):
+    try:
+        du, au = statistiques.lire_periode(request.GET)
+    except statistiques.PeriodeInvalide as erreur:
+        return HttpResponseBadRequest(str(erreur))
+    return render(request, 'bibliothecaire/statistiques.html', statistiques.tableau_de_bord(du, au))
+
+
+# Mêmes indicateurs en JSON
+def statistiques_json(request):
+    try:
+        du, au = statistiques.lire_periode(request.GET)
+    except statistiques.PeriodeInvalide as erreur:
+        return JsonResponse({'erreur': str(erreur)}, status=400)
+    return JsonResponse(statistiques.tableau_de_bord(du, au))
 
 
 # Vue accueil simple
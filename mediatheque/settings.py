@@ -1,6 +1,6 @@
 from pathlib import Path
 from dotenv import load_dotenv
-#import os
+import os
 
 #load_dotenv()  # Charge les variables du fichier .env
 
@@ -39,6 +39,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bibliothecaire.replica.ReplicaMiddleware',
+    'bibliothecaire.instrumentation.InstrumentationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,13 +67,114 @@ WSGI_APPLICATION = 'mediatheque.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Pragmas appliqués à chaque nouvelle connexion SQLite. Chacun peut être remplacé par
+# une variable d’environnement SQLITE_<NOM> (ex. SQLITE_MMAP_SIZE=0).
+#  - WAL : les lectures ne bloquent plus l’écriture (et inversement) entre workers ;
+#  - synchronous=NORMAL : sûr en WAL, un fsync par checkpoint au lieu d’un par commit ;
+#  - mmap_size / cache_size : lectures servies par la mémoire (256 Mo mappés, ~64 Mo de cache) ;
+#  - busy_timeout : un worker attend le verrou d’écriture jusqu’à 5 s au lieu d’échouer
+#    aussitôt avec « database is locked ».
+SQLITE_PRAGMAS = {
+    nom: os.environ.get(f'SQLITE_{nom.upper()}', defaut)
+    for nom, defaut in {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'cache_size': -64000,
+        'busy_timeout': 5000,
+        'foreign_keys': 'ON',
+    }.items()
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',  # ou chemin vers ton fichier SQLite
+        # DJANGO_DB_NAME : autre fichier, par exemple une base de mesure (seed_benchmark)
+        'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {nom}={valeur}' for nom, valeur in SQLITE_PRAGMAS.items()),
+            # Les transactions prennent le verrou d’écriture dès BEGIN : une transaction
+            # ne peut plus échouer en cours de route en passant de lecture à écriture
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Connexions persistantes (secondes), vérifiées avant réutilisation
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Réplique en lecture du catalogue et des listes (bibliothecaire/replica.py), copiée
+# depuis la base principale par « manage.py repliquer_base [--intervalle 10] ».
+# Tant que le fichier n’existe pas, toutes les lectures restent sur la base principale.
+BASE_REPLICA = 'replica'
+DATABASES[BASE_REPLICA] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('DJANGO_DB_REPLICA', BASE_DIR / 'db_replica.sqlite3'),
+    'OPTIONS': {
+        **DATABASES['default']['OPTIONS'],
+        'init_command': DATABASES['default']['OPTIONS']['init_command'] + ';PRAGMA query_only=ON',
+    },
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['bibliothecaire.replica.RouteurReplica']
+
+# Après une écriture, la session lit la base principale pendant ce délai (secondes) ;
+# il doit dépasser l’intervalle de réplication
+DELAI_LECTURE_APRES_ECRITURE = 30
+
+# Dossier de l’index de disponibilité partagé par les workers (bibliothecaire/index_disponibilite.py).
+# Par défaut, à côté de la base SQLite : « db.sqlite3-disponibilite/ ».
+INDEX_DISPONIBILITE_DIR = os.environ.get('DJANGO_INDEX_DISPONIBILITE')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Le cache mémoire local suffit en développement ; avec plusieurs workers, utiliser un
+# cache partagé pour que les versions de disponibilité (et donc les pages du catalogue
+# mises en cache) soient communes : DJANGO_CACHE_DIR choisit un cache fichier partagé
+# par les processus d’une même machine, sinon Redis ou Memcached.
+if os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mediatheque',
+        }
+    }
+
+
+# E-mails (rappels de retard envoyés par « manage.py scan_overdue »)
+# https://docs.djangoproject.com/en/5.2/topics/email/
+# Par défaut les messages sont affichés dans la console ; pour les écrire dans des
+# fichiers : EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# et EMAIL_FILE_PATH = BASE_DIR / 'mails'
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'mediatheque@example.com'
+
+
+# Journalisation : une ligne par requête (requêtes SQL, temps SQL, durée de la vue)
+# au niveau INFO avec DJANGO_INSTRUMENTATION=INFO ; les dépassements de budget de
+# requêtes (WARNING) sont toujours journalisés.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bibliothecaire.instrumentation': {
+            'handlers': ['console'],
+            'level': os.environ.get('DJANGO_INSTRUMENTATION', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
 
 
 # Password validation
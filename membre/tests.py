@@ -4,11 +4,13 @@ from bibliothecaire.models import CD, DVD, Livre, JeuDePlateau
 
 from django.test import TestCase
 from django.urls import reverse
+from django.core.cache import cache
 from bibliothecaire.models import CD, DVD, Livre, JeuDePlateau
 
 class MembreViewsTests(TestCase):
 
     def setUp(self):
+        cache.clear()  # Pages du catalogue mises en cache par un test précédent
         # Création des objets médias
         self.cd = CD.objects.create(name="CD Test", artiste="Artiste Test", disponible=True)
         self.dvd = DVD.objects.create(name="DVD Test", realisateur="Réalisateur Test", disponible=True)
@@ -21,14 +23,60 @@ class MembreViewsTests(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
-        # Vérifie que les objets sont dans le contexte
-        self.assertIn(self.cd, response.context['cds'])
-        self.assertIn(self.dvd, response.context['dvds'])
-        self.assertIn(self.livre, response.context['livres'])
-        self.assertIn(self.jeu, response.context['jeux'])
+        # Vérifie que les objets sont dans le contexte (une ligne de catalogue par média)
+        entrees = {(m.type_media, m.media_id) for m in response.context['medias']}
+        self.assertIn(('CD', self.cd.id), entrees)
+        self.assertIn(('DVD', self.dvd.id), entrees)
+        self.assertIn(('LIVRE', self.livre.id), entrees)
+        self.assertIn(('JEU', self.jeu.id), entrees)
 
         # Vérifie que les noms apparaissent dans le contenu HTML
         self.assertContains(response, self.cd.name)
         self.assertContains(response, self.dvd.name)
         self.assertContains(response, self.livre.name)
         self.assertContains(response, self.jeu.name)
+
+    def test_liste_media_filtre_par_type(self):
+        # Une requête pour la page, une pour le comptage de la pagination
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('membre:liste_media'), {'type': 'DVD'})
+        self.assertContains(response, self.dvd.name)
+        self.assertNotContains(response, self.cd.name)
+
+from bibliothecaire.instrumentation import BudgetRequetesMixin
+
+class MembreBudgetRequetesTests(BudgetRequetesMixin, TestCase):
+
+    def test_catalogue_dans_son_budget(self):
+        cache.clear()
+        for i in range(10):
+            CD.objects.create(name=f"CD {i}", artiste="Artiste", disponible=True)
+        self.assertBudgetRequetes(self.client.get(reverse('membre:liste_media')))
+        self.assertBudgetRequetes(self.client.get(reverse('membre:liste_media'), {'q': 'cd'}))
+
+from bibliothecaire.models import Recommandation
+
+class FicheMediaTests(BudgetRequetesMixin, TestCase):
+
+    def setUp(self):
+        self.cd = CD.objects.create(name="Kind of Blue", artiste="Miles Davis")
+        self.livre = Livre.objects.create(name="Sur la route", auteur="Kerouac", disponible=False)
+        Recommandation.objects.create(media=self.cd, rang=1, voisin=self.livre, communs=3)
+
+    def test_fiche_et_recommandations(self):
+        response = self.client.get(reverse('membre:fiche_media', args=[self.cd.pk]))
+        self.assertContains(response, "Miles Davis")
+        self.assertContains(response, "Sur la route</a> - Kerouac")
+        self.assertContains(response, "(3 membres)")
+        self.assertBudgetRequetes(response)
+
+        response = self.client.get(reverse('membre:fiche_media', args=[self.livre.pk]))
+        self.assertContains(response, "Pas encore de recommandation")
+
+    def test_media_inconnu(self):
+        self.assertEqual(self.client.get(reverse('membre:fiche_media', args=[999])).status_code, 404)
+
+    def test_lien_depuis_le_catalogue(self):
+        cache.clear()
+        response = self.client.get(reverse('membre:liste_media'))
+        self.assertContains(response, reverse('membre:fiche_media', args=[self.cd.pk]))
@@ -1,10 +1,12 @@
 from django.urls import path
 from . import views
 from .views import liste_media
+from bibliothecaire.instrumentation import budget
 
 app_name = 'membre'
 
 urlpatterns = [
-path('', liste_media, name='liste_media'),
+budget(path('', liste_media, name='liste_media'), requetes=3),  # Comptage, page (relue si hors bornes)
+budget(path('media/<int:media_id>/', views.fiche_media, name='fiche_media'), requetes=2),  # Média, recommandations
   #  path('medias/', views.liste_media, name='liste_media'),
 ]
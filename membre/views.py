@@ -1,17 +1,26 @@
+from django.http import Http404
 from django.shortcuts import render
-from bibliothecaire.models import CD, DVD, Livre, JeuDePlateau
+from bibliothecaire.cache_pages import page_catalogue_en_cache
+from bibliothecaire.catalogue import apage_catalogue
+from bibliothecaire.models import Media
+from bibliothecaire.recommandations import voisins
+from bibliothecaire.replica import lecture_sur_replica
 
 
-def liste_media(request):
-    cds = CD.objects.all()
-    dvds = DVD.objects.all()
-    livres = Livre.objects.all()
-    jeux = JeuDePlateau.objects.all()
+# Catalogue public : une requête paginée et triable sur le catalogue dénormalisé
+# (vue asynchrone, servie nativement sous ASGI). Page sans formulaire POST, identique
+# pour tous : mise en cache entière, par version du catalogue.
+@lecture_sur_replica
+@page_catalogue_en_cache
+async def liste_media(request):
+    return render(request, 'membre/liste_media.html', await apage_catalogue(request.GET))
 
-    context = {
-        'cds': cds,
-        'dvds': dvds,
-        'livres': livres,
-        'jeux': jeux,
-    }
-    return render(request, 'membre/liste_media.html', context)
+
+# Fiche d’un média (CD, DVD, Livre) et ses recommandations « ils ont aussi emprunté » :
+# le média avec son sous-type, puis ses voisins lus sur l’index (media, rang)
+@lecture_sur_replica
+def fiche_media(request, media_id):
+    media = Media.objects.concrets().filter(pk=media_id).first()
+    if media is None or type(media) is Media:
+        raise Http404("Média introuvable.")
+    return render(request, 'membre/fiche_media.html', {'media': media, 'recommandations': voisins(media_id)})